@@ -1,47 +1,195 @@
 """
 api.py — MailMate AI FastAPI backend
 Run: uvicorn api:app --reload --port 8000
+
+Answers questions about the synced mail: /query, /query/batch and
+/query/stream, with /health, /ready, /stats, /sync and /metrics alongside.
+LLM_PROVIDER=fake (with EMBEDDINGS_PROVIDER=fake) runs it all offline.
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from email.utils import parsedate_to_datetime
+import functools
+import json
 import os
+import threading
+import time
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from langchain_chroma import Chroma
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_openai import ChatOpenAI
-from langchain_cohere import CohereEmbeddings
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from context_packer import doc_timestamp, group_by_email, pack_context
+import email_splitter
+import lexical_index
+import metadata_index
+import metrics
+from metrics import QUERIES_TOTAL, QUERY_STAGE_SECONDS
+from query_cache import AnswerCache, QueryEmbeddingCache
+from sync_worker import SyncWorker
+from vector_store import (
+    CHROMA_DIR, active_mtime, data_version, get_embeddings, open_collection, read_active, since_filter,
+)
 
 load_dotenv()
 
 GITHUB_TOKEN   = os.getenv("GITHUB_TOKEN")
-COHERE_API_KEY = os.getenv("COHERE_API_KEY")
-CHROMA_DIR     = "./chroma_db"
+LLM_PROVIDER   = os.getenv("LLM_PROVIDER", "github")  # "github" or "fake"
+STARTUP_MODE   = os.getenv("STARTUP_MODE", "background")  # "background" warm-up task or "blocking"
+ACTIVE_CHECK_INTERVAL = 1.0  # seconds between checks for a reindex switch
+SEARCH_WORKERS = 8  # Chroma searches in flight; separate from the default pool so /health never queues behind them
+QUERY_EMBED_CACHE_SIZE  = 1024
+ANSWER_CACHE_SIZE       = int(os.getenv("ANSWER_CACHE_SIZE", "256"))  # 0 disables the answer cache
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0")) or None  # e.g. 0.97; off by default
+LEXICAL_CANDIDATES      = 50  # BM25 hits looked up before the date filter and fusion
+MAX_BATCH_QUERIES       = 100
+BATCH_LLM_CONCURRENCY   = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+EMBED_BATCH_SIZE        = 96  # Cohere embed v3 maximum texts per request
 vectorstore  = None
+_chain       = None
+active       = None
+_active_seen = None
+_checked_at  = 0.0
+_data_seen   = 0
+_reload_lock = threading.Lock()
+_refreshing  = None  # the index check in flight on _refresher
+_warmup      = None  # the warm-up task
+startup      = {"ready": False, "error": None, "seconds": None}
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+_refresher   = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refresh")
+query_embeddings = QueryEmbeddingCache(QUERY_EMBED_CACHE_SIZE)
+answers          = AnswerCache(ANSWER_CACHE_SIZE, similarity=ANSWER_CACHE_SIMILARITY)
+
+_caches = {"query_embeddings": query_embeddings, "answers": answers}
+metrics.Callback("mailmate_cache_lookups_total", "Query cache lookups by cache and result.", lambda: [
+    ({"cache": name, "result": result}, cache.stats()[field])
+    for name, cache in _caches.items() for result, field in (("hit", "hits"), ("miss", "misses"))
+], kind="counter")
+metrics.Callback("mailmate_cache_entries", "Entries held by each query cache.", lambda: [
+    ({"cache": name}, cache.stats()["entries"]) for name, cache in _caches.items()
+])
 
 
 # ── Lifespan ───────────────────────────────────────────────────────────────────
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global vectorstore
-    if not GITHUB_TOKEN:
+    """Warm up in the background (/ready is 503 and queries wait until it's done;
+    STARTUP_MODE=blocking warms up before serving) and start the sync worker."""
+    global _warmup
+    if LLM_PROVIDER != "fake" and not GITHUB_TOKEN:
         raise RuntimeError("GITHUB_TOKEN not set.")
-    embeddings = CohereEmbeddings(
-        model="embed-english-v3.0",
-        cohere_api_key=COHERE_API_KEY,
-    )
-    vectorstore = Chroma(persist_directory=CHROMA_DIR, embedding_function=embeddings)
-    print(f"Vector store loaded — {vectorstore._collection.count()} vectors.")
+    _warmup = asyncio.create_task(run_warm_up())
+    if STARTUP_MODE == "blocking":
+        await _warmup
+    scheduler = None
+    if sync_worker.interval:
+        print(f"Background sync every {sync_worker.interval:g}s.")
+        scheduler = asyncio.create_task(sync_worker.run_forever())
     yield
+    if scheduler:
+        scheduler.cancel()
+    sync_worker.shutdown()
+
+
+def warm_up():
+    """Everything the first query would otherwise wait for: the LangChain, Chroma
+    and provider imports, the chain, the collection and its indexes, and
+    Chroma's HNSW indexes (loaded into memory by a one-result search), and the
+    tokenizer context packing counts with."""
+    get_chain()
+    email_splitter._get_encoder()
+    store   = current_vectorstore()
+    count   = store.count()
+    indexed = lexical_index.for_collection(store.name).count()
+    print(f"Vector store loaded — {count} vectors, {indexed} chunks in the BM25 index.")
+    if count and not indexed:
+        print("  BM25 index is empty — run `python lexical_index.py` to build it.")
+    if count and not metadata_index.get_index().is_complete():
+        print("  Metadata index is incomplete — the next sync rebuilds it (or run `python metadata_index.py`).")
+    if count:
+        sample = store.get(include=["embeddings"], limit=1)
+        store.similarity_search_by_vector(sample["embeddings"][0], k=1)
+
+
+async def run_warm_up():
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(warm_up)
+    except Exception as e:
+        startup["error"] = f"{type(e).__name__}: {e}"
+        print(f"Warm-up failed — {startup['error']}")
+    startup.update(ready=startup["error"] is None, seconds=round(time.perf_counter() - start, 3))
+    print(f"Warm-up done in {startup['seconds']:.2f}s.")
+
+
+async def warmed_up():
+    """Wait for the warm-up, so early requests don't build the store themselves
+    on the event loop. Returns at once after it."""
+    if _warmup is not None:
+        await asyncio.shield(_warmup)
+
+
+def refresh_vectorstore():
+    """Re-read the active pointer and data version: open the new collection after a
+    reindex.py switch, pick up months a sync started. Blocking — runs on the
+    refresh thread, in warm-up or on the sync thread, never on the event loop.
+    The new store is swapped in only once it is open; requests already running
+    finish on the old one."""
+    global vectorstore, active, _active_seen, _data_seen
+    with _reload_lock:
+        version = data_version()
+        seen    = active_mtime()
+        if vectorstore is None or seen != _active_seen:
+            pointer    = read_active()
+            embeddings = get_embeddings(pointer["embed_model"], pointer.get("provider"), max_retries=3)
+            store      = open_collection(embeddings, pointer["collection"])
+            vectorstore, active, _active_seen = store, pointer, seen
+            print(f"Serving collection {pointer['collection']} "
+                  f"({pointer['embed_model']}, generation {pointer.get('generation', 0)}).")
+        elif version != _data_seen:
+            vectorstore.refresh()  # a sync may have started a new month
+        _data_seen = version
+    return vectorstore
+
+
+def _refresh_in_background():
+    try:
+        refresh_vectorstore()
+    except Exception as e:
+        print(f"Index refresh failed — {type(e).__name__}: {e}")
+
+
+def current_vectorstore():
+    """The live collection, without blocking: every ACTIVE_CHECK_INTERVAL a
+    refresh_vectorstore() is started on the refresh thread, and requests keep
+    using the current store until it has swapped in a new one — no restart.
+    Also binds the query caches: question embeddings to the embedding model,
+    answers to the index version, so a sync only empties the answers."""
+    global _checked_at, _refreshing
+    store = vectorstore if vectorstore is not None else refresh_vectorstore()  # first open: warm-up thread
+    now   = time.monotonic()
+    if now - _checked_at >= ACTIVE_CHECK_INTERVAL and (_refreshing is None or _refreshing.done()):
+        _checked_at = now
+        _refreshing = _refresher.submit(_refresh_in_background)
+    query_embeddings.bind((active.get("provider"), active["embed_model"]))
+    answers.bind((active.get("generation", 0), _data_seen))
+    return store
+
+
+def recheck_now():
+    """Re-read the active pointer and data version right away — called on the sync
+    thread when the in-process sync changed the index, so the next request
+    sees the new mail."""
+    if vectorstore is not None:
+        refresh_vectorstore()
+
+
+sync_worker = SyncWorker(on_change=recheck_now)
 
 
 # ── App ────────────────────────────────────────────────────────────────────────
@@ -59,11 +207,19 @@ app.add_middleware(
 class QueryRequest(BaseModel):
     question: str
     k: Optional[int] = 5
+    debug: bool = False  # return this request's timings / token usage
 
 class QueryResponse(BaseModel):
     question: str
     answer: str
     sources: List[dict]
+    debug: Optional[dict] = None
+
+class BatchQueryResult(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    sources: List[dict] = []
+    error: Optional[str] = None
 
 
 # ── Intent detection ───────────────────────────────────────────────────────────
@@ -101,39 +257,159 @@ def get_cutoff_timestamp(intent: str) -> Optional[int]:
     return None
 
 
-# ── Smart retrieval ────────────────────────────────────────────────────────────
+# ── Structured answers ─────────────────────────────────────────────────────────
+
+WINDOW_PHRASES = {
+    "today":     "today",
+    "yesterday": "yesterday",
+    "week":      "in the last 7 days",
+    "month":     "in the last 30 days",
+}
+
+
+def structured_answer(question: str, intent: str, k: int):
+    """{answer, sources} from the metadata index when the question only asks to count,
+    list or rank emails by date / sender; None when it needs the emails' content."""
+    spec = metadata_index.parse_question(question)
+    if not spec:
+        return None
+    index = metadata_index.get_index()
+    if not index.is_complete():
+        return None  # a partial index would give wrong counts
+
+    since  = get_cutoff_timestamp(intent) if intent in WINDOW_PHRASES else None
+    until  = get_cutoff_timestamp("today") if intent == "yesterday" else None
+    window = WINDOW_PHRASES.get(intent, "")
+    sender = f" from {spec['sender']}" if spec["sender"] else ""
+
+    if spec["kind"] == "top_senders":
+        top = index.top_senders(since, until, limit=spec["limit"] or metadata_index.TOP_SENDERS)
+        if not top:
+            return {"answer": f"No emails {window or 'yet'}.", "sources": []}
+        lines = [f"{i}. {name} — {n} email{'s' * (n != 1)}" for i, (name, n) in enumerate(top, 1)]
+        return {"answer": f"Top senders {window or 'overall'}:\n" + "\n".join(lines), "sources": []}
+
+    total  = index.count(since, until, spec["sender"])
+    limit  = 5 if spec["kind"] == "count" else spec["limit"] or (metadata_index.LIST_LIMIT if window else k)
+    emails = index.latest(since, until, spec["sender"], limit=limit)
+    if spec["kind"] == "count":
+        answer = f"You received {total:,} email{'s' * (total != 1)}{sender} {window or 'in total'}."
+    elif not total:
+        answer = f"No emails{sender} {window or 'yet'}."
+    else:
+        header = (f"{total:,} email{'s' * (total != 1)}{sender} {window}, newest first:" if window
+                  else f"Your latest {len(emails)} email{'s' * (len(emails) != 1)}{sender}:")
+        lines  = [f"{i}. {e['subject']} — {e['from']} ({e['date']})" for i, e in enumerate(emails, 1)]
+        more   = f"\n... and {total - len(emails):,} more." if window and total > len(emails) else ""
+        answer = "\n".join([header, *lines]) + more
+    sources = [
+        {"subject": e["subject"], "from": e["from"], "date": e["date"], "snippet": "", "occurrences": 1}
+        for e in emails[:5]
+    ]
+    return {"answer": answer, "sources": sources}
 
-def doc_timestamp(doc) -> int:
-    ts = doc.metadata.get("timestamp", 0)
-    if ts and ts > 0:
-        return ts
-    try:
-        return int(parsedate_to_datetime(doc.metadata.get("date", "")).timestamp())
-    except Exception:
-        return 0
 
+# ── Smart retrieval ────────────────────────────────────────────────────────────
 
-def retrieve_docs(question: str, intent: str, k: int):
+def stage(name: str):
+    """Times a /query stage into mailmate_query_stage_seconds and the request's breakdown."""
+    return metrics.timed(QUERY_STAGE_SECONDS, name)
+
+
+async def run_search(fn, *args, **kwargs):
+    """Run a blocking Chroma call on the search pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_search_pool, functools.partial(fn, *args, **kwargs))
+
+
+async def embed_question(question: str):
+    vector = query_embeddings.get(question)
+    if vector is None:
+        with stage("embed"):
+            vector = await current_vectorstore().embeddings.aembed_query(question)
+        query_embeddings.put(question, vector)
+    return vector
+
+
+def doc_key(doc):
+    return doc.metadata.get("id"), doc.page_content
+
+
+def lexical_docs(store, question: str, k: int, since=None, exact=False):
+    """Top-k BM25 chunks as Documents, best first, only mail from `since` on if given.
+    exact: only chunks containing an identifier the question names."""
+    from langchain_core.documents import Document
+
+    index = lexical_index.for_collection(store.name)
+    ids   = (index.search_exact if exact else index.search)(question, LEXICAL_CANDIDATES)
+    if not ids:
+        return []
+    where = since_filter(since) if since else None
+    found = store.get(ids=ids, where=where, include=["documents", "metadatas"])
+    by_id = {
+        i: Document(page_content=text, metadata=metadata)
+        for i, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+    }
+    return [by_id[i] for i in ids if i in by_id][:k]
+
+
+def fuse(rankings, k: int):
+    """Reciprocal rank fusion of Document rankings; top k."""
+    docs = {doc_key(d): d for ranking in rankings for d in ranking}
+    keys = lexical_index.rrf([[doc_key(d) for d in ranking] for ranking in rankings])
+    return [docs[key] for key in keys[:k]]
+
+
+async def embed_questions(questions: List[str]):
+    """Fill the query-embedding cache for several questions with as few provider
+    calls as possible (one per EMBED_BATCH_SIZE)."""
+    missing = list(dict.fromkeys(q for q in questions if query_embeddings.get(q) is None))
+    embeddings = current_vectorstore().embeddings
+    for i in range(0, len(missing), EMBED_BATCH_SIZE):
+        part = missing[i : i + EMBED_BATCH_SIZE]
+        with stage("embed"):
+            vectors = await embeddings.aembed(part, input_type="search_query")
+        for question, vector in zip(part, vectors):
+            query_embeddings.put(question, vector)
+
+
+async def retrieve_docs(question: str, intent: str, k: int):
+    """Vector and BM25 results fused by reciprocal rank, searching only the months
+    the intent's window covers; BM25 alone when the identifier a question names is
+    indexed."""
+    store  = current_vectorstore()
     cutoff = get_cutoff_timestamp(intent)
 
-    if cutoff:
-        # Try filtered retrieval first
-        try:
-            docs = vectorstore.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": k, "filter": {"timestamp": {"$gte": cutoff}}},
-            ).invoke(question)
-            if docs:
-                docs.sort(key=doc_timestamp, reverse=True)
-                return docs
-        except Exception:
-            pass
-
-    # Fallback: plain similarity, sort by date
-    docs = vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": k},
-    ).invoke(question)
+    exact, lexical = [], []
+    try:
+        with stage("lexical"):
+            if lexical_index.is_exact_query(question):
+                exact = await run_search(lexical_docs, store, question, k, cutoff, exact=True)
+            if not exact:
+                lexical = await run_search(lexical_docs, store, question, k, cutoff)
+    except Exception:
+        pass
+
+    docs = []
+    if exact:
+        # The identifier itself is in the index: no need for an embedding
+        docs = exact
+    else:
+        # Embed once without blocking the loop; both searches reuse the vector
+        vector = await embed_question(question)
+
+        if cutoff:
+            # Try the window's months first
+            try:
+                with stage("search"):
+                    docs = await run_search(store.similarity_search_by_vector, vector, k=k, since=cutoff)
+            except Exception:
+                pass
+        if not docs:
+            # Fallback: plain similarity over every month
+            with stage("fallback_search" if cutoff else "search"):
+                docs = await run_search(store.similarity_search_by_vector, vector, k=k)
+        docs = fuse([docs, lexical], k)
 
     if intent in ("today", "yesterday", "week", "month", "recent"):
         docs.sort(key=doc_timestamp, reverse=True)
@@ -165,56 +441,127 @@ Rules:
 Answer:"""
 
 
-def build_answer(docs, question: str) -> str:
-    # Sort newest first before passing to LLM
-    docs_sorted = sorted(docs, key=doc_timestamp, reverse=True)
-    context     = "\n\n---\n\n".join(d.page_content for d in docs_sorted)
-
-    now            = datetime.now()
-    yesterday      = now - timedelta(days=1)
-    today_str      = now.strftime("%A, %d %B %Y")
-    yesterday_str  = yesterday.strftime("%A, %d %B %Y")
-    today_short    = now.strftime("%d %b %Y")
-    yesterday_short= yesterday.strftime("%d %b %Y")
-
-    llm    = ChatOpenAI(
-        model="gpt-4o-mini",
-        openai_api_base="https://models.inference.ai.azure.com",
-        openai_api_key=GITHUB_TOKEN,
-        temperature=0, max_tokens=1000,
-    )
-    prompt = ChatPromptTemplate.from_template(PROMPT)
-    chain  = (
+def get_chain():
+    """prompt | llm | parser, built once per process so the chat client and its
+    HTTP connection pool are shared by every request. Token usage is counted
+    by metrics.token_usage_handler()."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+
+    global _chain
+    if _chain is None:
+        usage = [metrics.token_usage_handler()]
+        if LLM_PROVIDER == "fake":
+            from fakes import FakeChatModel
+            llm = FakeChatModel(
+                latency=float(os.getenv("FAKE_LLM_LATENCY", "0")),
+                token_latency=float(os.getenv("FAKE_LLM_TOKEN_LATENCY", "0")),
+                callbacks=usage,
+            )
+        else:
+            from langchain_openai import ChatOpenAI
+            llm = ChatOpenAI(
+                model="gpt-4o-mini",
+                openai_api_base="https://models.inference.ai.azure.com",
+                openai_api_key=GITHUB_TOKEN,
+                temperature=0, max_tokens=1000,
+                stream_usage=True, callbacks=usage,
+            )
+        _chain = ChatPromptTemplate.from_template(PROMPT) | llm | StrOutputParser()
+    return _chain
+
+
+async def prompt_inputs(docs, question: str) -> dict:
+    # One entry per email, newest first, within CONTEXT_TOKEN_BUDGET; token
+    # counting is CPU-bound, so it runs on the search pool
+    with stage("prompt"):
+        context, packed = await run_search(pack_context, docs)
+    metrics.note("context", packed)
+    now        = datetime.now()
+    yesterday  = now - timedelta(days=1)
+    return {
+        "context":         context,
+        "question":        question,
+        "today":           now.strftime("%A, %d %B %Y"),
+        "yesterday":       yesterday.strftime("%A, %d %B %Y"),
+        "today_short":     now.strftime("%d %b %Y"),
+        "yesterday_short": yesterday.strftime("%d %b %Y"),
+    }
+
+
+async def build_answer(docs, question: str) -> str:
+    inputs = await prompt_inputs(docs, question)
+    with stage("llm"):
+        return await get_chain().ainvoke(inputs)
+
+
+def to_sources(docs) -> List[dict]:
+    return [
         {
-            "context":          lambda _: context,
-            "question":         RunnablePassthrough(),
-            "today":            lambda _: today_str,
-            "yesterday":        lambda _: yesterday_str,
-            "today_short":      lambda _: today_short,
-            "yesterday_short":  lambda _: yesterday_short,
+            "subject": d.metadata.get("subject", "Unknown"),
+            "from":    d.metadata.get("from", "Unknown"),
+            "date":    d.metadata.get("date", "Unknown"),
+            "snippet": d.page_content[:200] + "...",
+            "occurrences": d.metadata.get("occurrence_count", 1),
         }
-        | prompt | llm | StrOutputParser()
-    )
-    return chain.invoke(question)
+        for d, _ in group_by_email(docs)[:5]
+    ]
 
 
 # ── Routes ─────────────────────────────────────────────────────────────────────
 
 @app.get("/health")
 async def health():
-    count = vectorstore._collection.count() if vectorstore else 0
-    return {"status": "healthy", "vector_count": count}
+    """Answers at once, also while warming up: status "starting" until warm_up()
+    is done, then "healthy" — or 503 with status "error" if it failed."""
+    if startup["error"]:
+        return JSONResponse({"status": "error", "ready": False, "error": startup["error"]}, status_code=503)
+    if not startup["ready"]:
+        return {"status": "starting", "ready": False, "error": None}
+    count = await asyncio.to_thread(current_vectorstore().count)
+    return {"status": "healthy", "ready": True, "vector_count": count, "warmup_seconds": startup["seconds"]}
+
+
+@app.get("/ready")
+async def ready():
+    """200 once warmed up, 503 before — for readiness probes and load balancers."""
+    if not startup["ready"]:
+        raise HTTPException(503, startup["error"] or "Warming up.")
+    return {"ready": True, "warmup_seconds": startup["seconds"]}
 
 
 @app.get("/stats")
 async def stats():
+    await warmed_up()
     if not vectorstore:
         raise HTTPException(500, "Vector store not initialised.")
-    return {"total_vectors": vectorstore._collection.count(), "database_path": CHROMA_DIR}
-
-
-@app.post("/query", response_model=QueryResponse)
-async def query_emails(request: QueryRequest):
+    store = current_vectorstore()
+    return {
+        "total_vectors": await asyncio.to_thread(store.count),
+        "partitions":    len(store.partitions()),
+        "database_path": CHROMA_DIR,
+        "collection":    active["collection"],
+        "embed_model":   active["embed_model"],
+        "generation":    active.get("generation", 0),
+        "data_version":  _data_seen,
+        "cache": {
+            "query_embeddings": query_embeddings.stats(),
+            "answers":          answers.stats(),
+        },
+        "sync": sync_worker.status(),
+    }
+
+
+@app.post("/sync", status_code=202)
+async def start_sync():
+    """Start an incremental sync in the background; "started" is false when one is
+    already running. Poll /stats for its progress."""
+    started = sync_worker.trigger()
+    return {"started": started, **sync_worker.status()}
+
+
+def parse_query(request: QueryRequest):
+    """(question, intent, k) for a request; raises HTTPException when it can't be served."""
     if not vectorstore:
         raise HTTPException(500, "Vector store not initialised.")
 
@@ -222,25 +569,206 @@ async def query_emails(request: QueryRequest):
     if not question:
         raise HTTPException(400, "Question cannot be empty.")
 
-    intent = detect_intent(question)
+    with stage("intent"):
+        intent = detect_intent(question)
     k      = 20 if intent in ("count", "today", "yesterday", "week", "month") else request.k
+    current_vectorstore()  # binds the caches to the index version the last check saw
+    return question, intent, k
+
+
+async def structured(question: str, intent: str, k: int):
+    with stage("metadata"):
+        return await run_search(structured_answer, question, intent, k)
+
+
+async def lookup_answer(question: str, key):
+    """(cached {answer, sources} or None, question vector if one was computed)."""
+    with stage("cache"):
+        cached = answers.get(key)
+    if cached or not answers.similarity:
+        return cached, None
+    vector = await embed_question(question)
+    with stage("cache"):
+        return answers.get_similar(key, vector), vector
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
+
+@app.post("/query", response_model=QueryResponse, response_model_exclude_none=True)
+async def query_emails(request: QueryRequest):
+    """With "debug": true the response also carries the request's stage timings,
+    token usage and context packing."""
+    await warmed_up()
+    breakdown = metrics.start_request()
+    with stage("total"):
+        question, intent, k = parse_query(request)
+        path, result = await answer_query(question, intent, k)
+    QUERIES_TOTAL.inc(endpoint="query", path=path)
+    return QueryResponse(question=question, **result, debug=breakdown if request.debug else None)
+
+
+async def answer_query(question: str, intent: str, k: int):
+    """(how it was answered: structured / cached / rag, {answer, sources})."""
+    key = answers.key(question, intent, k)
     try:
-        docs    = retrieve_docs(question, intent, k)
-        answer  = build_answer(docs, question)
-        sources = [
-            {
-                "subject": d.metadata.get("subject", "Unknown"),
-                "from":    d.metadata.get("from", "Unknown"),
-                "date":    d.metadata.get("date", "Unknown"),
-                "snippet": d.page_content[:200] + "...",
-            }
-            for d in docs[:5]
-        ]
-        return QueryResponse(question=question, answer=answer, sources=sources)
+        direct = await structured(question, intent, k)
+        if direct:
+            return "structured", direct
+        cached, vector = await lookup_answer(question, key)
+        if cached:
+            return "cached", cached
+        docs   = await retrieve_docs(question, intent, k)
+        answer = await build_answer(docs, question)
     except Exception as e:
+        QUERIES_TOTAL.inc(endpoint="query", path="error")
         raise HTTPException(500, str(e))
 
+    result = {"answer": answer, "sources": to_sources(docs)}
+    answers.put(key, result, vector)
+    return "rag", result
+
+
+@app.post("/query/batch", response_model=List[BatchQueryResult])
+async def query_emails_batch(requests: List[QueryRequest]):
+    """One embedding call for every question, searches run together and at most
+    BATCH_LLM_CONCURRENCY LLM calls in flight. Results keep the input order; a
+    failing item carries an error instead of failing the batch."""
+    if len(requests) > MAX_BATCH_QUERIES:
+        raise HTTPException(400, f"At most {MAX_BATCH_QUERIES} questions per batch.")
+    await warmed_up()
+    results = [{"question": r.question.strip()} for r in requests]
+
+    def finish(indexes, **fields):
+        for i in indexes:
+            results[i].update(fields)
+
+    # Repeated questions are answered once: answer-cache key -> (question, intent, k, result indexes)
+    pending = {}
+    for i, request in enumerate(requests):
+        try:
+            question, intent, k = parse_query(request)
+        except HTTPException as e:
+            results[i]["error"] = e.detail
+            continue
+        pending.setdefault(answers.key(question, intent, k), (question, intent, k, []))[3].append(i)
+
+    # Metadata-only questions and cached answers need no embedding
+    direct = await asyncio.gather(*(
+        structured(question, intent, k) for question, intent, k, _ in pending.values()
+    ), return_exceptions=True)
+    for key, found in zip(list(pending), direct):
+        path  = "structured" if isinstance(found, dict) else "cached"
+        found = found if isinstance(found, dict) else answers.get(key)
+        if found:
+            QUERIES_TOTAL.inc(len(pending[key][3]), endpoint="batch", path=path)
+            finish(pending.pop(key)[3], **found)
+
+    # One embedding call for the rest, then every search at once
+    try:
+        await embed_questions([question for question, _, _, _ in pending.values()])
+    except Exception as e:
+        for _, _, _, indexes in pending.values():
+            QUERIES_TOTAL.inc(len(indexes), endpoint="batch", path="error")
+            finish(indexes, error=f"Embedding failed: {e}")
+        return results
+    if answers.similarity:
+        for key, (question, _, _, indexes) in list(pending.items()):
+            found = answers.get_similar(key, query_embeddings.get(question))
+            if found:
+                QUERIES_TOTAL.inc(len(indexes), endpoint="batch", path="cached")
+                finish(indexes, **found)
+                del pending[key]
+
+    items = list(pending.items())
+    found = await asyncio.gather(*(
+        retrieve_docs(question, intent, k) for _, (question, intent, k, _) in items
+    ), return_exceptions=True)
+    ready = []
+    for (key, (question, _, _, indexes)), docs in zip(items, found):
+        if isinstance(docs, Exception):
+            QUERIES_TOTAL.inc(len(indexes), endpoint="batch", path="error")
+            finish(indexes, error=str(docs))
+        else:
+            ready.append((key, question, indexes, docs))
+
+    # LLM calls run concurrently, at most BATCH_LLM_CONCURRENCY at a time
+    inputs = await asyncio.gather(*(prompt_inputs(docs, question) for _, question, _, docs in ready))
+    with stage("llm"):
+        generated = await get_chain().abatch(
+            inputs, config={"max_concurrency": BATCH_LLM_CONCURRENCY}, return_exceptions=True,
+        )
+    for (key, question, indexes, docs), answer in zip(ready, generated):
+        if isinstance(answer, Exception):
+            QUERIES_TOTAL.inc(len(indexes), endpoint="batch", path="error")
+            finish(indexes, error=str(answer))
+            continue
+        QUERIES_TOTAL.inc(len(indexes), endpoint="batch", path="rag")
+        result = {"answer": answer, "sources": to_sources(docs)}
+        answers.put(key, result, query_embeddings.get(question))
+        finish(indexes, **result)
+    return results
+
+
+@app.post("/query/stream")
+async def query_emails_stream(request: QueryRequest):
+    """Server-sent events: `sources` ({question, sources}) once retrieval is done,
+    `token` ({text}) per piece of the answer, then `done` ({answer}, plus `debug` when
+    requested) or `error` ({detail})."""
+    await warmed_up()
+    question, intent, k = parse_query(request)
+    key = answers.key(question, intent, k)
+
+    async def events():
+        breakdown = metrics.start_request()
+        started   = time.perf_counter()
+
+        def done(answer, path):
+            QUERIES_TOTAL.inc(endpoint="stream", path=path)
+            QUERY_STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
+            breakdown["timings"]["total"] = round((time.perf_counter() - started) * 1000, 2)
+            return sse("done", {"answer": answer, **({"debug": breakdown} if request.debug else {})})
+
+        try:
+            cached = await structured(question, intent, k)
+            path, vector = "structured", None
+            if not cached:
+                (cached, vector), path = await lookup_answer(question, key), "cached"
+            if cached:
+                yield sse("sources", {"question": question, "sources": cached["sources"]})
+                yield sse("token", {"text": cached["answer"]})
+                yield done(cached["answer"], path)
+                return
+            docs    = await retrieve_docs(question, intent, k)
+            sources = to_sources(docs)
+            yield sse("sources", {"question": question, "sources": sources})
+
+            parts  = []
+            inputs = await prompt_inputs(docs, question)
+            with stage("llm"):
+                async for token in get_chain().astream(inputs):
+                    parts.append(token)
+                    yield sse("token", {"text": token})
+        except Exception as e:
+            QUERIES_TOTAL.inc(endpoint="stream", path="error")
+            yield sse("error", {"detail": str(e)})
+            return
+
+        answer = "".join(parts)
+        answers.put(key, {"answer": answer, "sources": sources}, vector)
+        yield done(answer, "rag")
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,96 @@
+"""
+benchmarks/bench_chunker.py
+
+Compares the previous chunker with email_splitter.EmailTextSplitter on the
+documents load_and_store.py would build.
+
+  recursive — RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+  email     — EmailTextSplitter (quote/signature/footer stripping, token-sized
+              chunks, header repeated per chunk)
+
+Reported: chunks (= vectors stored), total tokens embedded, mean and max tokens
+per chunk (≈ prompt tokens per retrieved chunk) and split time.
+
+Corpus: the local message cache (--from-cache) or synthetic mail — reply
+threads from fakes.reply_thread_text plus newsletters from fakes.newsletter_html.
+
+Run: python -m benchmarks.bench_chunker [--from-cache] [--count 500]
+"""
+
+import argparse
+import time
+
+from email_splitter import EmailTextSplitter, count_tokens
+from fakes import newsletter_html, reply_thread_text
+from html_text import html_to_text
+from load_and_store import emails_to_documents
+from message_cache import MessageCache
+
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    SPLITTERS_AVAILABLE = True
+except ImportError:
+    SPLITTERS_AVAILABLE = False
+
+
+def synthetic_emails(count):
+    emails = []
+    for i in range(count):
+        body = reply_thread_text(i, depth=2 + i % 5) if i % 2 else html_to_text(newsletter_html(i))
+        emails.append({
+            "id": str(i), "subject": f"Message {i}", "from": "sender@example.com",
+            "date": "Mon, 05 Oct 2026 09:00:00 +0000", "body": body, "labels": ["INBOX"],
+        })
+    return emails
+
+
+def cached_emails(count):
+    emails = []
+    for batch in MessageCache().iter_batches():
+        emails.extend(batch)
+        if len(emails) >= count:
+            break
+    return emails[:count]
+
+
+def measure(name, splitter, docs, baseline):
+    start  = time.perf_counter()
+    chunks = splitter.split_documents(docs)
+    secs   = time.perf_counter() - start
+    tokens = [count_tokens(c.page_content) for c in chunks]
+    total  = sum(tokens)
+    line   = (f"  {name:<10} {len(chunks):>7} chunks  {total:>9,} tokens  "
+              f"{total / len(chunks):>6.0f} mean  {max(tokens):>5} max  {secs * 1000:>8.1f} ms")
+    if baseline:
+        line += f"  ({len(chunks) / baseline[0]:.0%} of chunks, {total / baseline[1]:.0%} of tokens)"
+    print(line)
+    return len(chunks), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark email chunking.")
+    parser.add_argument("--from-cache", action="store_true", help="use the local message cache")
+    parser.add_argument("--count", type=int, default=500, help="max emails to use")
+    args = parser.parse_args()
+
+    emails = cached_emails(args.count) if args.from_cache else synthetic_emails(args.count)
+    if not emails:
+        print("Corpus is empty.")
+        return
+    docs = emails_to_documents(emails)
+
+    print("=" * 60)
+    print(f"Corpus : {len(docs)} emails ({'message cache' if args.from_cache else 'synthetic'})")
+    print("=" * 60)
+    baseline = None
+    if SPLITTERS_AVAILABLE:
+        baseline = measure(
+            "recursive", RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200), docs, None
+        )
+    else:
+        print("  (langchain-text-splitters not installed — skipping recursive)")
+    measure("email", EmailTextSplitter(), docs, baseline)
+
+
+if __name__ == "__main__":
+    main()
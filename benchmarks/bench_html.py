@@ -0,0 +1,182 @@
+"""
+benchmarks/bench_html.py
+
+Benchmarks email body extraction on a corpus of HTML mail.
+
+HTML → text:
+  bs4    — the previous BeautifulSoup html.parser + decompose() path
+  strip  — GmailFetcher._simple_html_strip
+  fast   — html_text.html_to_text (what the fetcher uses now)
+
+MIME decode:
+  two-pass    — the previous _get_message_body(prefer_html=True/False) pair
+  single-pass — GmailFetcher._get_message_bodies
+
+Corpus: a directory of .eml and .html files (e.g. mail saved from your client).
+Without --corpus, synthetic newsletters from fakes.newsletter_html are used.
+
+Run: python -m benchmarks.bench_html [--corpus DIR] [--count 500] [--repeat 5]
+"""
+
+import argparse
+import base64
+import email
+import os
+import re
+import time
+from email import policy
+
+from email_fetcher import GmailFetcher
+from fakes import make_message, newsletter_html
+from html_text import html_to_text
+
+try:
+    from bs4 import BeautifulSoup
+    BS4_AVAILABLE = True
+except ImportError:
+    BS4_AVAILABLE = False
+
+
+# ── Previous implementations, kept here for comparison ─────────────────────────
+
+def bs4_to_text(html_body):
+    soup = BeautifulSoup(html_body, "html.parser")
+    for tag in soup(["script", "style", "head", "title", "meta", "link"]):
+        tag.decompose()
+    text = soup.get_text(separator=" ", strip=True)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s([.,!?;:])", r"\1", text)
+    return text.strip()
+
+
+def two_pass_bodies(payload):
+    def get_body(payload, prefer_html):
+        if "body" in payload and payload["body"].get("data"):
+            return base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8", errors="ignore")
+        if "parts" in payload:
+            html_content = text_content = None
+            for part in payload["parts"]:
+                if part["mimeType"] == "text/html" and "data" in part.get("body", {}):
+                    html_content = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="ignore")
+                elif part["mimeType"] == "text/plain" and "data" in part.get("body", {}):
+                    text_content = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="ignore")
+                elif "parts" in part:
+                    body = get_body(part, prefer_html)
+                    if body:
+                        return body
+            if prefer_html and html_content:
+                return html_content
+            return text_content or html_content or ""
+        return ""
+
+    return get_body(payload, True), get_body(payload, False)
+
+
+# ── Corpus ─────────────────────────────────────────────────────────────────────
+
+def _gmail_payload(msg):
+    """Convert a stdlib email.message into the Gmail API payload shape."""
+    payload = {"mimeType": msg.get_content_type(), "headers": [], "body": {}}
+    if msg.is_multipart():
+        payload["parts"] = [_gmail_payload(part) for part in msg.iter_parts()]
+    else:
+        raw = msg.get_payload(decode=True) or b""
+        payload["body"]["data"] = base64.urlsafe_b64encode(raw).decode("ascii")
+    return payload
+
+
+def load_corpus(corpus_dir, count):
+    """Returns a list of (payload, html) pairs."""
+    if not corpus_dir:
+        items = []
+        for i in range(count):
+            html_body = newsletter_html(i)
+            message   = make_message(str(i), "Newsletter", "news@example.com",
+                                     "Mon, 05 Oct 2026 09:00:00 +0000",
+                                     text=html_to_text(html_body), html=html_body)
+            items.append((message["payload"], html_body))
+        return items
+
+    items = []
+    for name in sorted(os.listdir(corpus_dir)):
+        path = os.path.join(corpus_dir, name)
+        if name.endswith(".eml"):
+            with open(path, "rb") as f:
+                msg = email.message_from_bytes(f.read(), policy=policy.default)
+            part = msg.get_body(preferencelist=("html",))
+            if part is None:
+                continue
+            items.append((_gmail_payload(msg), part.get_content()))
+        elif name.endswith((".html", ".htm")):
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                html_body = f.read()
+            message = make_message(name, "", "", "Mon, 05 Oct 2026 09:00:00 +0000", html=html_body)
+            items.append((message["payload"], html_body))
+    return items[:count]
+
+
+# ── Benchmark ──────────────────────────────────────────────────────────────────
+
+def best_of(repeat, fn, inputs):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def token_overlap(a, b):
+    a, b = set(a.split()), set(b.split())
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML email body extraction.")
+    parser.add_argument("--corpus", help="directory of .eml / .html files")
+    parser.add_argument("--count", type=int, default=500, help="max emails to use")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per method (best is reported)")
+    args = parser.parse_args()
+
+    corpus   = load_corpus(args.corpus, args.count)
+    if not corpus:
+        print("Corpus is empty.")
+        return
+    payloads = [p for p, _ in corpus]
+    htmls    = [h for _, h in corpus]
+    total_mb = sum(len(h.encode("utf-8")) for h in htmls) / 1e6
+    fetcher  = GmailFetcher.__new__(GmailFetcher)  # parsing helpers only, no Gmail
+
+    print("=" * 60)
+    print(f"Corpus : {len(corpus)} emails, {total_mb:.1f} MB of HTML "
+          f"({'synthetic' if not args.corpus else args.corpus})")
+    print("=" * 60)
+
+    print("\nHTML → text")
+    methods = [("fast", html_to_text), ("strip", fetcher._simple_html_strip)]
+    if BS4_AVAILABLE:
+        methods.insert(0, ("bs4", bs4_to_text))
+    else:
+        print("  (beautifulsoup4 not installed — skipping bs4)")
+
+    baseline = None
+    for name, fn in methods:
+        secs = best_of(args.repeat, fn, htmls)
+        baseline = baseline or secs
+        line = (f"  {name:<6} {secs * 1000:>9.1f} ms  {secs * 1000 / len(htmls):>7.3f} ms/email"
+                f"  {total_mb / secs:>7.1f} MB/s  {baseline / secs:>5.1f}x")
+        if BS4_AVAILABLE and name != "bs4":
+            agree = sum(token_overlap(fn(h), bs4_to_text(h)) for h in htmls) / len(htmls)
+            line += f"  token overlap vs bs4 {agree:.1%}"
+        print(line)
+
+    print("\nMIME decode")
+    two    = best_of(args.repeat, two_pass_bodies, payloads)
+    single = best_of(args.repeat, fetcher._get_message_bodies, payloads)
+    print(f"  two-pass     {two * 1000:>9.1f} ms")
+    print(f"  single-pass  {single * 1000:>9.1f} ms  {two / single:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
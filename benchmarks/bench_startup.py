@@ -0,0 +1,136 @@
+"""
+benchmarks/bench_startup.py
+
+Cold start of api.py, fully offline: a synthetic mailbox is synced into a
+temporary ./chroma_db (as in load_test.py), then for each STARTUP_MODE a
+fresh `uvicorn api:app` is started --runs times and timed from process start:
+
+  health       — until the first /health response
+  ready        — until /ready returns 200 (warm-up done)
+  first query  — latency of the first POST /query after that (a retrieval
+                 question, not one answered from the metadata index)
+  warm query   — median latency of the next queries
+
+`import api` is also timed on its own, in a fresh interpreter. Medians over
+the runs are appended to benchmarks/results/bench_startup.jsonl and compared
+with the previous run with the same parameters.
+
+Run: python -m benchmarks.bench_startup [--runs 3] [--emails 2000]
+                                        [--modes background,blocking] [--no-save]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import results as history
+from benchmarks.load_test import QUESTIONS, seed_index
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def server_env(mode):
+    return {
+        **os.environ,
+        "PYTHONPATH":           ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "EMBEDDINGS_PROVIDER":  "fake",
+        "LLM_PROVIDER":         "fake",
+        "ANSWER_CACHE_SIZE":    "0",
+        "ANONYMIZED_TELEMETRY": "False",
+        "STARTUP_MODE":         mode,
+    }
+
+
+def time_import(directory):
+    """Seconds to `import api` in a fresh interpreter."""
+    code = "import time; t = time.perf_counter(); import api; print(time.perf_counter() - t)"
+    done = subprocess.run(
+        [sys.executable, "-c", code], cwd=directory, env=server_env("background"),
+        capture_output=True, text=True, check=True,
+    )
+    return float(done.stdout.strip().splitlines()[-1])
+
+
+def poll(client, url, deadline):
+    while time.monotonic() < deadline:
+        try:
+            if client.get(url).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not answer")
+
+
+def start_once(directory, mode, port, queries=5, timeout=120):
+    """One cold start; returns seconds to health and ready, and query latencies."""
+    url    = f"http://127.0.0.1:{port}"
+    start  = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=directory, env=server_env(mode), stdout=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=60) as client:
+            poll(client, f"{url}/health", start + timeout)
+            health = time.monotonic() - start
+            poll(client, f"{url}/ready", start + timeout)
+            ready = time.monotonic() - start
+            latencies = []
+            for question in (QUESTIONS[4:] * queries)[:queries]:  # retrieval questions first
+                sent = time.monotonic()
+                client.post(f"{url}/query", json={"question": question}).raise_for_status()
+                latencies.append(time.monotonic() - sent)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"health": health, "ready": ready, "first_query": latencies[0],
+            "warm_query": statistics.median(latencies[1:])}
+
+
+def report(mode, result, previous):
+    prev = (previous or {}).get("results", {}).get(mode, {})
+    print(f"\nSTARTUP_MODE={mode}")
+    for key, label in (("health", "health"), ("ready", "ready"), ("first_query", "first query"),
+                       ("warm_query", "warm query")):
+        change = history.change(result[key], prev.get(key), higher_is_better=False)
+        print(f"  {label:<12} {result[key] * 1000:>8.0f} ms{change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark api.py cold start.")
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per mode")
+    parser.add_argument("--emails", type=int, default=2000, help="synthetic mailbox size")
+    parser.add_argument("--modes", default="background,blocking", help="STARTUP_MODE values to compare")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--no-save", action="store_true", help="don't record results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="mailmate-startup-") as directory:
+        print(f"Seeding {args.emails} synthetic emails into {directory} ...")
+        print(f"  {seed_index(directory, args.emails)} chunks")
+
+        imports = statistics.median(time_import(directory) for _ in range(args.runs))
+        results = {"import": imports}
+        for mode in args.modes.split(","):
+            runs          = [start_once(directory, mode, args.port) for _ in range(args.runs)]
+            results[mode] = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+
+    params   = {"runs": args.runs, "emails": args.emails, "modes": args.modes}
+    previous = None if args.no_save else history.save("bench_startup", params, results)
+    change   = history.change(imports, (previous or {}).get("results", {}).get("import"), higher_is_better=False)
+    print(f"\nimport api   {imports * 1000:>8.0f} ms{change}")
+    for mode in args.modes.split(","):
+        report(mode, results[mode], previous)
+    if previous:
+        print(f"\nPrevious run: {previous['commit']} at {previous['time']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+benchmarks/bench_sync.py
+
+Sync throughput on synthetic mailboxes, fully offline: the real fetch → parse →
+split → embed → store pipeline of load_and_store.py runs against
+
+  fakes.SyntheticGmailService — a generated mailbox of newsletters, reply
+                                threads, receipts and invoices with attachments,
+                                with --gmail-latency per HTTP request and an
+                                optional per-user quota (--gmail-quota)
+  fakes.FakeEmbeddings        — Cohere-sized batches with --embed-latency per
+                                call and an optional calls-per-minute limit
+
+Each mailbox size is synced from scratch into a temporary directory, in its
+own process (Chroma and the indexes are per-process singletons). Reported:
+emails/sec, chunks/sec and time per pipeline stage. Results are appended to
+benchmarks/results/bench_sync.jsonl and compared with the previous run with
+the same parameters.
+
+Run: python -m benchmarks.bench_sync [--sizes 1000,10000,100000] [--gmail-latency 0.05]
+                                     [--gmail-quota 250] [--embed-latency 0.05]
+                                     [--embed-calls-per-minute N] [--seed 0] [--no-save]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import results as history
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sync_mailbox(count, seed=0, days=365, gmail_latency=0.0, gmail_quota=None,
+                 embed_latency=0.0, embed_calls_per_minute=None):
+    """Sync a synthetic mailbox of `count` emails into the current directory's
+    chroma_db / sync_state.db. Returns throughput and per-stage seconds."""
+    os.environ["EMBEDDINGS_PROVIDER"] = "fake"
+    from email_fetcher import GmailFetcher
+    from embed_cache import EmbeddingCache
+    from fakes import FakeEmbeddings, SyntheticGmailService
+    from load_and_store import sync_emails
+    from message_cache import MessageCache
+    from metrics import SYNC_STAGE_SECONDS
+    from sync_store import SyncStore
+    from vector_store import ensure_active, open_collection
+
+    service    = SyntheticGmailService(count, seed=seed, days=days, latency=gmail_latency, quota_per_sec=gmail_quota)
+    fetcher    = GmailFetcher(service=service, quota_per_sec=gmail_quota or 1e9, cache=MessageCache())
+    embeddings = FakeEmbeddings(latency=embed_latency, calls_per_minute=embed_calls_per_minute)
+
+    ensure_active()
+    start   = time.perf_counter()
+    stats   = sync_emails(
+        open_collection(embeddings), fetcher.iter_latest(max_emails=count), SyncStore(),
+        EmbeddingCache(model=embeddings.model),
+    )
+    seconds = time.perf_counter() - start
+    emails  = stats["emails"] + stats["duplicates"]
+    return {
+        "emails":             emails,
+        "duplicates":         stats["duplicates"],
+        "chunks":             stats["chunks"],
+        "seconds":            round(seconds, 3),
+        "emails_per_sec":     round(emails / seconds, 1),
+        "chunks_per_sec":     round(stats["chunks"] / seconds, 1),
+        "stages":             {k[0]: round(v[0], 3) for k, v in SYNC_STAGE_SECONDS.totals().items()},
+        "embed_calls":        embeddings.calls,
+        "gmail_rate_limited": service.rate_limited,
+    }
+
+
+def run_size(count, args):
+    """sync_mailbox in a fresh process and temporary directory."""
+    params = {
+        "count": count, "seed": args.seed, "gmail_latency": args.gmail_latency, "gmail_quota": args.gmail_quota,
+        "embed_latency": args.embed_latency, "embed_calls_per_minute": args.embed_calls_per_minute,
+    }
+    with tempfile.TemporaryDirectory(prefix="mailmate-sync-") as directory:
+        done = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_sync", "--child", json.dumps(params)],
+            cwd=directory, capture_output=True, text=True,
+            env={**os.environ, "PYTHONPATH": ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+                 "ANONYMIZED_TELEMETRY": "False"},
+        )
+    lines = done.stdout.strip().splitlines()
+    if done.returncode or not lines or not lines[-1].startswith("{"):
+        print(done.stdout[-2000:], done.stderr[-2000:])
+        raise RuntimeError(f"sync of {count} emails failed")
+    return params, json.loads(lines[-1])
+
+
+def report(result, previous):
+    prev = (previous or {}).get("results", {})
+    print(f"  {result['emails']:>7,} emails ({result['duplicates']:,} near-duplicates), "
+          f"{result['chunks']:,} chunks in {result['seconds']:.1f}s")
+    print(f"  {result['emails_per_sec']:>9.1f} emails/s{history.change(result['emails_per_sec'], prev.get('emails_per_sec'))}")
+    print(f"  {result['chunks_per_sec']:>9.1f} chunks/s{history.change(result['chunks_per_sec'], prev.get('chunks_per_sec'))}")
+    stages = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in result["stages"].items())
+    print(f"  stages   {stages}  ({result['embed_calls']} embed calls, "
+          f"{result['gmail_rate_limited']} Gmail 429s)")
+    if previous:
+        print(f"  previous {previous['commit']} at {previous['time']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync throughput on synthetic mailboxes.")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated mailbox sizes, e.g. 1000,10000,100000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gmail-latency", type=float, default=0.05, help="fake Gmail seconds per HTTP request")
+    parser.add_argument("--gmail-quota", type=float, default=None,
+                        help="per-user quota units/sec (Gmail: 250); unthrottled by default")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per call")
+    parser.add_argument("--embed-calls-per-minute", type=int, default=None)
+    parser.add_argument("--no-save", action="store_true", help="don't record results")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        params = json.loads(args.child)
+        print(json.dumps(sync_mailbox(**params)))
+        return
+
+    print(f"Gmail latency {args.gmail_latency}s, quota {args.gmail_quota or 'unthrottled'}; "
+          f"embed latency {args.embed_latency}s")
+    for count in (int(s) for s in args.sizes.split(",")):
+        print(f"\n{count:,}-email mailbox")
+        params, result = run_size(count, args)
+        previous = None if args.no_save else history.save("bench_sync", params, result)
+        report(result, previous)
+
+
+if __name__ == "__main__":
+    main()
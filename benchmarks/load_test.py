@@ -0,0 +1,262 @@
+"""
+benchmarks/load_test.py
+
+Concurrent load test of POST /query, with /health probed throughout to show
+whether slow queries stall the event loop.
+
+By default it is fully offline: it syncs a synthetic mailbox
+(fakes.SyntheticGmailService, dated over the last 60 days) into a temporary
+./chroma_db with fakes.FakeEmbeddings and starts `uvicorn api:app` there with
+EMBEDDINGS_PROVIDER=fake and LLM_PROVIDER=fake, so the embedding and LLM
+calls take --embed-latency / --llm-latency seconds without touching the
+network. With --url it targets an already running server instead.
+
+Reported for an unloaded pass (concurrency 1) and the loaded pass:
+p50 / p95 / p99 / max latency of /query and /health, throughput and errors.
+With --stream the queries go to /query/stream and time-to-first-token is
+reported as well. The offline server runs with the answer cache off
+(ANSWER_CACHE_SIZE=0) unless --cache is given, since the questions repeat.
+Results are appended to benchmarks/results/load_test.jsonl and compared with
+the previous run with the same parameters (--no-save to skip).
+
+Run: python -m benchmarks.load_test [--concurrency 50] [--requests 500]
+                                    [--llm-latency 1.0] [--token-latency 0.02]
+                                    [--embed-latency 0.05] [--stream] [--cache] [--url URL]
+                                    [--no-save]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import results as history
+from benchmarks.bench_sync import sync_mailbox
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "What emails did I get today?",
+    "Any invoices this week?",
+    "How many newsletters did I receive this month?",
+    "Show me the latest emails",
+    "What did the team say about the project launch?",
+    "Do I have any payment reminders?",
+    "Summarise the security notices",
+    "Which orders were shipped?",
+]
+
+
+# ── Offline server ─────────────────────────────────────────────────────────────
+
+def seed_index(directory, count):
+    """Sync a synthetic mailbox into directory/chroma_db with fake Gmail and embeddings."""
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        return sync_mailbox(count, days=60)["chunks"]
+    finally:
+        os.chdir(cwd)
+
+
+def start_server(directory, port, args):
+    env = {
+        **os.environ,
+        "PYTHONPATH":             ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "EMBEDDINGS_PROVIDER":    "fake",
+        "LLM_PROVIDER":           "fake",
+        "FAKE_LLM_LATENCY":       str(args.llm_latency),
+        "FAKE_LLM_TOKEN_LATENCY": str(args.token_latency),
+        "FAKE_EMBED_LATENCY":     str(args.embed_latency),
+        "ANSWER_CACHE_SIZE":      os.environ.get("ANSWER_CACHE_SIZE", "256") if args.cache else "0",
+        "ANONYMIZED_TELEMETRY":   "False",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=directory, env=env, stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{url}/ready")).status_code == 200:  # warm-up done
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not become ready")
+
+
+# ── Load ───────────────────────────────────────────────────────────────────────
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def stream_query(client, question):
+    """POST /query/stream. Returns (seconds to the first `token` event, seconds to the end)."""
+    start, ttft = time.perf_counter(), None
+    async with client.stream("POST", "/query/stream", json={"question": question}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line == "event: token" and ttft is None:
+                ttft = time.perf_counter() - start
+            elif line == "event: error":
+                raise httpx.HTTPError("error event")
+    return ttft, time.perf_counter() - start
+
+
+async def run_load(url, concurrency, total, stream=False):
+    """Fire `total` queries from `concurrency` workers; probe /health every 100 ms."""
+    limits  = httpx.Limits(max_connections=concurrency + 5, max_keepalive_connections=concurrency + 5)
+    results = {"query": [], "ttft": [], "health": [], "errors": 0}
+    queue   = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(QUESTIONS[i % len(QUESTIONS)])
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+        async def worker():
+            while True:
+                try:
+                    question = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    if stream:
+                        ttft, elapsed = await stream_query(client, question)
+                        results["ttft"].append(ttft)
+                        results["query"].append(elapsed)
+                        continue
+                    response = await client.post("/query", json={"question": question})
+                    response.raise_for_status()
+                    results["query"].append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    results["errors"] += 1
+
+        async def prober(stop):
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    await client.get("/health")
+                    results["health"].append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    results["errors"] += 1
+                await asyncio.sleep(0.1)
+
+        stop  = asyncio.Event()
+        probe = asyncio.create_task(prober(stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        results["elapsed"] = time.perf_counter() - start
+        stop.set()
+        await probe
+    return results
+
+
+def summary(results):
+    """Milliseconds / req/s of a run, as saved to the results history."""
+    q, h = results["query"], results["health"]
+    t    = [v for v in results["ttft"] if v is not None]
+    out  = {
+        "p50_ms":        round(percentile(q, 50) * 1000, 1),
+        "p95_ms":        round(percentile(q, 95) * 1000, 1),
+        "p99_ms":        round(percentile(q, 99) * 1000, 1),
+        "req_per_sec":   round(len(q) / results["elapsed"], 2),
+        "health_p99_ms": round(percentile(h, 99) * 1000, 1),
+        "errors":        results["errors"],
+    }
+    if t:
+        out["ttft_p50_ms"] = round(percentile(t, 50) * 1000, 1)
+    return out
+
+
+def report(name, results, previous=None):
+    q, h = results["query"], results["health"]
+    prev = previous or {}
+    now  = summary(results)
+    print(f"\n{name}")
+    print(f"  /query   n={len(q):<5} p50 {percentile(q, 50) * 1000:>7.0f} ms  p95 {percentile(q, 95) * 1000:>7.0f} ms"
+          f"  p99 {percentile(q, 99) * 1000:>7.0f} ms  max {max(q, default=0) * 1000:>7.0f} ms"
+          f"  {len(q) / results['elapsed']:>6.1f} req/s")
+    if prev:
+        changes = [
+            f"{label}{history.change(now[key], prev.get(key), higher_is_better=key == 'req_per_sec')}"
+            for label, key in (("p50", "p50_ms"), ("p95", "p95_ms"), ("p99", "p99_ms"), ("req/s", "req_per_sec"))
+        ]
+        print("  vs previous run: " + "   ".join(changes))
+    if results["ttft"]:
+        t = [v for v in results["ttft"] if v is not None]
+        print(f"  TTFT     n={len(t):<5} p50 {percentile(t, 50) * 1000:>7.0f} ms  p95 {percentile(t, 95) * 1000:>7.0f} ms"
+              f"  p99 {percentile(t, 99) * 1000:>7.0f} ms  max {max(t, default=0) * 1000:>7.0f} ms")
+    print(f"  /health  n={len(h):<5} p50 {percentile(h, 50) * 1000:>7.1f} ms  p99 {percentile(h, 99) * 1000:>7.1f} ms"
+          f"  max {max(h, default=0) * 1000:>7.1f} ms")
+    if results["errors"]:
+        print(f"  errors   {results['errors']}")
+
+
+async def main_async(args):
+    server = None
+    url    = args.url
+    if not url:
+        directory = tempfile.mkdtemp(prefix="mailmate-load-")
+        print(f"Seeding {args.emails} synthetic emails into {directory} ...")
+        chunks = seed_index(directory, args.emails)
+        print(f"  {chunks} chunks")
+        server = start_server(directory, args.port, args)
+        url    = f"http://127.0.0.1:{args.port}"
+    try:
+        await wait_ready(url)
+        print(f"Target : {url}{'/query/stream' if args.stream else '/query'}  (LLM latency {args.llm_latency}s"
+              f" + {args.token_latency}s/token, embed latency {args.embed_latency}s"
+              f"{'' if not args.url else ' — ignored for --url'})")
+        baseline = await run_load(url, 1, min(args.requests, 10), args.stream)
+        loaded   = await run_load(url, args.concurrency, args.requests, args.stream)
+        params   = {
+            k: v for k, v in vars(args).items() if k not in ("port", "no_save") and not (args.url and "latency" in k)
+        }
+        previous = None
+        if not args.no_save:
+            previous = history.save("load_test", params, {"unloaded": summary(baseline), "loaded": summary(loaded)})
+        prev = (previous or {}).get("results", {})
+        report("Unloaded (concurrency 1)", baseline, prev.get("unloaded"))
+        report(f"Loaded (concurrency {args.concurrency})", loaded, prev.get("loaded"))
+        ratio = percentile(loaded["query"], 99) / percentile(baseline["query"], 50)
+        print(f"\np99 under load / unloaded p50: {ratio:.2f}x")
+        if previous:
+            print(f"Previous run: {previous['commit']} at {previous['time']}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test POST /query.")
+    parser.add_argument("--url", help="target a running server instead of starting an offline one")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake LLM seconds to the first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="fake LLM seconds per further token")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per call")
+    parser.add_argument("--emails", type=int, default=2000, help="synthetic mailbox size")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stream", action="store_true", help="query /query/stream and report time-to-first-token")
+    parser.add_argument("--cache", action="store_true", help="leave the answer cache on")
+    parser.add_argument("--no-save", action="store_true", help="don't record results")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
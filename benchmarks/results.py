@@ -0,0 +1,60 @@
+"""
+benchmarks/results.py
+
+Run-to-run history for the benchmarks: every run appends one JSON line to
+benchmarks/results/<benchmark>.jsonl with the time, git commit, parameters
+and results, and is compared with the last run that used the same
+parameters, so a regression shows up as a percentage change. The history
+is per machine and is not committed (.gitignore).
+"""
+
+import json
+import os
+import subprocess
+from datetime import datetime
+
+ROOT        = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, timeout=30,
+        ).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def history(benchmark):
+    path = os.path.join(RESULTS_DIR, f"{benchmark}.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save(benchmark, params, results):
+    """Append this run; returns the previous run with the same params, or None."""
+    previous = next((r for r in reversed(history(benchmark)) if r["params"] == params), None)
+    record   = {
+        "time":    datetime.now().isoformat(timespec="seconds"),
+        "commit":  git_commit(),
+        "params":  params,
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, f"{benchmark}.jsonl"), "a") as f:
+        f.write(json.dumps(record) + "\n")
+    return previous
+
+
+def change(value, previous, higher_is_better=True):
+    """"  (+3.1%)" against the same number from the previous run ("" without one);
+    changes over 5% are marked better / WORSE."""
+    if not previous or value is None:
+        return ""
+    ratio   = (value - previous) / previous * 100
+    better  = ratio > 0 if higher_is_better else ratio < 0
+    verdict = "" if abs(ratio) < 5 else (" better" if better else " WORSE")
+    return f"  ({ratio:+.1f}%{verdict})"
@@ -0,0 +1,135 @@
+"""
+context_packer.py
+
+Builds the LLM context from retrieved chunks within a token budget.
+
+  1. Groups chunks by email id, in retrieval order, so an email retrieved
+     as several chunks appears once: one Subject/From/Date header, then its
+     chunks in document order. Chunks from the old splitter, which
+     overlapped by up to 200 characters, are joined without the overlap.
+  2. Adds emails, best-ranked first, whole while they fit
+     CONTEXT_TOKEN_BUDGET. An email that doesn't fit is cut at a word
+     boundary to fill what is left, or skipped when too little is left.
+  3. Orders the packed emails newest first, as the prompt expects.
+
+The default budget keeps prompt + context under the 8k-token input limit of
+gpt-4o-mini on GitHub Models, which is what used to fail with
+tokens_limit_reached.
+"""
+
+import json
+import os
+from email.utils import parsedate_to_datetime
+
+from email_splitter import count_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+MIN_PARTIAL_TOKENS   = 80    # don't bother with a truncated email shorter than this
+MIN_OVERLAP          = 20    # shortest overlap trusted when joining legacy chunks
+MAX_OVERLAP          = 250   # the old splitter overlapped chunks by up to 200 chars
+SEPARATOR            = "\n\n---\n\n"
+
+
+def doc_timestamp(doc) -> int:
+    # Collapsed near-duplicates sort by their most recent occurrence
+    ts = doc.metadata.get("latest_timestamp") or doc.metadata.get("timestamp", 0)
+    if ts and ts > 0:
+        return ts
+    try:
+        return int(parsedate_to_datetime(doc.metadata.get("date", "")).timestamp())
+    except Exception:
+        return 0
+
+
+# ── Merging chunks ─────────────────────────────────────────────────────────────
+
+def _join(text, part):
+    """Append part to text, dropping the overlap the old character splitter left."""
+    for k in range(min(len(text), len(part), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if text.endswith(part[:k]):
+            return text + part[k:]
+    return f"{text}\n\n{part}" if text else part
+
+
+def merge_chunks(texts):
+    """(header, body) of one email from its chunk texts, in chunk order. Handles both
+    header-per-chunk chunks and the old overlapping chunks (header in the first only)."""
+    header, body = "", ""
+    for text in texts:
+        if text.startswith("Subject:"):
+            chunk_header, _, part = text.partition("\n\n")
+            header = header or chunk_header
+            body   = f"{body}\n\n{part}" if body else part
+        else:
+            body = _join(body, part=text)
+    return header, body
+
+
+def occurrence_note(metadata) -> str:
+    """For a collapsed near-duplicate, every occurrence, so counting and date
+    questions still see each email; "" otherwise."""
+    count = metadata.get("occurrence_count", 1)
+    if count <= 1:
+        return ""
+    try:
+        occurrences = json.loads(metadata.get("occurrences", "[]"))
+    except ValueError:
+        occurrences = []
+    lines = [f"- Date: {o['date']} | Subject: {o['subject']}" for o in occurrences]
+    if count > len(occurrences):
+        lines.append(f"- ... and {count - len(occurrences)} older")
+    return f"[This email was received {count} times with near-identical content:]\n" + "\n".join(lines)
+
+
+def group_by_email(docs):
+    """[(first doc, [docs in chunk order])] per email, in order of first retrieval."""
+    groups = {}
+    for doc in docs:
+        key = doc.metadata.get("id") or doc.page_content
+        groups.setdefault(key, []).append(doc)
+    return [
+        (chunks[0], sorted(chunks, key=lambda d: d.metadata.get("chunk", 0)))
+        for chunks in groups.values()
+    ]
+
+
+# ── Packing ────────────────────────────────────────────────────────────────────
+
+def _truncate(text, tokens):
+    """text cut at a word boundary to roughly `tokens` tokens."""
+    total = count_tokens(text)
+    if total <= tokens:
+        return text
+    cut = text[: max(0, len(text) * tokens // total)]
+    return cut.rsplit(None, 1)[0] + " …" if " " in cut else cut
+
+
+def pack_context(docs, budget=CONTEXT_TOKEN_BUDGET):
+    """Returns (context string, stats) for the retrieved docs, within budget tokens.
+    stats: {"chunks", "emails", "packed", "truncated", "dropped", "tokens"}."""
+    stats  = {"chunks": len(docs), "emails": 0, "packed": 0, "truncated": 0, "dropped": 0, "tokens": 0}
+    packed = []  # (timestamp, text)
+    left   = budget
+    for first, chunks in group_by_email(docs):
+        stats["emails"] += 1
+        header, body = merge_chunks(c.page_content for c in chunks)
+        note   = occurrence_note(first.metadata)
+        text   = "\n\n".join(p for p in (header, body, note) if p)
+        tokens = count_tokens(text) + 2
+
+        if tokens > left:
+            fixed = count_tokens(header) + count_tokens(note) + 8
+            if left - fixed < MIN_PARTIAL_TOKENS:
+                stats["dropped"] += 1
+                continue
+            text   = "\n\n".join(p for p in (header, _truncate(body, left - fixed), note) if p)
+            tokens = count_tokens(text) + 2
+            stats["truncated"] += 1
+
+        packed.append((doc_timestamp(first), text))
+        left -= tokens
+        stats["packed"] += 1
+
+    packed.sort(key=lambda p: p[0], reverse=True)
+    stats["tokens"] = budget - left
+    return SEPARATOR.join(text for _, text in packed), stats
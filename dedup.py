@@ -0,0 +1,100 @@
+"""
+dedup.py
+
+Near-duplicate detection for templated mail (the same newsletter with a new
+date, order confirmations that differ by one number), run before chunking so
+each template is split and embedded once.
+
+Each email gets a 64-bit SimHash of its subject + body word 3-shingles, with
+digits masked so dates, prices and order numbers don't change the
+fingerprint. Two emails are near-duplicates when they come from the same
+sender and their fingerprints differ in at most DEDUP_MAX_DISTANCE bits.
+
+Candidates are found with LSH banding: the fingerprint is cut into
+DEDUP_BANDS bands and only emails sharing a band are compared. With 4 bands
+of 16 bits, any pair within 3 bits is guaranteed to share a band.
+"""
+
+import hashlib
+import re
+
+DEDUP_BANDS        = 4
+DEDUP_MAX_DISTANCE = 3
+DEDUP_MIN_SHINGLES = 8    # shorter mail ("Thanks!") is never collapsed
+SHINGLE_SIZE       = 3
+
+_BITS      = 64
+_BAND_BITS = _BITS // DEDUP_BANDS
+_WORDS     = re.compile(r"\w+")
+_DIGITS    = re.compile(r"\d+")
+_ADDRESS   = re.compile(r"<([^>]+)>")
+
+
+def sender_key(sender):
+    """Lower-cased address from a From header ("Shop <orders@shop.com>" -> "orders@shop.com")."""
+    match = _ADDRESS.search(sender or "")
+    return (match.group(1) if match else sender or "").strip().lower()
+
+
+def _feature_hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text):
+    """64-bit SimHash of text, or None when it is too short to fingerprint reliably."""
+    words    = _WORDS.findall(_DIGITS.sub("0", text.lower()))
+    shingles = {" ".join(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    if len(shingles) < DEDUP_MIN_SHINGLES:
+        return None
+
+    # Column-wise bit counts: zip(*) transposes the binary strings in C
+    hashes = [format(_feature_hash(s), "064b") for s in shingles]
+    half   = len(hashes) / 2
+    bits   = "".join("1" if column.count("1") > half else "0" for column in zip(*hashes))
+    return int(bits, 2)
+
+
+def email_fingerprint(email):
+    return simhash(f"{email.get('subject', '')}\n{email.get('body', '')}")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _bands(fingerprint):
+    mask = (1 << _BAND_BITS) - 1
+    return [(i, (fingerprint >> (i * _BAND_BITS)) & mask) for i in range(DEDUP_BANDS)]
+
+
+class DuplicateIndex:
+    """In-memory LSH index of canonical emails. Not thread-safe: used from the parse stage."""
+
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._buckets     = {}  # (band, value) -> [(msg_id, sender, fingerprint)]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows: (msg_id, canonical_id, sender, fingerprint) as stored by SyncStore."""
+        index = cls()
+        for msg_id, canonical_id, sender, fingerprint in rows:
+            if msg_id == canonical_id and fingerprint is not None:
+                index.add(msg_id, sender, fingerprint)
+        return index
+
+    def add(self, msg_id, sender, fingerprint):
+        for band in _bands(fingerprint):
+            self._buckets.setdefault(band, []).append((msg_id, sender, fingerprint))
+
+    def find(self, sender, fingerprint):
+        """Id of the closest canonical email from the same sender within max_distance, or None."""
+        best, best_distance = None, self.max_distance + 1
+        for band in _bands(fingerprint):
+            for msg_id, other_sender, other in self._buckets.get(band, ()):
+                if other_sender != sender:
+                    continue
+                distance = hamming(fingerprint, other)
+                if distance < best_distance:
+                    best, best_distance = msg_id, distance
+        return best
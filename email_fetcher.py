@@ -1,27 +1,103 @@
 import base64
 import os
 import pickle
+import random
 import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
-try:
-    from bs4 import BeautifulSoup
-    BS4_AVAILABLE = True
-except ImportError:
-    BS4_AVAILABLE = False
-    print("Warning: BeautifulSoup not installed. Run: pip install beautifulsoup4")
+from html_text import html_to_text
+from rate_limit import TokenBucket
+
+_HTML_TAG = re.compile(r"<html", re.IGNORECASE)
+
+
+def _decode_body(data):
+    return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
+
+
+def _is_rate_limited(error):
+    """True for Gmail 429s and 403 rateLimitExceeded / userRateLimitExceeded errors."""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return False
+    return status == 429 or (status == 403 and "ratelimitexceeded" in str(error).lower())
+
+
+def _is_retryable(error):
+    """Rate limits, 5xx responses and network errors — worth retrying; 4xx are not."""
+    if _is_rate_limited(error):
+        return True
+    status = getattr(getattr(error, "resp", None), "status", None)
+    try:
+        return int(status) >= 500
+    except (TypeError, ValueError):
+        return isinstance(error, (OSError, TimeoutError))
+
+
+class HistoryExpired(Exception):
+    """The stored historyId is older than Gmail keeps history for; a full resync is needed."""
 
 
 class GmailFetcher:
     # Read-only access to all mail
     SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
-    def __init__(self):
-        self.service = self._authenticate()
+    # Gmail accepts at most 100 calls per batch request; larger batches than ~50
+    # tend to trip the per-user rate limit, so default below the hard cap.
+    BATCH_LIMIT        = 100
+    DEFAULT_BATCH_SIZE = 50
+    MAX_RETRIES        = 5
+    MAX_BACKOFF        = 32
+
+    # Per-user quota is 250 units/sec; list and get each cost 5 units.
+    QUOTA_UNITS_PER_SEC = 250
+    LIST_COST           = 5
+    GET_COST            = 5
+    HISTORY_COST        = 2
+    PROFILE_COST        = 1
+
+    # Messages carrying these labels are not indexed (matches includeSpamTrash=False).
+    EXCLUDED_LABELS = {"SPAM", "TRASH", "DRAFT"}
+    DEFAULT_CONCURRENCY = 4
+
+    def __init__(self, service=None, batch_size=DEFAULT_BATCH_SIZE,
+                 concurrency=DEFAULT_CONCURRENCY, quota_per_sec=QUOTA_UNITS_PER_SEC, cache=None):
+        """service: a Gmail API resource (or a local fake); authenticates when omitted.
+        batch_size: messages per batch request, 1 disables batching.
+        concurrency: number of batch/get requests in flight at once.
+        quota_per_sec: quota units per second shared by all workers.
+        cache: optional MessageCache; cached messages are never re-downloaded."""
+        if service is None:
+            creds        = self._authenticate()
+            self._build  = lambda: build("gmail", "v1", credentials=creds)
+        else:
+            # Fakes are thread-safe; share the one instance across workers.
+            self._build  = lambda: service
+        self.service     = self._build()
+        self.batch_size  = max(1, min(batch_size, self.BATCH_LIMIT))
+        self.concurrency = max(1, concurrency)
+        self.limiter     = TokenBucket(rate=quota_per_sec)
+        self.cache       = cache
+        self.failures    = {}  # msg_id -> error message, for messages that could not be fetched
+        self._local      = threading.local()
+        self._local.service = self.service
+        self._pool       = ThreadPoolExecutor(max_workers=self.concurrency)
+
+    def _service(self):
+        """The Gmail resource for the calling thread (httplib2 is not thread-safe)."""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self._build()
+        return service
 
     def _authenticate(self):
         creds = None
@@ -31,8 +107,16 @@ class GmailFetcher:
                 creds = pickle.load(f)
 
         if not creds or not creds.valid:
+            interactive = (threading.current_thread() is threading.main_thread()
+                           and sys.stdin is not None and sys.stdin.isatty())
             if creds and creds.expired and creds.refresh_token:
                 creds.refresh(Request())
+            elif not interactive:
+                # e.g. api.py's background sync: nobody can paste a code, don't wait for one
+                raise RuntimeError(
+                    "Gmail authorization required — run `python load_and_store.py` in a terminal "
+                    "once to create token.pickle"
+                )
             else:
                 flow = InstalledAppFlow.from_client_secrets_file(
                     "credentials.json", self.SCOPES
@@ -55,16 +139,24 @@ class GmailFetcher:
             with open("token.pickle", "wb") as f:
                 pickle.dump(creds, f)
 
-        return build("gmail", "v1", credentials=creds)
+        return creds
+
+    def close(self):
+        """Stop the worker threads; the fetcher is not used afterwards."""
+        self._pool.shutdown(wait=True)
 
     def fetch_latest(self, max_emails=300):
         """Fetch the latest max_emails emails, newest first. Used for initial load."""
+        return [email for batch in self.iter_latest(max_emails) for email in batch]
+
+    def iter_latest(self, max_emails=300):
+        """Like fetch_latest, but yields one batch per listed page as it arrives."""
         print(f"Fetching latest {max_emails} emails (newest first)...")
-        emails     = []
+        fetched    = 0
         page_token = None
 
-        while len(emails) < max_emails:
-            fetch_size = min(100, max_emails - len(emails))
+        while fetched < max_emails:
+            fetch_size = min(100, max_emails - fetched)
             params = {
                 "userId": "me",
                 "maxResults": fetch_size,
@@ -73,28 +165,27 @@ class GmailFetcher:
             if page_token:
                 params["pageToken"] = page_token
 
-            results  = self.service.users().messages().list(**params).execute()
+            results  = self._list(params)
             messages = results.get("messages", [])
             if not messages:
                 break
 
-            for msg in messages:
-                if len(emails) >= max_emails:
-                    break
-                data = self._get_email_content(msg["id"])
-                if data:
-                    emails.append(data)
+            ids   = [msg["id"] for msg in messages][: max_emails - fetched]
+            batch = self._get_email_contents(ids)
+            fetched += len(batch)
+
+            print(f"  Fetched {fetched}/{max_emails}...")
+            yield batch
 
-            print(f"  Fetched {len(emails)}/{max_emails}...")
             page_token = results.get("nextPageToken")
-            if not page_token or len(emails) >= max_emails:
+            if not page_token or fetched >= max_emails:
                 break
 
-        print(f"Done. Total fetched: {len(emails)}")
-        return emails
+        print(f"Done. Total fetched: {fetched}")
 
-    def fetch_after(self, after_date_str, batch_size=100):
-        """Fetch emails after after_date_str (YYYY/MM/DD). Yields batches. Used for incremental sync."""
+    def fetch_after(self, after_date_str, batch_size=100, exclude_ids=()):
+        """Fetch emails after after_date_str (YYYY/MM/DD). Yields batches. Used for incremental sync.
+        Listed ids in exclude_ids are skipped before paying for the full-format fetch."""
         query         = f"after:{after_date_str}"
         page_token    = None
         total_fetched = 0
@@ -111,16 +202,13 @@ class GmailFetcher:
             if page_token:
                 params["pageToken"] = page_token
 
-            results  = self.service.users().messages().list(**params).execute()
+            results  = self._list(params)
             messages = results.get("messages", [])
             if not messages:
                 break
 
-            batch = []
-            for msg in messages:
-                data = self._get_email_content(msg["id"])
-                if data:
-                    batch.append(data)
+            ids   = [msg["id"] for msg in messages if msg["id"] not in exclude_ids]
+            batch = self._get_email_contents(ids)
 
             total_fetched += len(batch)
             print(f"  Fetched {total_fetched} new emails so far...")
@@ -132,91 +220,270 @@ class GmailFetcher:
 
         print(f"Done. Total new emails fetched: {total_fetched}")
 
-    def _get_email_content(self, msg_id):
-        try:
-            message = self.service.users().messages().get(
-                userId="me", id=msg_id, format="full"
-            ).execute()
+    def get_history_id(self):
+        """Current mailbox historyId — the cursor for the next fetch_history call."""
+        self.limiter.acquire(self.PROFILE_COST)
+        return self._service().users().getProfile(userId="me").execute()["historyId"]
+
+    def fetch_history(self, start_history_id):
+        """Mailbox changes since start_history_id.
+
+        Returns {"history_id", "added", "deleted", "labels", "restored"}: ids
+        added (newest first) and deleted since the cursor, the current labelIds of
+        messages whose labels changed, and which of those were taken out of
+        spam/trash. Messages moved to spam/trash count as deleted.
+        Raises HistoryExpired when Gmail no longer has history that far back.
+        """
+        state      = {}  # msg_id -> "added" | "deleted" | "labels", last change wins
+        labels     = {}
+        restored   = set()  # had SPAM / TRASH / DRAFT removed
+        page_token = None
+        history_id = start_history_id
 
-            headers = message["payload"]["headers"]
-            subject = next(
-                (h["value"] for h in headers if h["name"] == "Subject"), "No Subject"
-            )
-            sender = next(
-                (h["value"] for h in headers if h["name"] == "From"), "Unknown"
-            )
-            date = next(
-                (h["value"] for h in headers if h["name"] == "Date"), "Unknown"
-            )
+        while True:
+            params = {
+                "userId": "me",
+                "startHistoryId": start_history_id,
+                "historyTypes": ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
+                "maxResults": 500,
+            }
+            if page_token:
+                params["pageToken"] = page_token
+
+            self.limiter.acquire(self.HISTORY_COST)
+            try:
+                results = self._service().users().history().list(**params).execute()
+            except Exception as e:
+                if getattr(getattr(e, "resp", None), "status", None) in (404, "404"):
+                    raise HistoryExpired(f"historyId {start_history_id} has expired") from e
+                raise
+
+            for record in results.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    msg = item["message"]
+                    state[msg["id"]]  = "added"
+                    labels[msg["id"]] = msg.get("labelIds", [])
+                for item in record.get("messagesDeleted", []):
+                    state[item["message"]["id"]] = "deleted"
+                for item in record.get("labelsAdded", []) + record.get("labelsRemoved", []):
+                    msg = item["message"]
+                    labels[msg["id"]] = msg.get("labelIds", [])
+                    if state.get(msg["id"]) != "added":
+                        state[msg["id"]] = "labels"
+                for item in record.get("labelsRemoved", []):
+                    if self.EXCLUDED_LABELS.intersection(item.get("labelIds", [])):
+                        restored.add(item["message"]["id"])
+
+            history_id = results.get("historyId", history_id)
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+
+        added, deleted, changed, restored_ids = [], [], {}, []
+        for msg_id, change in state.items():
+            excluded = self.EXCLUDED_LABELS.intersection(labels.get(msg_id, []))
+            if change == "deleted" or (excluded and change == "labels"):
+                deleted.append(msg_id)
+            elif change == "added" and not excluded:
+                added.append(msg_id)
+            elif change == "labels":
+                changed[msg_id] = labels[msg_id]
+                if msg_id in restored:
+                    restored_ids.append(msg_id)
+
+        # History is chronological; callers expect newest first.
+        added.reverse()
+        restored_ids.reverse()
+        return {"history_id": history_id, "added": added, "deleted": deleted, "labels": changed,
+                "restored": restored_ids}
+
+    def list_ids(self):
+        """Every message id in the mailbox outside spam and trash — ids only, 500 per call."""
+        ids, page_token = [], None
+        while True:
+            params = {"userId": "me", "maxResults": 500, "includeSpamTrash": False}
+            if page_token:
+                params["pageToken"] = page_token
+            results = self._list(params)
+            ids    += [msg["id"] for msg in results.get("messages", [])]
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return ids
 
-            body_html = self._get_message_body(message["payload"], prefer_html=True)
-            body_text = self._get_message_body(message["payload"], prefer_html=False)
+    def fetch_messages(self, msg_ids, batch_size=100):
+        """Fetch the given ids in order. Yields batches like fetch_after."""
+        total_fetched = 0
+        for i in range(0, len(msg_ids), batch_size):
+            batch = self._get_email_contents(msg_ids[i : i + batch_size])
+            total_fetched += len(batch)
+            print(f"  Fetched {total_fetched}/{len(msg_ids)} new emails...")
+            yield batch
 
-            if body_html and "<html" in body_html.lower():
-                parsed_body = self._extract_text_from_html(body_html)
+    def _list(self, params):
+        self.limiter.acquire(self.LIST_COST)
+        return self._service().users().messages().list(**params).execute()
+
+    def _get_email_contents(self, msg_ids):
+        """Fetch and parse msg_ids concurrently, returning emails in msg_ids order.
+
+        Ids are split into up to `concurrency` batch requests of at most batch_size
+        that run on the worker pool, each drawing quota from the shared limiter.
+        Messages that hit a rate limit or a transient error are retried with
+        backoff; anything that still fails, or fails for good (404, bad request),
+        is recorded in self.failures and left out of the result.
+        """
+        results = {}
+        if self.cache is not None:
+            for msg_id in msg_ids:
+                email = self.cache.get(msg_id)
+                if email:
+                    results[msg_id] = email
+        to_fetch = [msg_id for msg_id in msg_ids if msg_id not in results]
+        if not to_fetch:
+            return [results[msg_id] for msg_id in msg_ids if msg_id in results]
+
+        per_worker = -(-len(to_fetch) // self.concurrency)
+        size       = max(1, min(self.batch_size, per_worker))
+        chunks     = [to_fetch[i : i + size] for i in range(0, len(to_fetch), size)]
+
+        for chunk_results in self._pool.map(self._fetch_chunk, chunks):
+            results.update(chunk_results)
+            if self.cache is not None:
+                self.cache.put_many(list(chunk_results.values()))
+        return [results[msg_id] for msg_id in msg_ids if msg_id in results]
+
+    def _fetch_chunk(self, msg_ids):
+        results = {}
+        pending = {msg_id: None for msg_id in msg_ids}  # msg_id -> last retryable error
+        for attempt in range(self.MAX_RETRIES + 1):
+            if not pending:
+                break
+            if attempt:
+                wait   = min(self.MAX_BACKOFF, 2 ** attempt) + random.random()
+                reason = ("Rate limited" if any(map(_is_rate_limited, pending.values()))
+                          else f"Transient error ({next(iter(pending.values()))})")
+                print(f"  {reason} on {len(pending)} emails. Backing off {wait:.1f}s...")
+                self.limiter.pause(wait)
+            self.limiter.acquire(self.GET_COST * len(pending))
+            pending = self._execute_batch(list(pending), results)
+
+        for msg_id, error in pending.items():
+            self._record_failure(msg_id, f"retries exhausted: {error}")
+        return results
+
+    def _execute_batch(self, msg_ids, results):
+        """Fetch msg_ids in one request, filling results. Returns {msg_id: error} for
+        the ids to retry; other failures are recorded in self.failures."""
+        retry   = {}
+        failed  = set()  # recorded by on_response during this call
+        service = self._service()
+
+        def on_response(msg_id, message, error):
+            if error is not None:
+                if _is_retryable(error):
+                    retry[msg_id] = error
+                else:
+                    failed.add(msg_id)
+                    self._record_failure(msg_id, error)
+                return
+            try:
+                results[msg_id] = self._parse_message(msg_id, message)
+                self.failures.pop(msg_id, None)
+            except Exception as e:
+                failed.add(msg_id)
+                self._record_failure(msg_id, e)
+
+        if len(msg_ids) == 1:
+            try:
+                message = service.users().messages().get(
+                    userId="me", id=msg_ids[0], format="full"
+                ).execute()
+            except Exception as e:
+                on_response(msg_ids[0], None, e)
             else:
-                parsed_body = body_text or body_html or ""
-
-            return {
-                "id": msg_id,
-                "subject": subject,
-                "from": sender,
-                "date": date,
-                "body": parsed_body,
-            }
+                on_response(msg_ids[0], message, None)
+            return retry
+
+        batch = service.new_batch_http_request(callback=on_response)
+        for msg_id in msg_ids:
+            batch.add(
+                service.users().messages().get(userId="me", id=msg_id, format="full"),
+                request_id=msg_id,
+            )
+        try:
+            batch.execute()
         except Exception as e:
-            print(f"  Error processing email {msg_id}: {e}")
-            return None
-
-    def _get_message_body(self, payload, prefer_html=True):
-        if "body" in payload and payload["body"].get("data"):
-            return base64.urlsafe_b64decode(
-                payload["body"]["data"]
-            ).decode("utf-8", errors="ignore")
-
-        if "parts" in payload:
-            html_content = None
-            text_content = None
-
-            for part in payload["parts"]:
-                if part["mimeType"] == "text/html" and "data" in part.get("body", {}):
-                    html_content = base64.urlsafe_b64decode(
-                        part["body"]["data"]
-                    ).decode("utf-8", errors="ignore")
-                elif part["mimeType"] == "text/plain" and "data" in part.get("body", {}):
-                    text_content = base64.urlsafe_b64decode(
-                        part["body"]["data"]
-                    ).decode("utf-8", errors="ignore")
-                elif "parts" in part:
-                    body = self._get_message_body(part, prefer_html)
-                    if body:
-                        return body
-
-            if prefer_html and html_content:
-                return html_content
-            elif text_content:
-                return text_content
-            elif html_content:
-                return html_content
-
-        return ""
-
-    def _extract_text_from_html(self, html_body):
-        if not html_body:
-            return ""
+            # The batch request itself failed; its answered parts are already in results
+            unanswered = [m for m in msg_ids if m not in results and m not in retry and m not in failed]
+            if _is_retryable(e):
+                return {**retry, **{msg_id: e for msg_id in unanswered}}
+            print(f"  Batch request failed: {e}")
+            for msg_id in unanswered:
+                self._record_failure(msg_id, e)
+        return retry
+
+    def _record_failure(self, msg_id, error):
+        self.failures[msg_id] = str(error)
+        print(f"  Error processing email {msg_id}: {error}")
 
-        if not BS4_AVAILABLE:
-            return self._simple_html_strip(html_body)
+    def _get_email_content(self, msg_id):
+        emails = self._get_email_contents([msg_id])
+        return emails[0] if emails else None
+
+    def _parse_message(self, msg_id, message):
+        headers = message["payload"]["headers"]
+        subject = next(
+            (h["value"] for h in headers if h["name"] == "Subject"), "No Subject"
+        )
+        sender = next(
+            (h["value"] for h in headers if h["name"] == "From"), "Unknown"
+        )
+        date = next(
+            (h["value"] for h in headers if h["name"] == "Date"), "Unknown"
+        )
+
+        body_html, body_text = self._get_message_bodies(message["payload"])
+
+        if body_html and _HTML_TAG.search(body_html):
+            parsed_body = self._extract_text_from_html(body_html)
+        else:
+            parsed_body = body_text or body_html or ""
+
+        return {
+            "id": msg_id,
+            "subject": subject,
+            "from": sender,
+            "date": date,
+            "body": parsed_body,
+            "labels": message.get("labelIds", []),
+        }
+
+    def _get_message_bodies(self, payload):
+        """Walk the MIME tree once and return (html, text): the first text/html and
+        text/plain bodies in document order, each base64-decoded at most once."""
+        if payload.get("body", {}).get("data"):
+            body = _decode_body(payload["body"]["data"])
+            return body, body
+
+        html_body = text_body = None
+        stack = list(reversed(payload.get("parts", [])))
+        while stack and (html_body is None or text_body is None):
+            part = stack.pop()
+            data = part.get("body", {}).get("data")
+            if part["mimeType"] == "text/html" and data:
+                if html_body is None:
+                    html_body = _decode_body(data)
+            elif part["mimeType"] == "text/plain" and data:
+                if text_body is None:
+                    text_body = _decode_body(data)
+            elif "parts" in part:
+                stack.extend(reversed(part["parts"]))
+
+        return html_body or "", text_body or ""
 
+    def _extract_text_from_html(self, html_body):
         try:
-            soup = BeautifulSoup(html_body, "html.parser")
-            for tag in soup(["script", "style", "head", "title", "meta", "link"]):
-                tag.decompose()
-
-            text = soup.get_text(separator=" ", strip=True)
-            text = re.sub(r"\s+", " ", text)
-            text = re.sub(r"\s([.,!?;:])", r"\1", text)
-            return text.strip()
+            return html_to_text(html_body)
         except Exception as e:
             print(f"  HTML parsing error: {e}")
             return self._simple_html_strip(html_body)
@@ -226,4 +493,4 @@ class GmailFetcher:
         text = re.sub(r"<style[^>]*>.*?</style>", "", text, flags=re.DOTALL | re.IGNORECASE)
         text = re.sub(r"<[^>]+>", "", text)
         text = re.sub(r"\s+", " ", text)
-        return text.strip()
\ No newline at end of file
+        return text.strip()
@@ -0,0 +1,158 @@
+"""
+email_splitter.py
+
+Email-aware chunker used by load_and_store.py in place of
+RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).
+
+  1. Cleans the body: drops quoted reply history ("> ..." lines, "On ... wrote:",
+     "-----Original Message-----", Outlook "From: ... Sent: ..." blocks),
+     signatures ("-- ", "Sent from my iPhone") and legal / unsubscribe footers.
+     Works on plain-text mail and on HTML mail already flattened to one line.
+  2. Packs paragraphs, then sentences, then words into chunks of at most
+     CHUNK_TOKENS tokens, so chunks fit the embedding model's input limit.
+  3. Repeats the Subject/From/Date header at the top of every chunk instead of
+     overlapping text between chunks.
+
+Tokens are counted with tiktoken's cl100k_base when it is available and
+estimated at ~4 characters per token otherwise.
+"""
+
+import re
+import threading
+
+CHUNK_TOKENS  = 400   # embed-english-v3.0 truncates inputs at 512 tokens
+MIN_KEEP_SIZE = 0.3   # never strip a footer that starts in the first 30% of the body
+
+_encoder      = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encoder = False  # not installed, or the BPE file can't be downloaded
+    return _encoder
+
+
+def count_tokens(text):
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4) if text else 0
+
+
+# ── Cleaning ───────────────────────────────────────────────────────────────────
+
+# Everything from one of these onwards is earlier thread history
+_REPLY_HEADERS = re.compile(
+    r"(?:^|\s)On\s[^\n]{6,200}?\swrote:"
+    r"|-{2,}\s*Original Message\s*-{2,}"
+    r"|\bFrom:\s[^\n]{1,200}?\sSent:\s[^\n]{1,200}?\sTo:\s"
+    r"|_{10,}\s*From:\s",
+    re.IGNORECASE,
+)
+_QUOTED_LINE = re.compile(r"^[ \t]*>.*(?:\n|$)", re.MULTILINE)
+_SIGNATURE   = re.compile(
+    r"^-- ?$"
+    r"|\bSent from my (?:iPhone|iPad|Android|Samsung|mobile device|Galaxy)\b"
+    r"|\bGet Outlook for (?:iOS|Android)\b",
+    re.IGNORECASE | re.MULTILINE,
+)
+_FOOTERS = re.compile(
+    r"\bconfidentiality notice\b"
+    r"|\bthis (?:e-?mail|message)(?: and any attachments?)? (?:is|are|may be) (?:strictly )?(?:confidential|privileged)"
+    r"|\bif you are not the intended recipient\b"
+    r"|\byou (?:are )?received this (?:e-?mail|message) because\b"
+    r"|\byou(?:'re| are) receiving this (?:e-?mail|message)\b"
+    r"|\bto unsubscribe\b"
+    r"|\bunsubscribe\s*\|"
+    r"|\bmanage (?:your )?(?:email )?preferences\b",
+    re.IGNORECASE,
+)
+_BLANK_LINES = re.compile(r"\n\s*\n")
+_SENTENCES   = re.compile(r"(?<=[.!?])\s+")
+
+
+def _cut_from(text, pattern, min_keep):
+    """Truncate text at the first match of pattern that starts at or after min_keep."""
+    for match in pattern.finditer(text):
+        if match.start() >= min_keep:
+            return text[: match.start()]
+    return text
+
+
+def clean_body(body):
+    """Body with quoted history, signatures and footers removed. Falls back to the
+    original when cleaning would leave nothing (e.g. a pure forward)."""
+    text = body.replace("\r\n", "\n")
+    text = _cut_from(text, _REPLY_HEADERS, 1)
+    text = _QUOTED_LINE.sub("", text)
+    text = _cut_from(text, _SIGNATURE, 1)
+    text = _cut_from(text, _FOOTERS, int(len(text) * MIN_KEEP_SIZE))
+    text = text.strip()
+    return text or body.strip()
+
+
+# ── Splitting ──────────────────────────────────────────────────────────────────
+
+def _units(text, budget):
+    """Yield (separator, text, tokens) pieces of at most `budget` tokens: paragraphs,
+    then sentences of over-long paragraphs, then word runs of over-long sentences.
+    separator is what joins the piece to the one before it."""
+    for paragraph in _BLANK_LINES.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens <= budget:
+            yield "\n\n", paragraph, tokens
+            continue
+        separator = "\n\n"
+        for sentence in _SENTENCES.split(paragraph):
+            tokens = count_tokens(sentence)
+            if tokens <= budget:
+                yield separator, sentence, tokens
+                separator = " "
+                continue
+            words = sentence.split()
+            step  = max(1, len(words) * budget // tokens)
+            for i in range(0, len(words), step):
+                piece = " ".join(words[i : i + step])
+                yield separator, piece, count_tokens(piece)
+                separator = " "
+
+
+class EmailTextSplitter:
+    def __init__(self, chunk_tokens=CHUNK_TOKENS):
+        self.chunk_tokens = chunk_tokens
+
+    def split_email(self, header, body):
+        """Chunks of "header\\n\\n<part of the cleaned body>", each within chunk_tokens."""
+        budget = max(32, self.chunk_tokens - count_tokens(header) - 2)
+        chunks, text, size = [], "", 0
+        for separator, unit, tokens in _units(clean_body(body), budget):
+            if text and size + tokens > budget:
+                chunks.append(text)
+                text, size = "", 0
+            text  = f"{text}{separator}{unit}" if text else unit
+            size += tokens + 1
+        if text or not chunks:
+            chunks.append(text)
+        return [f"{header}\n\n{text}" if text else header for text in chunks]
+
+    def split_documents(self, documents):
+        """Split Documents laid out as "<header lines>\\n\\n<body>" (see emails_to_documents);
+        every chunk keeps a copy of its document's metadata."""
+        from langchain_core.documents import Document  # only sync splits; api.py just counts tokens
+
+        chunks = []
+        for doc in documents:
+            header, _, body = doc.page_content.partition("\n\n")
+            for text in self.split_email(header, body):
+                chunks.append(Document(page_content=text, metadata=dict(doc.metadata)))
+        return chunks
@@ -0,0 +1,101 @@
+"""
+embed_cache.py
+
+Local cache of chunk embeddings, so byte-identical (or whitespace-only
+different) chunks from newsletters, receipts and notifications are sent to
+the embedding provider once.
+
+Entries are keyed by sha256(model name + normalized chunk text) and stored
+as float32 blobs in SQLite. Past max_entries the least recently used
+entries are evicted.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+EMBED_CACHE_PATH    = "./embed_cache.db"
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    return _SPACES.sub(" ", text).strip()
+
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model, path=EMBED_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.model       = model
+        self.max_entries = max_entries
+        self.hits        = 0
+        self.misses      = 0
+        self._lock       = threading.Lock()
+        self._conn       = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        # Row count is read once and then kept in memory, so puts don't scan the table
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def get_many(self, texts):
+        """Cached vectors for texts, None where missing. Refreshes LRU order of hits."""
+        keys = [cache_key(self.model, t) for t in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                self._conn.commit()
+
+        vectors = [list(array("f", found[k])) if k in found else None for k in keys]
+        hits = sum(v is not None for v in vectors)
+        self.hits   += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, texts, vectors):
+        now  = time.time()
+        rows = [(cache_key(self.model, t), array("f", v).tobytes(), now) for t, v in zip(texts, vectors)]
+        with self._lock:
+            added = self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows).rowcount
+            if added < len(rows):
+                self._conn.executemany(
+                    "UPDATE embeddings SET vector = ?, last_used = ? WHERE key = ?",
+                    [(vector, used, key) for key, vector, used in rows],
+                )
+            self._count += added
+            if self._count > self.max_entries:
+                self._count -= self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (self._count - self.max_entries,),
+                ).rowcount
+            self._conn.commit()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self):
+        self._conn.close()
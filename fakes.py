@@ -0,0 +1,621 @@
+"""
+fakes.py
+
+Local stand-ins for external services, so fetch code can be exercised
+without Gmail credentials or network access.
+
+  FakeGmailService — mimics the googleapiclient Gmail resource used by
+                     GmailFetcher: messages().list/get, batch requests,
+                     getProfile and history().list, with optional latency
+                     and per-user quota.
+  SyntheticGmailService — a FakeGmailService over a generated mailbox of any
+                     size (synthetic_message: newsletters, threads, receipts,
+                     invoices with attachments).
+  newsletter_html  — synthetic HTML newsletter bodies for benchmarks.
+  reply_thread_text — synthetic plain-text replies with quoted history.
+  FakeEmbeddings   — offline embedding provider (EMBEDDINGS_PROVIDER=fake) with
+                     Cohere-like batch limits, latency and 429s.
+  FakeChatModel    — offline chat model (LLM_PROVIDER=fake) with configurable
+                     latency that answers from the Subject lines in its prompt.
+
+Usage:
+  service = FakeGmailService([make_message("m1", "Hi", "a@b.com", date, "body")])
+  fetcher = GmailFetcher(service=service)
+"""
+
+import asyncio
+import base64
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+# ── Errors ─────────────────────────────────────────────────────────────────────
+
+class _FakeResp(dict):
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = ""
+
+
+class FakeHttpError(Exception):
+    """Looks like googleapiclient.errors.HttpError to code that inspects resp.status."""
+
+    def __init__(self, status, reason=""):
+        super().__init__(f"<HttpError {status}: {reason}>")
+        self.resp   = _FakeResp(status)
+        self.reason = reason
+
+
+class FakeRateLimitError(Exception):
+    """Looks like a Cohere 429 ApiError: status_code and a Retry-After header."""
+
+    def __init__(self, retry_after):
+        super().__init__("status_code: 429, body: too many requests")
+        self.status_code = 429
+        self.headers     = {"retry-after": f"{retry_after:.2f}"}
+
+
+# ── Message builder ────────────────────────────────────────────────────────────
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def make_message(msg_id, subject, sender, date, text=None, html=None, labels=("INBOX",)):
+    """Build a Gmail format="full" message. date may be a datetime or an RFC 2822 string."""
+    date_str = date if isinstance(date, str) else format_datetime(date)
+    headers  = [
+        {"name": "Subject", "value": subject},
+        {"name": "From", "value": sender},
+        {"name": "Date", "value": date_str},
+    ]
+    parts = []
+    if text is not None:
+        parts.append({"mimeType": "text/plain", "body": {"data": _b64(text)}})
+    if html is not None:
+        parts.append({"mimeType": "text/html", "body": {"data": _b64(html)}})
+
+    payload = {"mimeType": "multipart/alternative", "headers": headers, "parts": parts}
+    return {
+        "id": msg_id,
+        "labelIds": list(labels),
+        "internalDate": str(int(parsedate_to_datetime(date_str).timestamp() * 1000)),
+        "payload": payload,
+    }
+
+
+_WORDS = (
+    "update account order shipped invoice meeting weekly report offer team project "
+    "review payment receipt delivery schedule launch feature release security notice "
+    "reminder subscription newsletter discount event webinar summary thanks please"
+).split()
+
+
+def _sentence(rng, n=12):
+    return " ".join(rng.choice(_WORDS) for _ in range(n)).capitalize() + "."
+
+
+def newsletter_html(seed, sections=6):
+    """A table-heavy marketing-style HTML email with inline CSS, a style block,
+    tracking script, entities and a footer — the shape that dominates real inboxes."""
+    rng  = random.Random(seed)
+    rows = []
+    for i in range(sections):
+        rows.append(
+            f'<tr><td style="padding:12px 24px;font-family:Arial,sans-serif;color:#333">'
+            f'<h2 style="margin:0 0 8px;font-size:18px">{_sentence(rng, 5)}</h2>'
+            f'<p style="margin:0;line-height:1.5">{_sentence(rng)} {_sentence(rng)} &amp; '
+            f'{_sentence(rng, 8)}</p>'
+            f'<a href="https://example.com/track?u={seed}&amp;s={i}" '
+            f'style="display:inline-block;background:#0a66c2;color:#fff;padding:8px 16px">'
+            f'Read more&nbsp;&rarr;</a></td></tr>'
+        )
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Newsletter</title>"
+        "<style>body{margin:0;padding:0}.btn{color:#fff}@media(max-width:600px){td{padding:8px}}</style>"
+        "</head><body><!-- preheader --><div style='display:none'>Preview text</div>"
+        "<table width='100%' cellpadding='0' cellspacing='0' role='presentation'>"
+        + "".join(rows)
+        + "<tr><td style='font-size:11px;color:#999'>You received this email because you subscribed. "
+        "<a href='https://example.com/unsubscribe'>Unsubscribe</a> &copy; 2026 Example Inc.</td></tr>"
+        "</table><script>(function(){var i=new Image();i.src='https://t.example.com/o.gif';})();</script>"
+        "<img src='https://t.example.com/open.gif' width='1' height='1' alt=''></body></html>"
+    )
+
+
+
+def reply_thread_text(seed, depth=4, paragraphs=2):
+    """A plain-text reply at the bottom of a `depth`-message thread: each earlier
+    message is quoted below an "On ... wrote:" line, with signatures and a legal
+    footer, the way mail clients build long conversations."""
+    rng  = random.Random(seed)
+    text = ""
+    for level in range(depth):
+        body = "\n\n".join(" ".join(_sentence(rng) for _ in range(4)) for _ in range(paragraphs))
+        message = (
+            f"Hi,\n\n{body}\n\nThanks,\nPerson {level}\n-- \nPerson {level} | Example Inc.\n"
+            "This email and any attachments are confidential. If you are not the intended "
+            "recipient, please delete it.\n"
+        )
+        if text:
+            quoted  = "\n".join("> " + line for line in text.splitlines())
+            message += f"\nOn Mon, 5 Oct 2026 at 09:{level:02d}, Person {level - 1} <p{level - 1}@example.com> wrote:\n{quoted}\n"
+        text = message
+    return text
+
+# ── Gmail service ──────────────────────────────────────────────────────────────
+
+class _Request:
+    def __init__(self, service, fn):
+        self._service = service
+        self._fn      = fn
+
+    def execute(self):
+        self._service._round_trip()
+        return self._fn()
+
+
+class _Batch:
+    def __init__(self, service, callback):
+        self._service  = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if len(self._requests) >= FakeGmailService.BATCH_LIMIT:
+            raise ValueError("Exceeded maximum number of requests per batch.")
+        request_id = request_id or str(len(self._requests))
+        self._requests.append((request_id, request, callback or self._callback))
+
+    def execute(self):
+        self._service.batch_calls += 1
+        self._service._round_trip()  # one HTTP request for the whole batch
+        for request_id, request, callback in self._requests:
+            try:
+                response, error = request._fn(), None
+            except Exception as e:
+                response, error = None, e
+            callback(request_id, response, error)
+
+
+class _Messages:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId="me", maxResults=100, pageToken=None, q=None, includeSpamTrash=False):
+        return _Request(self._service, lambda: self._service._list(maxResults, pageToken, q))
+
+    def get(self, userId="me", id=None, format="full"):
+        return _Request(self._service, lambda: self._service._get(id))
+
+
+class _History:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId="me", startHistoryId=None, historyTypes=None, maxResults=100, pageToken=None):
+        return _Request(self._service, lambda: self._service._history(int(startHistoryId), maxResults, pageToken))
+
+
+class _Users:
+    def __init__(self, service):
+        self._service = service
+
+    def messages(self):
+        return _Messages(self._service)
+
+    def history(self):
+        return _History(self._service)
+
+    def getProfile(self, userId="me"):
+        return _Request(
+            self._service, lambda: {"emailAddress": "me@example.com", "historyId": str(self._service.history_id)}
+        )
+
+
+class FakeGmailService:
+    """In-memory mailbox. messages are format="full" dicts, kept newest first.
+
+    fail_ids        : ids whose get() raises a 404
+    rate_limit_ids  : ids whose first get() raises a 429, succeeding on retry
+    latency         : seconds per HTTP request (a batch request is one)
+    quota_per_sec   : per-user quota units per second (list and get cost 5, as in
+                      Gmail); over it, calls raise 429 rateLimitExceeded
+    """
+
+    BATCH_LIMIT = 100
+    CALL_COST   = 5
+
+    def __init__(self, messages=(), fail_ids=(), rate_limit_ids=(), latency=0.0, quota_per_sec=None):
+        self.messages       = sorted(messages, key=lambda m: int(m["internalDate"]), reverse=True)
+        self.fail_ids       = set(fail_ids)
+        self.rate_limit_ids = set(rate_limit_ids)
+        self.latency        = latency
+        self.quota_per_sec  = quota_per_sec
+        self.get_calls      = 0
+        self.list_calls     = 0
+        self.batch_calls    = 0
+        self.rate_limited   = 0
+        self._spent         = deque()  # (time, units) charged in the last second
+        self._lock          = threading.Lock()
+        self._by_id         = {m["id"]: m for m in self.messages}
+        self.history_id     = 1000
+        self.history        = []   # history records, oldest first
+        self.history_floor  = self.history_id
+
+    # ── Mailbox changes (recorded in history) ──────────────────────────────────
+
+    def _record(self, **change):
+        self.history_id += 1
+        self.history.append({"id": str(self.history_id), **change})
+
+    def add_message(self, message):
+        self.messages.append(message)
+        self.messages.sort(key=lambda m: int(m["internalDate"]), reverse=True)
+        self._by_id[message["id"]] = message
+        ref = {"id": message["id"], "threadId": message["id"], "labelIds": message["labelIds"]}
+        self._record(messagesAdded=[{"message": ref}])
+
+    def delete_message(self, msg_id):
+        self.messages = [m for m in self.messages if m["id"] != msg_id]
+        self._by_id.pop(msg_id, None)
+        self._record(messagesDeleted=[{"message": {"id": msg_id, "threadId": msg_id}}])
+
+    def modify_labels(self, msg_id, add=(), remove=()):
+        message = self._by_id[msg_id]
+        message["labelIds"] = [l for l in message["labelIds"] if l not in remove] + list(add)
+        ref = {"id": msg_id, "threadId": msg_id, "labelIds": message["labelIds"]}
+        if add:
+            self._record(labelsAdded=[{"message": ref, "labelIds": list(add)}])
+        if remove:
+            self._record(labelsRemoved=[{"message": ref, "labelIds": list(remove)}])
+
+    def expire_history(self):
+        """Make every historyId issued so far too old, as Gmail does after about a week."""
+        self.history_floor = self.history_id + 1
+
+    def users(self):
+        return _Users(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _charge(self, units):
+        """Spend quota units, or raise a 429 when the last second's quota is used up."""
+        if not self.quota_per_sec:
+            return
+        with self._lock:
+            now = time.monotonic()
+            while self._spent and now - self._spent[0][0] >= 1.0:
+                self._spent.popleft()
+            if sum(u for _, u in self._spent) + units > self.quota_per_sec:
+                self.rate_limited += 1
+                raise FakeHttpError(429, "rateLimitExceeded")
+            self._spent.append((now, units))
+
+    def _list(self, max_results, page_token, q):
+        self._charge(self.CALL_COST)
+        self.list_calls += 1
+        matching = self.messages
+        if q and q.startswith("after:"):
+            cutoff   = _after_cutoff_ms(q[len("after:"):])
+            matching = [m for m in matching if int(m["internalDate"]) > cutoff]
+
+        start = int(page_token or 0)
+        page  = matching[start : start + max_results]
+        result = {
+            "messages": [{"id": m["id"], "threadId": m["id"]} for m in page],
+            "resultSizeEstimate": len(page),
+        }
+        if start + max_results < len(matching):
+            result["nextPageToken"] = str(start + max_results)
+        return result
+
+    def _history(self, start_history_id, max_results, page_token):
+        if start_history_id < self.history_floor:
+            raise FakeHttpError(404, "Requested entity was not found.")
+        records = [r for r in self.history if int(r["id"]) > start_history_id]
+        start   = int(page_token or 0)
+        result  = {"history": records[start : start + max_results], "historyId": str(self.history_id)}
+        if start + max_results < len(records):
+            result["nextPageToken"] = str(start + max_results)
+        return result
+
+    def _get(self, msg_id):
+        self._charge(self.CALL_COST)
+        self.get_calls += 1
+        if msg_id in self.rate_limit_ids:
+            self.rate_limit_ids.discard(msg_id)
+            raise FakeHttpError(429, "rateLimitExceeded")
+        if msg_id in self.fail_ids:
+            raise FakeHttpError(404, "Requested entity was not found.")
+        if msg_id in self._by_id:
+            return self._by_id[msg_id]
+        raise FakeHttpError(404, "Requested entity was not found.")
+
+
+def _after_cutoff_ms(date_str):
+    return int(datetime.strptime(date_str, "%Y/%m/%d").timestamp() * 1000)
+
+
+# ── Synthetic mailbox ──────────────────────────────────────────────────────────
+
+_PEOPLE      = ["Priya Raman", "Tom Becker", "Ana Costa", "Wei Zhang", "Sam Okafor", "Lena Fischer", "Raj Patel", "Mia Novak"]
+_NEWSLETTERS = [("The Weekly Digest", "digest@news.example.com"), ("Product Updates", "updates@saas.example.io"),
+                ("Deals Daily", "deals@shop.example.com"), ("Dev Roundup", "hello@devroundup.example.org")]
+_VENDORS     = ["Acme Cloud", "Paperclip Office", "Northwind Travel", "Globex Energy"]
+_PROJECTS    = ["Atlas", "Beacon", "Cobalt", "Delta", "Ember", "Falcon"]
+_KINDS       = ["newsletter"] * 7 + ["thread"] * 6 + ["receipt"] * 4 + ["invoice"] * 3
+
+
+def _part(mime_type, text):
+    return {"mimeType": mime_type, "body": {"data": _b64(text), "size": len(text)}}
+
+
+def _synthetic_date(index, seed, now, days):
+    rng = random.Random(f"date-{seed}-{index}")
+    return now - timedelta(seconds=rng.uniform(0, days * 86400))
+
+
+def synthetic_message(index, seed=0, now=None, days=365):
+    """Message `index` of a deterministic synthetic mailbox, as Gmail format="full".
+
+    A mix of what real inboxes hold: HTML newsletters with a plain-text
+    alternative, plain-text reply threads with quoted history, templated
+    HTML-only shipping receipts (near-duplicates of each other) and invoices
+    with a PDF attachment inside multipart/mixed. Dates are spread over the
+    `days` before `now`.
+    """
+    now  = now or datetime.now().astimezone()
+    rng  = random.Random(f"msg-{seed}-{index}")
+    kind = rng.choice(_KINDS)
+    date = format_datetime(_synthetic_date(index, seed, now, days))
+    labels = ["INBOX"] + (["UNREAD"] if rng.random() < 0.3 else [])
+
+    if kind == "newsletter":
+        name, address = rng.choice(_NEWSLETTERS)
+        subject = f"{name}: {_sentence(rng, 5)[:-1]}"
+        sender  = f"{name} <{address}>"
+        text    = "\n\n".join(_sentence(rng) for _ in range(4)) + "\n\nUnsubscribe: https://example.com/u"
+        payload = {"mimeType": "multipart/alternative", "parts": [
+            _part("text/plain", text), _part("text/html", newsletter_html(rng.randrange(10**6))),
+        ]}
+        labels.append("CATEGORY_PROMOTIONS")
+    elif kind == "thread":
+        person  = rng.choice(_PEOPLE)
+        subject = f"Re: {rng.choice(_PROJECTS)} {rng.choice(_WORDS)} {rng.choice(_WORDS)}"
+        sender  = f"{person} <{person.split()[0].lower()}@example.com>"
+        payload = {"mimeType": "text/plain", "body": {"data": _b64(
+            reply_thread_text(rng.randrange(10**6), depth=rng.randint(1, 5), paragraphs=rng.randint(1, 3))
+        )}}
+        if rng.random() < 0.2:
+            labels.append("IMPORTANT")
+    elif kind == "receipt":
+        order   = rng.randint(10000, 99999)
+        items   = "".join(
+            f"<tr><td>{rng.choice(_WORDS).capitalize()} {rng.choice(_WORDS)}</td><td>${rng.randint(5, 200)}.99</td></tr>"
+            for _ in range(rng.randint(1, 4))
+        )
+        subject = f"Your order #{order} has shipped"
+        sender  = "ShopCo <orders@shop.example.com>"
+        html    = (
+            "<html><body style='font-family:Arial'><h1>Good news!</h1>"
+            f"<p>Your order <b>#{order}</b> is on its way and should arrive in {rng.randint(2, 6)} days.</p>"
+            f"<table>{items}</table><p>Track your package at https://shop.example.com/track/{order}</p>"
+            "<p style='font-size:11px;color:#999'>ShopCo Inc. &copy; 2026. You are receiving this email "
+            "because you placed an order.</p></body></html>"
+        )
+        payload = {"mimeType": "text/html", "body": {"data": _b64(html), "size": len(html)}}
+        labels.append("CATEGORY_UPDATES")
+    else:
+        vendor  = rng.choice(_VENDORS)
+        number  = f"INV-{rng.randint(10000, 99999)}"
+        amount  = f"${rng.randint(20, 5000)}.{rng.randint(0, 99):02d}"
+        subject = f"Invoice {number} from {vendor}"
+        sender  = f"{vendor} Billing <billing@{vendor.split()[0].lower()}.example.com>"
+        text    = (f"Hello,\n\nInvoice {number} for {amount} is attached and due in 30 days.\n\n"
+                   f"{_sentence(rng)}\n\nThanks,\n{vendor} Billing")
+        payload = {"mimeType": "multipart/mixed", "parts": [
+            {"mimeType": "multipart/alternative", "parts": [
+                _part("text/plain", text), _part("text/html", "<html><body><p>" + text.replace("\n", "<br>") + "</p></body></html>"),
+            ]},
+            {"mimeType": "application/pdf", "filename": f"{number}.pdf",
+             "body": {"attachmentId": f"att-{index}", "size": rng.randint(20000, 400000)}},
+        ]}
+
+    payload["headers"] = [
+        {"name": "Subject", "value": subject},
+        {"name": "From", "value": sender},
+        {"name": "To", "value": "me@example.com"},
+        {"name": "Date", "value": date},
+        {"name": "Message-ID", "value": f"<{seed}.{index}@synthetic.example.com>"},
+    ]
+    return {
+        "id": f"syn{index}",
+        "labelIds": labels,
+        "internalDate": str(int(parsedate_to_datetime(date).timestamp() * 1000)),
+        "payload": payload,
+    }
+
+
+class SyntheticGmailService(FakeGmailService):
+    """FakeGmailService over a synthetic mailbox of `count` messages (see
+    synthetic_message), built on each get() so 100k-message mailboxes fit in memory."""
+
+    def __init__(self, count, seed=0, now=None, days=365, **kwargs):
+        self.seed, self.days = seed, days
+        self.now = now or datetime.now().astimezone()
+        stubs = [
+            {"id": f"syn{i}", "labelIds": ["INBOX"],
+             "internalDate": str(int(_synthetic_date(i, seed, self.now, days).timestamp()) * 1000)}
+            for i in range(count)
+        ]
+        super().__init__(stubs, **kwargs)
+
+    def _get(self, msg_id):
+        message = super()._get(msg_id)
+        if "payload" in message:
+            return message
+        return synthetic_message(int(msg_id[3:]), self.seed, self.now, self.days)
+
+
+# ── Embeddings ─────────────────────────────────────────────────────────────────
+
+_TOKENS = re.compile(r"\w+")
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words vectors, so retrieval over them is still
+    roughly topical. Mimics the provider's limits:
+
+    max_batch        : texts per call (96 for Cohere embed v3); more raises ValueError
+    latency          : seconds per call, plus per_text_latency per text
+    calls_per_minute : sliding-window call limit; over it raises FakeRateLimitError
+    """
+
+    model = "fake-embeddings"
+
+    def __init__(self, dim=1024, max_batch=96, latency=0.0, per_text_latency=0.0, calls_per_minute=None):
+        self.dim              = dim
+        self.max_batch        = max_batch
+        self.latency          = latency
+        self.per_text_latency = per_text_latency
+        self.calls_per_minute = calls_per_minute
+        self.calls            = 0
+        self.texts            = 0
+        self.rate_limited     = 0
+        self._recent          = deque()
+        self._lock            = threading.Lock()
+
+    def _vector(self, text):
+        vector = [0.0] * self.dim
+        for token in _TOKENS.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+            vector[h % self.dim] += 1.0 if h >> 63 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _call(self, texts):
+        """Vectors for texts and the simulated latency the caller should wait."""
+        if len(texts) > self.max_batch:
+            raise ValueError(f"invalid request: texts must contain at most {self.max_batch} items")
+        with self._lock:
+            now = time.monotonic()
+            if self.calls_per_minute:
+                while self._recent and now - self._recent[0] >= 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.calls_per_minute:
+                    self.rate_limited += 1
+                    raise FakeRateLimitError(60 - (now - self._recent[0]))
+                self._recent.append(now)
+            self.calls += 1
+            self.texts += len(texts)
+        return [self._vector(t) for t in texts], self.latency + self.per_text_latency * len(texts)
+
+    def embed_documents(self, texts):
+        vectors, delay = self._call(list(texts))
+        time.sleep(delay)
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        # Waits on the event loop, like an async HTTP client
+        vectors, delay = self._call(list(texts))
+        await asyncio.sleep(delay)
+        return vectors
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    async def aembed(self, texts, *, input_type=None):
+        # CohereEmbeddings.aembed: several queries in one call with input_type="search_query"
+        return await self.aembed_documents(texts)
+
+
+# ── Chat model ─────────────────────────────────────────────────────────────────
+
+_SUBJECT = re.compile(r"^Subject: (.*)$", re.MULTILINE)
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers "Found N emails: <subjects>" from the Subject lines in the prompt.
+
+    latency       : seconds before the first token (time.sleep / asyncio.sleep)
+    token_latency : seconds per token after that; non-streaming calls wait for all of them
+
+    Reports usage_metadata (prompt tokens estimated) like ChatOpenAI, so token metrics work offline.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _answer(self, messages):
+        self.calls += 1
+        subjects = list(dict.fromkeys(_SUBJECT.findall(messages[-1].content)))
+        if not subjects:
+            return "I couldn't find any matching emails."
+        return f"Found {len(subjects)} emails: " + "; ".join(subjects[:10]) + "."
+
+    def _tokens(self, messages):
+        return re.findall(r"\S+\s*", self._answer(messages))
+
+    @staticmethod
+    def _usage(messages, tokens):
+        # Like OpenAI's usage: prompt tokens estimated at ~4 characters each
+        prompt = sum(len(m.content) for m in messages) // 4
+        return {"input_tokens": prompt, "output_tokens": len(tokens), "total_tokens": prompt + len(tokens)}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        time.sleep(self.latency + self.token_latency * len(tokens))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(tokens))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        time.sleep(self.latency)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_latency)
+            usage = self._usage(messages, tokens) if i == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            usage = self._usage(messages, tokens) if i == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
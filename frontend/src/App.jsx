@@ -5,14 +5,14 @@ import useApi from './hooks/useApi'
 import './styles/App.css'
 
 export default function App() {
-  const { status, vectorCount, query } = useApi()
+  const { status, vectorCount, queryStream } = useApi()
   const [messages, setMessages] = useState([])
 
   function handleSuggestion(question) {
     // Add user message then immediately trigger query
     const id = Date.now()
     setMessages(prev => [...prev, { role: 'user', text: question, id }])
-    fireQuery(question, query, setMessages)
+    fireQuery(question, queryStream, setMessages)
   }
 
   function clearChat() {
@@ -32,26 +32,37 @@ export default function App() {
         setMessages={setMessages}
         onClear={clearChat}
         apiStatus={status}
-        query={query}
+        query={queryStream}
       />
     </div>
   )
 }
 
-export async function fireQuery(text, query, setMessages) {
+export async function fireQuery(text, queryStream, setMessages) {
+  // The bot message appears once sources arrive and fills in as tokens stream
+  const id  = Date.now() + 1
+  let added = false
+  function show(fields) {
+    const exists = added
+    added = true
+    setMessages(prev => exists
+      ? prev.map(m => (m.id === id ? { ...m, ...fields } : m))
+      : [...prev, { role: 'bot', id, ...fields }])
+  }
+
   try {
-    const data = await query(text)
-    setMessages(prev => [...prev, {
-      role: 'bot',
-      text: data.answer,
-      sources: data.sources,
-      id: Date.now(),
-    }])
-  } catch {
-    setMessages(prev => [...prev, {
-      role: 'bot',
-      text: '⚠ Could not reach the API. Is uvicorn running on port 8000?',
-      id: Date.now(),
-    }])
+    const data = await queryStream(text, {
+      onSources: sources => show({ text: '', sources, streaming: true }),
+      onToken:   answer  => show({ text: answer, streaming: true }),
+    })
+    show({ text: data.answer, sources: data.sources, streaming: false })
+  } catch (err) {
+    show({
+      text: err.fromServer
+        ? `⚠ ${err.message || 'The API could not answer this question.'}`
+        : '⚠ Could not reach the API. Is uvicorn running on port 8000?',
+      sources: [],
+      streaming: false,
+    })
   }
 }
\ No newline at end of file
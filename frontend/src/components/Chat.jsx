@@ -40,7 +40,8 @@ export default function Chat({ messages, setMessages, onClear, apiStatus, query
     }
   }
 
-  const isEmpty = messages.length === 0 && !loading
+  const isEmpty   = messages.length === 0 && !loading
+  const streaming = messages[messages.length - 1]?.streaming
 
   return (
     <main className={styles.main}>
@@ -66,7 +67,7 @@ export default function Chat({ messages, setMessages, onClear, apiStatus, query
             {messages.map(msg => (
               <Message key={msg.id} {...msg} />
             ))}
-            {loading && (
+            {loading && !streaming && (
               <div className={styles.typingWrap}>
                 <div className={styles.typingIndicator}>
                   <span /><span /><span />
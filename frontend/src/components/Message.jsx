@@ -1,7 +1,7 @@
 import { useState } from 'react'
 import styles from '../styles/Message.module.css'
 
-export default function Message({ role, text, sources = [] }) {
+export default function Message({ role, text, sources = [], streaming = false }) {
   const [copied,       setCopied]       = useState(false)
   const [showSources,  setShowSources]  = useState(false)
 
@@ -16,9 +16,10 @@ export default function Message({ role, text, sources = [] }) {
     <div className={`${styles.message} ${styles[role]}`}>
       <div className={styles.bubble}>
         {text}
+        {streaming && <span className={styles.cursor} />}
       </div>
 
-      {role === 'bot' && (
+      {role === 'bot' && !streaming && (
         <div className={styles.meta}>
           {/* Copy button */}
           <button
@@ -3,6 +3,12 @@ import axios from 'axios'
 
 const BASE = '/api'
 
+function serverError(detail) {
+  const error = new Error(typeof detail === 'string' ? detail : JSON.stringify(detail))
+  error.fromServer = true
+  return error
+}
+
 export default function useApi() {
   const [status, setStatus]           = useState('connecting')
   const [vectorCount, setVectorCount] = useState(null)
@@ -21,5 +27,51 @@ export default function useApi() {
     return data // { question, answer, sources }
   }
 
-  return { status, vectorCount, query }
+  // Server-sent events from /query/stream: onSources(sources) once retrieval is
+  // done, onToken(answerSoFar) as tokens arrive. Resolves like query(); errors
+  // the API reported itself are thrown with fromServer set.
+  async function queryStream(question, { onSources, onToken } = {}, k = 5) {
+    const res = await fetch(`${BASE}/query/stream`, {
+      method:  'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body:    JSON.stringify({ question, k }),
+    })
+    if (!res.ok || !res.body) {
+      const detail = await res.json().then(body => body.detail, () => null)
+      throw detail ? serverError(detail) : new Error(`HTTP ${res.status}`)
+    }
+
+    const reader  = res.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = '', answer = '', sources = []
+
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      let end
+      while ((end = buffer.indexOf('\n\n')) !== -1) {
+        const frame = buffer.slice(0, end)
+        buffer      = buffer.slice(end + 2)
+        const event = frame.match(/^event: (.*)$/m)?.[1]
+        const data  = JSON.parse(frame.match(/^data: (.*)$/m)?.[1] ?? '{}')
+
+        if (event === 'sources') {
+          sources = data.sources
+          onSources?.(sources)
+        } else if (event === 'token') {
+          answer += data.text
+          onToken?.(answer)
+        } else if (event === 'done') {
+          answer = data.answer
+        } else if (event === 'error') {
+          throw serverError(data.detail)
+        }
+      }
+    }
+    return { question, answer, sources }
+  }
+
+  return { status, vectorCount, query, queryStream }
 }
\ No newline at end of file
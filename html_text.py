@@ -0,0 +1,32 @@
+"""
+html_text.py
+
+Fast HTML-to-text for email bodies.
+
+One regex scan over the document drops comments and <script>, <style>,
+<head> and <title> blocks and replaces every other tag with a space — no DOM
+is built. Entities are unescaped afterwards so "&lt;b&gt;" stays text, then
+whitespace is collapsed the same way the old BeautifulSoup path did.
+"""
+
+import html
+import re
+
+_TOKENS = re.compile(
+    r"<!--.*?-->"
+    r"|<(script|style|head|title)\b[^>]*>.*?</\1\s*>"
+    r"|<[^>]*>",
+    re.IGNORECASE | re.DOTALL,
+)
+_SPACES      = re.compile(r"\s+")
+_PUNCT_SPACE = re.compile(r"\s([.,!?;:])")
+
+
+def html_to_text(body):
+    if not body:
+        return ""
+    text = _TOKENS.sub(" ", body)
+    text = html.unescape(text)
+    text = _SPACES.sub(" ", text)
+    text = _PUNCT_SPACE.sub(r"\1", text)
+    return text.strip()
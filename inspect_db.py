@@ -6,14 +6,14 @@ Reads directly from ChromaDB — no API key or embeddings needed.
 """
 
 import os
-import json
 from datetime import datetime
 from collections import Counter
 from email.utils import parsedate_to_datetime
 
-import chromadb
-
-CHROMA_DIR = "./chroma_db"
+import lexical_index
+from metadata_index import METADATA_DB_PATH, MetadataIndex
+from sync_store import SYNC_DB_PATH, SyncStore
+from vector_store import CHROMA_DIR, open_collection, read_active
 
 
 def parse_date(date_str):
@@ -34,17 +34,30 @@ def main():
         return
 
     # Connect directly to ChromaDB — no embeddings needed
-    client     = chromadb.PersistentClient(path=CHROMA_DIR)
-    collections = client.list_collections()
-
-    if not collections:
-        print("\nNo collections found in ChromaDB.")
+    active     = read_active()
+    collection = open_collection(None)
+    if not collection.partitions():
+        print(f"\nActive collection {active['collection']} not found.")
         return
-
-    collection    = client.get_collection(collections[0].name)
     total_vectors = collection.count()
 
-    print(f"\nTotal vectors   : {total_vectors:,}")
+    print(f"\nCollection      : {active['collection']} ({active['embed_model']}, "
+          f"generation {active.get('generation', 0)})")
+    if active.get("building"):
+        print(f"Reindexing into : {active['building']['collection']}")
+    if collection.partitioned:
+        print(f"Partitions      : {len(collection.partitions())} months")
+    print(f"Total vectors   : {total_vectors:,}")
+    if os.path.exists(lexical_index.index_path(active["collection"])):
+        print(f"BM25 index      : {lexical_index.for_collection(active['collection']).count():,} chunks")
+    else:
+        print("BM25 index      : not built (python lexical_index.py)")
+    if os.path.exists(METADATA_DB_PATH):
+        index = MetadataIndex()
+        print(f"Metadata index  : {index.count():,} emails"
+              + ("" if index.is_complete() else " (incomplete — rebuilt on the next sync)"))
+    else:
+        print("Metadata index  : not built (python metadata_index.py)")
 
     if total_vectors == 0:
         print("No data in ChromaDB yet.")
@@ -85,17 +98,24 @@ def main():
         display = sender if len(sender) <= 50 else sender[:47] + "..."
         print(f"  {count:>5}x  {display}")
 
-    # processed_ids and sync state
+    # Sync state
     print()
-    if os.path.exists("./processed_ids.json"):
-        with open("./processed_ids.json") as f:
-            cached = json.load(f)
-        print(f"processed_ids.json : {len(cached):,} email IDs cached")
-
-    if os.path.exists("./sync_state.json"):
-        with open("./sync_state.json") as f:
-            sync = json.load(f)
-        print(f"Last sync date     : {sync.get('last_sync_date', 'N/A')}")
+    if os.path.exists(SYNC_DB_PATH):
+        state  = SyncStore(SYNC_DB_PATH)
+        counts = state.status_counts()
+        print(f"Stored emails      : {counts.get('stored', 0):,}")
+        for status in ("fetched", "embedded", "failed"):
+            if counts.get(status):
+                print(f"  {status:<16} : {counts[status]:,} (not yet stored)")
+        print(f"Retry queue        : {state.retry_count():,} emails")
+        print(f"Fetch failures     : {state.fetch_failure_count():,} emails (fetched again next sync)")
+        print(f"Near-duplicates    : {state.duplicate_count():,} (collapsed into canonicals)")
+        print(f"Last sync date     : {state.get_state('last_sync_date', 'N/A')}")
+        print(f"History id         : {state.get_state('history_id', 'N/A')}")
+        print(f"Last run           : {state.get_state('last_run_at', 'N/A')}")
+        state.close()
+    else:
+        print(f"No sync state found at {SYNC_DB_PATH}")
 
     print("=" * 55)
 
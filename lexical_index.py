@@ -0,0 +1,216 @@
+"""
+lexical_index.py
+
+BM25 keyword index over the stored chunks, for questions that hinge on exact
+tokens ("emails from Amazon", "invoice INV-20931") where vector similarity
+is weak.
+
+One SQLite FTS5 table per Chroma collection (chroma_db/lexical/<collection>.db),
+keyed by the same chunk ids, with subject, sender and body columns ranked by
+FTS5's bm25() (subject and sender weighted above body). An ordinary
+chunk_rows table maps chunk and message ids to FTS rowids, so updates and
+deletes go by rowid instead of scanning the UNINDEXED id columns.
+load_and_store.py and reindex.py keep it in step with the collection through
+upsert_chunks() and delete_emails(); api.py fuses its ranking with the
+vector ranking by reciprocal rank fusion, and answers from BM25 alone only
+when an identifier the question names (exact_query) is itself indexed.
+
+Run: python lexical_index.py   # (re)build the index of the active collection from Chroma
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+from vector_store import CHROMA_DIR
+
+LEXICAL_DIR     = os.path.join(CHROMA_DIR, "lexical")
+BM25_WEIGHTS    = (3.0, 2.0, 1.0)  # subject, sender, body
+RRF_K           = 60               # reciprocal rank fusion constant
+MAX_QUERY_TERMS = 16
+
+_WORDS = re.compile(r"\w+")
+# Words that say what kind of answer is wanted rather than which mail
+_STOPWORDS = frozenset("""
+    a about all am an and any anything are as at be by can could did do does email emails for from
+    get got have i in is it latest list me mail mails message messages my new newest of on or please
+    recent received sent show some tell that the there this to today was week were what when which who
+    with yesterday you month last past many how much number count total
+""".split())
+# Identifiers worth matching literally: INV-20931, #48213, orders@shop.com, "quoted phrases"
+_EXACT = re.compile(r'"[^"]+"|\b[\w.+-]+@[\w-]+\.[\w.]+\b|\b[A-Za-z]+-?\d{3,}\b|#\d{3,}|\b\d{5,}\b')
+
+_indexes = {}
+_lock    = threading.Lock()
+
+
+def index_path(collection):
+    return os.path.join(LEXICAL_DIR, f"{collection}.db")
+
+
+def for_collection(collection):
+    """Shared LexicalIndex of a collection, opened on first use."""
+    with _lock:
+        if collection not in _indexes:
+            _indexes[collection] = LexicalIndex(index_path(collection))
+        return _indexes[collection]
+
+
+def drop(collection):
+    """Delete a collection's index, once the collection itself is dropped."""
+    with _lock:
+        index = _indexes.pop(collection, None)
+        if index:
+            index.close()
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(index_path(collection) + suffix)
+        except OSError:
+            pass
+
+
+def is_exact_query(question):
+    """True when the question names an identifier, address or quoted phrase."""
+    return bool(_EXACT.search(question))
+
+
+def match_query(question):
+    """FTS5 MATCH expression: the question's content words, OR-ed; None if there are none."""
+    terms = [w for w in _WORDS.findall(question.lower()) if w not in _STOPWORDS]
+    terms = list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+    return " OR ".join(f'"{t}"' for t in terms) or None
+
+
+def exact_query(question):
+    """FTS5 MATCH expression for the identifiers the question names, each as a phrase
+    of its tokens ("INV-20931" -> "inv 20931"), OR-ed; None if it names none."""
+    phrases = [" ".join(_WORDS.findall(match.lower())) for match in _EXACT.findall(question)]
+    phrases = list(dict.fromkeys(p for p in phrases if p))[:MAX_QUERY_TERMS]
+    return " OR ".join(f'"{p}"' for p in phrases) or None
+
+
+def rrf(rankings, k=RRF_K):
+    """Reciprocal rank fusion of ranked key lists. Returns keys, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+            " chunk_id UNINDEXED, msg_id UNINDEXED, subject, sender, body,"
+            " tokenize='porter unicode61')"
+        )
+        (mapped,) = self._conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'chunk_rows'"
+        ).fetchone()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_rows ("
+            " chunk_id TEXT PRIMARY KEY, msg_id TEXT NOT NULL, row INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_rows_msg_id ON chunk_rows(msg_id)")
+        if not mapped:  # index built before chunk_rows existed
+            self._conn.execute("INSERT INTO chunk_rows SELECT chunk_id, msg_id, rowid FROM chunks")
+        self._conn.commit()
+
+    def _delete_rows(self, column, values):
+        for i in range(0, len(values), 500):
+            part  = values[i : i + 500]
+            marks = ",".join("?" * len(part))
+            rows  = self._conn.execute(f"SELECT row FROM chunk_rows WHERE {column} IN ({marks})", part).fetchall()
+            if rows:
+                self._conn.execute(f"DELETE FROM chunks WHERE rowid IN ({','.join('?' * len(rows))})",
+                                   [r[0] for r in rows])
+                self._conn.execute(f"DELETE FROM chunk_rows WHERE {column} IN ({marks})", part)
+
+    def upsert(self, ids, chunks):
+        """Index chunks (Documents laid out as "<header>\\n\\n<body>") under their Chroma ids."""
+        rows = [
+            (chunk_id, c.metadata.get("id", ""), c.metadata.get("subject", ""),
+             c.metadata.get("from", ""), c.page_content.partition("\n\n")[2] or c.page_content)
+            for chunk_id, c in zip(ids, chunks)
+        ]
+        with self._lock:
+            self._delete_rows("chunk_id", [r[0] for r in rows])
+            for row in rows:
+                rowid = self._conn.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", row).lastrowid
+                self._conn.execute("INSERT OR REPLACE INTO chunk_rows VALUES (?, ?, ?)", (row[0], row[1], rowid))
+            self._conn.commit()
+
+    def delete(self, msg_ids):
+        """Remove every chunk of the given emails."""
+        with self._lock:
+            self._delete_rows("msg_id", list(msg_ids))
+            self._conn.commit()
+
+    def search(self, question, limit):
+        """Chunk ids matching the question's content words, best BM25 first."""
+        return self._search(match_query(question), limit)
+
+    def search_exact(self, question, limit):
+        """Chunk ids containing one of the identifiers the question names, best BM25 first."""
+        return self._search(exact_query(question), limit)
+
+    def _search(self, query, limit):
+        if not query:
+            return []
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE chunks MATCH ? "
+                    f"ORDER BY bm25(chunks, 0, 0, {', '.join(map(str, BM25_WEIGHTS))}) LIMIT ?",
+                    (query, limit),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return []
+        return [r[0] for r in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM chunk_rows")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ── Rebuild ────────────────────────────────────────────────────────────────────
+
+def rebuild(collection, page=5000):
+    """Re-index every chunk of a Chroma collection. Returns the number indexed."""
+    from langchain_core.documents import Document
+
+    index, offset = for_collection(collection.name), 0
+    index.clear()
+    while True:
+        found = collection.get(include=["documents", "metadatas"], limit=page, offset=offset)
+        index.upsert(found["ids"], [
+            Document(page_content=text or "", metadata=metadata or {})
+            for text, metadata in zip(found["documents"], found["metadatas"])
+        ])
+        offset += len(found["ids"])
+        if len(found["ids"]) < page:
+            return offset
+
+
+if __name__ == "__main__":
+    from vector_store import open_collection, read_active
+
+    name  = read_active()["collection"]
+    count = rebuild(open_collection(None, name))
+    print(f"Indexed {count} chunks of {name} into {index_path(name)}")
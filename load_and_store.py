@@ -3,73 +3,114 @@ load_and_store.py
 
 Two modes:
   1. Initial load  — fetches latest 300 emails, stores with timestamp metadata
-  2. Incremental   — fetches only emails newer than last sync date
-
-Uses Cohere for embeddings (embed-english-v3.0).
-Run: python load_and_store.py
+  2. Incremental   — fetches only messages added since the last Gmail historyId,
+                     and applies deletions and label changes to the vector store.
+                     Mail taken out of spam/trash is added back. When the history
+                     has expired it resyncs by date, and drops stored mail that
+                     Gmail no longer lists (deleted in the gap).
+
+Messages Gmail fails to return (5xx, retries exhausted) are kept in the sync
+store and fetched again on the next FETCH_MAX_ATTEMPTS runs; the history
+cursor moves on regardless.
+
+Every fetched email is also kept in a local compressed cache (message_cache.py),
+so the index can be rebuilt offline after changing the chunker, embedding model
+or prompt format:  delete chroma_db and sync_state.db, then run with --from-cache.
+
+Sync progress (per-message status, the history cursor and the retry queue) is
+kept in SQLite by sync_store.py and updated transactionally after each vector write.
+
+Near-duplicate emails (templated newsletters, receipts) are collapsed before
+chunking into one canonical email whose chunks carry the full list of
+occurrences in their metadata — see dedup.py.
+
+Uses Cohere for embeddings (embed-english-v3.0), several 96-text requests in
+flight at once; EMBEDDINGS_PROVIDER=fake swaps in fakes.FakeEmbeddings offline.
+Each pipeline stage (fetch, parse, split, embed, store) is timed by metrics.py;
+the run ends with a per-stage summary, and --metrics-file writes the metrics
+in Prometheus text format (for node_exporter's textfile collector).
+
+Run: python load_and_store.py [--from-cache] [--max-chunks-per-sec N] [--metrics-file PATH]
 """
 
+import argparse
+import json
 import os
 import time
-import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from email.utils import parsedate_to_datetime
 
 from dotenv import load_dotenv
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_cohere import CohereEmbeddings
-from langchain_chroma import Chroma
-from email_fetcher import GmailFetcher
+from dedup import DuplicateIndex, email_fingerprint, sender_key
+from email_fetcher import GmailFetcher, HistoryExpired
+from email_splitter import EmailTextSplitter
+from embed_cache import EmbeddingCache, normalize
+import lexical_index
+from message_cache import MessageCache
+from metadata_index import email_row, get_index as metadata_index, rebuild as rebuild_metadata_index
+import metrics
+from metrics import SYNC_ITEMS_TOTAL, SYNC_STAGE_SECONDS
+from pipeline import Pipeline
+from rate_limit import AdaptiveRateLimiter, is_rate_limited, retry_after_seconds
+from sync_store import EMBEDDED, FETCHED, SyncStore
+from vector_store import EMBEDDINGS_PROVIDER, ensure_active, mark_data_changed, open_collection, sync_lock
+import vector_store
 
 load_dotenv()
 
-COHERE_API_KEY   = os.getenv("COHERE_API_KEY")
-CHROMA_DIR       = "./chroma_db"
-PROGRESS_FILE    = "./processed_ids.json"
-SYNC_STATE_FILE  = "./sync_state.json"
-EMBED_BATCH_SIZE = 25
-EMBED_DELAY      = 2.0
-INITIAL_LIMIT    = 300
+COHERE_API_KEY      = os.getenv("COHERE_API_KEY")
+EMBED_BATCH_SIZE    = 96   # Cohere embed v3 maximum texts per request
+EMBED_CONCURRENCY   = int(os.getenv("EMBED_CONCURRENCY", "4"))
+STORE_BATCH_CHUNKS  = 2000  # chunks buffered per Chroma upsert / sync store transaction
+INITIAL_LIMIT       = 300
+FETCH_MAX_ATTEMPTS  = 5     # runs that try a message Gmail failed to return
 
+# Embedding throughput in chunks/sec: adapts between the bounds from 429
+# feedback. EMBED_MAX_RATE (or --max-chunks-per-sec) caps sync throughput.
+EMBED_INITIAL_RATE = 96.0
+EMBED_MIN_RATE     = 0.5
+EMBED_MAX_RATE     = float(os.getenv("EMBED_MAX_RATE", "500"))
+EMBED_MAX_RETRIES  = 6
 
-# ── State helpers ──────────────────────────────────────────────────────────────
+# Collapse near-duplicate emails into one canonical document (DEDUP_NEAR_DUPLICATES=0 disables)
+DEDUP_ENABLED         = os.getenv("DEDUP_NEAR_DUPLICATES", "1") != "0"
+DEDUP_MAX_OCCURRENCES = 50  # occurrences listed in chunk metadata; the count is always exact
 
-def load_progress():
-    if os.path.exists(PROGRESS_FILE):
-        with open(PROGRESS_FILE) as f:
-            return set(json.load(f))
-    return set()
+embed_limiter = AdaptiveRateLimiter(
+    rate=min(EMBED_INITIAL_RATE, EMBED_MAX_RATE), min_rate=EMBED_MIN_RATE, max_rate=EMBED_MAX_RATE,
+    increase=EMBED_BATCH_SIZE / 4,
+)
+_embed_pool = None
 
 
-def save_progress(ids):
-    with open(PROGRESS_FILE, "w") as f:
-        json.dump(list(ids), f)
-
-
-def load_sync_state():
-    if os.path.exists(SYNC_STATE_FILE):
-        with open(SYNC_STATE_FILE) as f:
-            return json.load(f).get("last_sync_date")
-    return None
+# ── Embeddings & vector store ──────────────────────────────────────────────────
 
+def get_embeddings():
+    # The active collection's model; retries are left to embed_with_retry so
+    # 429s reach the shared limiter
+    return vector_store.get_embeddings(max_retries=1)
 
-def save_sync_state(date_str):
-    with open(SYNC_STATE_FILE, "w") as f:
-        json.dump({"last_sync_date": date_str}, f)
 
+def set_max_chunks_per_sec(rate):
+    """Cap sync throughput: the embedding limiter never goes above `rate` chunks/sec."""
+    embed_limiter.max_rate = float(rate)
+    embed_limiter.min_rate = min(embed_limiter.min_rate, embed_limiter.max_rate)
+    embed_limiter.rate     = min(embed_limiter.rate, embed_limiter.max_rate)
 
-# ── Embeddings & vector store ──────────────────────────────────────────────────
 
-def get_embeddings():
-    return CohereEmbeddings(
-        model="embed-english-v3.0",
-        cohere_api_key=COHERE_API_KEY,
-    )
+def embed_pool():
+    # Shared by every embed stage worker, so EMBED_CONCURRENCY bounds requests in flight
+    global _embed_pool
+    if _embed_pool is None:
+        _embed_pool = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed")
+    return _embed_pool
 
 
 def get_vectorstore(embeddings):
-    return Chroma(persist_directory=CHROMA_DIR, embedding_function=embeddings)
+    # Whichever collection is live — reindex.py may have switched it
+    return open_collection(embeddings)
 
 
 # ── Document helpers ───────────────────────────────────────────────────────────
@@ -90,126 +131,564 @@ def emails_to_documents(emails):
             f"Date: {email['date']}\n\n"
             f"{email['body']}"
         )
+        timestamp = parse_timestamp(email["date"])
         docs.append(Document(
             page_content=content,
             metadata={
-                "id":        email["id"],
-                "subject":   email["subject"],
-                "from":      email["from"],
-                "date":      email["date"],
-                "timestamp": parse_timestamp(email["date"]),
+                "id":               email["id"],
+                "subject":          email["subject"],
+                "from":             email["from"],
+                "date":             email["date"],
+                "timestamp":        timestamp,
+                "latest_timestamp": timestamp,
+                "labels":           ",".join(email.get("labels", [])),
             },
         ))
     return docs
 
 
 def split_documents(documents):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, chunk_overlap=200, length_function=len
-    )
-    return splitter.split_documents(documents)
+    # Strips quoted replies, signatures and footers; token-sized chunks, header in each
+    return EmailTextSplitter().split_documents(documents)
 
 
-def store_with_retry(vectorstore, chunks, max_retries=3):
+def embed_with_retry(embeddings, texts, max_retries=EMBED_MAX_RETRIES):
+    """Embed texts under the shared adaptive limiter. Returns None if the batch failed."""
     for attempt in range(max_retries):
+        embed_limiter.acquire(len(texts))
         try:
-            vectorstore.add_documents(chunks)
-            return True
+            vectors = embeddings.embed_documents(texts)
         except Exception as e:
-            err = str(e)
-            if "rate" in err.lower() or "429" in err or "limit" in err.lower():
-                wait = (attempt + 1) * 30
-                print(f"  Rate limit hit. Waiting {wait}s...")
-                time.sleep(wait)
-            else:
+            if not is_rate_limited(e):
                 print(f"  Error: {e}")
-                return False
-    print("  Failed after retries. Skipping batch.")
-    return False
+                return None
+            retry_after = retry_after_seconds(e)
+            embed_limiter.throttled(retry_after)
+            print(f"  Rate limit hit. Slowing to {embed_limiter.rate:.1f} chunks/s"
+                  + (f", retrying after {retry_after:.1f}s..." if retry_after else "..."))
+            continue
+        embed_limiter.succeeded()
+        return vectors
+    print("  Failed after retries. Queued for the next run.")
+    return None
 
 
-def embed_and_store(vectorstore, emails, processed_ids):
-    new_emails = [e for e in emails if e["id"] not in processed_ids]
-    if not new_emails:
-        print("  No new emails to store.")
-        return 0
+def occurrence_metadata(occurrences):
+    """Chunk metadata for a canonical email; occurrences are newest first, as from
+    SyncStore.occurrences. Chroma metadata must be scalar, so the list is JSON."""
+    listed = [{"id": o["id"], "subject": o["subject"], "date": o["date"]} for o in occurrences]
+    return {
+        "occurrence_count": len(occurrences),
+        "occurrences":      json.dumps(listed[:DEDUP_MAX_OCCURRENCES]),
+        "latest_timestamp": max((o["timestamp"] or 0) for o in occurrences),
+    }
 
-    docs   = emails_to_documents(new_emails)
-    chunks = split_documents(docs)
-    print(f"  Storing {len(chunks)} chunks from {len(new_emails)} emails...")
 
-    for i in range(0, len(chunks), EMBED_BATCH_SIZE):
-        batch   = chunks[i : i + EMBED_BATCH_SIZE]
-        success = store_with_retry(vectorstore, batch)
-        if success:
-            time.sleep(EMBED_DELAY)
+# ── Pipeline stages ────────────────────────────────────────────────────────────
+# Each stage takes and returns a work item: a dict that starts as {"emails": [...]}
+# and gains "docs", "chunks" and "vectors" as it moves fetch → parse → split → embed → store.
 
-    for e in new_emails:
-        processed_ids.add(e["id"])
-    save_progress(processed_ids)
+@metrics.timed(SYNC_STAGE_SECONDS, "parse")
+def parse_stage(emails, state, dup_index=None):
+    """Drop already-stored emails and, when dup_index is given, set aside near-duplicates
+    of a canonical email so only canonicals are chunked and embedded."""
+    new_emails = [e for e in emails if not state.is_processed(e["id"])]
+    if not new_emails:
+        return None
+    state.mark((e["id"] for e in new_emails), FETCHED)
+
+    canonicals, duplicates, fingerprints = [], [], []
+    for email in new_emails:
+        sender      = sender_key(email["from"])
+        fingerprint = email_fingerprint(email) if dup_index is not None else None
+        canonical   = dup_index.find(sender, fingerprint) if fingerprint is not None else None
+        if canonical is None:
+            canonicals.append(email)
+            canonical = email["id"]
+            if fingerprint is not None:
+                dup_index.add(canonical, sender, fingerprint)
+        else:
+            duplicates.append(email)
+        fingerprints.append({
+            "id": email["id"], "canonical_id": canonical, "sender": sender, "simhash": fingerprint,
+            "subject": email["subject"], "date": email["date"], "timestamp": parse_timestamp(email["date"]),
+        })
+
+    return {
+        "emails":       canonicals,
+        "duplicates":   duplicates,
+        "fingerprints": fingerprints,
+        "docs":         emails_to_documents(canonicals),
+    }
+
+
+@metrics.timed(SYNC_STAGE_SECONDS, "split")
+def split_stage(item):
+    chunks = split_documents(item["docs"])
+    counts = {}
+    for chunk in chunks:
+        msg_id = chunk.metadata["id"]
+        chunk.metadata["chunk"] = counts.get(msg_id, 0)
+        counts[msg_id] = chunk.metadata["chunk"] + 1
+    item["chunks"] = chunks
+    return item
+
+
+@metrics.timed(SYNC_STAGE_SECONDS, "embed")
+def embed_stage(item, embeddings, embed_cache, state=None):
+    """Vectors for item["chunks"]: cached ones are reused, and each distinct
+    uncached text is sent to the provider once, in EMBED_BATCH_SIZE requests
+    run concurrently on the embed pool."""
+    texts   = [c.page_content for c in item["chunks"]]
+    vectors = embed_cache.get_many(texts)
+
+    pending = {}  # normalized text -> chunk positions needing it
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            pending.setdefault(normalize(texts[i]), []).append(i)
+    keys    = list(pending)
+    batches = [keys[j : j + EMBED_BATCH_SIZE] for j in range(0, len(keys), EMBED_BATCH_SIZE)]
+
+    def embed_batch(batch_keys):
+        batch  = [texts[pending[k][0]] for k in batch_keys]
+        result = embed_with_retry(embeddings, batch)
+        if result is not None:
+            embed_cache.put_many(batch, result)
+        return result
+
+    for batch_keys, result in zip(batches, embed_pool().map(embed_batch, batches)):
+        if result is None:
+            continue
+        for k, vector in zip(batch_keys, result):
+            for i in pending[k]:
+                vectors[i] = vector
+
+    item["vectors"] = vectors
+    if state is not None:
+        failed = {c.metadata["id"] for c, v in zip(item["chunks"], vectors) if v is None}
+        state.mark((e["id"] for e in item["emails"] if e["id"] not in failed), EMBEDDED)
+    return item
+
+
+def upsert_chunks(vectorstore, chunks, vectors):
+    """Bulk-insert precomputed vectors, in as few Chroma transactions as its batch limit allows,
+    and index the same chunks in the collection's BM25 index."""
+    step    = vectorstore.max_batch_size
+    lexical = lexical_index.for_collection(vectorstore.name)
+    for i in range(0, len(chunks), step):
+        part = chunks[i : i + step]
+        # Deterministic ids make re-storing an email an idempotent upsert
+        ids  = [f"{c.metadata['id']}-{c.metadata['chunk']}" for c in part]
+        vectorstore.upsert(
+            ids=ids,
+            embeddings=vectors[i : i + step],
+            metadatas=[c.metadata for c in part],
+            documents=[c.page_content for c in part],
+        )
+        lexical.upsert(ids, part)
+
+
+def retry_records(chunks, msg_ids):
+    return [
+        {"id": msg_id, "chunks": [
+            {"text": c.page_content, "metadata": c.metadata}
+            for c in chunks if c.metadata["id"] == msg_id
+        ]}
+        for msg_id in sorted(msg_ids)
+    ]
+
+
+@metrics.timed(SYNC_STAGE_SECONDS, "store")
+def store_stage(vectorstore, items, state):
+    """Write the embedded chunks of several work items to Chroma in one bulk upsert,
+    then record the outcome in the sync store in one transaction. Only emails whose
+    chunks all embedded count as stored; the rest go to the durable retry queue.
+    Near-duplicates are stored as occurrences on their canonical email's chunks.
+    Returns (stored emails, near-duplicates, canonicals whose occurrences were rewritten)."""
+    chunks       = [c for item in items for c in item["chunks"]]
+    vectors      = [v for item in items for v in item["vectors"]]
+    duplicates   = [e for item in items for e in item.get("duplicates", [])]
+    fingerprints = [f for item in items for f in item.get("fingerprints", [])]
+
+    stored = [(c, v) for c, v in zip(chunks, vectors) if v is not None]
+    failed = {c.metadata["id"] for c, v in zip(chunks, vectors) if v is None}
+    if stored:
+        upsert_chunks(vectorstore, [c for c, _ in stored], [v for _, v in stored])
+
+    done = [e for item in items for e in item["emails"] if e["id"] not in failed]
+    state.commit_batch(
+        [e["id"] for e in done + duplicates], retry_records(chunks, failed), fingerprints=fingerprints,
+    )
+    canonical_of = {f["id"]: f["canonical_id"] for f in fingerprints}
+    metadata_index().upsert(email_row(e, canonical_of.get(e["id"])) for e in done + duplicates)
+    refreshed = refresh_occurrences(vectorstore, state, {
+        f["canonical_id"] for f in fingerprints if f["canonical_id"] != f["id"]
+    })
+    return done, duplicates, refreshed
+
+
+def refresh_occurrences(vectorstore, state, canonical_ids):
+    """Rewrite the occurrence metadata on the chunks of the given canonical emails."""
+    canonical_ids = list(canonical_ids)
+    if not canonical_ids:
+        return 0
+    found = vectorstore.get(
+        where={"id": {"$in": canonical_ids}}, include=["metadatas"]
+    )
+    if not found["ids"]:
+        return 0
+    occurrences = state.occurrences(canonical_ids)
+    metadatas   = [
+        {**m, **occurrence_metadata(occurrences[m["id"]])} if m["id"] in occurrences else m
+        for m in found["metadatas"]
+    ]
+    vectorstore.update(ids=found["ids"], metadatas=metadatas)
+    return len({m["id"] for m in metadatas})
+
+
+def drain_retry_queue(vectorstore, state, embed_cache):
+    """Re-attempt emails left in the retry queue by earlier runs. Returns emails stored."""
+    records = state.retry_records()
+    if not records:
+        return 0
+    print(f"Retrying {len(records)} emails queued by an earlier run...")
+
+    remaining, stored = 0, 0
+    for i in range(0, len(records), 100):
+        group  = records[i : i + 100]
+        chunks = [
+            Document(page_content=c["text"], metadata=c["metadata"])
+            for record in group for c in record["chunks"]
+        ]
+        item = embed_stage({"chunks": chunks}, vectorstore.embeddings, embed_cache)
+        failed = {c.metadata["id"] for c, v in zip(chunks, item["vectors"]) if v is None}
+
+        ok = [(c, v) for c, v in zip(chunks, item["vectors"]) if c.metadata["id"] not in failed]
+        if ok:
+            upsert_chunks(vectorstore, [c for c, _ in ok], [v for _, v in ok])
+        recovered = [r["id"] for r in group if r["id"] not in failed]
+        state.commit_batch(recovered, retry_records(chunks, failed))
+        metadata_index().upsert(
+            email_row(r["chunks"][0]["metadata"]) for r in group if r["id"] not in failed and r["chunks"]
+        )
+        # Near-duplicates may have been collapsed into these while they were queued
+        refresh_occurrences(vectorstore, state, set(state.duplicates_of(recovered).values()))
+        stored    += len(recovered)
+        remaining += len(failed)
+
+    print(f"  {stored} recovered, {remaining} still queued")
+    return stored
+
+
+def sync_emails(vectorstore, batches, state, embed_cache):
+    """Stream batches of emails through parse → split → embed → store.
+
+    batches is any iterable of email lists (a fetcher generator, the message
+    cache, ...); it is consumed on its own thread. Returns
+    {"emails", "duplicates", "refreshed", "chunks", "oldest_timestamp"} for what was
+    stored; index_changes() sums what changed.
+    """
+    embeddings = vectorstore.embeddings
+    dup_index  = DuplicateIndex.from_rows(state.fingerprint_rows()) if DEDUP_ENABLED else None
+    started    = time.perf_counter()
+    pipeline   = (
+        Pipeline(metrics.timed_iter(batches, SYNC_STAGE_SECONDS, "fetch"))
+        .stage(lambda emails: parse_stage(emails, state, dup_index))
+        .stage(split_stage)
+        .stage(lambda item: embed_stage(item, embeddings, embed_cache, state), workers=2)
+    )
 
-    return len(new_emails)
+    stats   = {"emails": 0, "duplicates": 0, "refreshed": 0, "chunks": 0, "oldest_timestamp": None}
+    pending = []  # embedded items waiting for the next bulk write
+
+    def flush():
+        done, duplicates, refreshed = store_stage(vectorstore, pending, state)
+        chunks = sum(len(item["chunks"]) for item in pending)
+        stats["emails"]     += len(done)
+        stats["duplicates"] += len(duplicates)
+        stats["refreshed"]  += refreshed
+        stats["chunks"]     += chunks
+        SYNC_ITEMS_TOTAL.inc(len(done), kind="emails")
+        SYNC_ITEMS_TOTAL.inc(len(duplicates), kind="duplicates")
+        SYNC_ITEMS_TOTAL.inc(chunks, kind="chunks")
+        timestamps = [parse_timestamp(e["date"]) for e in done + duplicates if parse_timestamp(e["date"]) > 0]
+        if timestamps:
+            oldest = min(timestamps)
+            stats["oldest_timestamp"] = min(oldest, stats["oldest_timestamp"] or oldest)
+        print(f"  Stored {chunks} chunks from {len(done)} emails"
+              + (f" (+{len(duplicates)} near-duplicates)" if duplicates else "")
+              + f" ({stats['emails']} emails this run, {time.perf_counter() - started:.1f}s)")
+        pending.clear()
+
+    for item in pipeline:
+        pending.append(item)
+        if sum(len(i["chunks"]) for i in pending) >= STORE_BATCH_CHUNKS:
+            flush()
+    if pending:
+        flush()
+    return stats
+
+
+def index_changes(stats):
+    """What a sync_emails() run changed: a near-duplicate stores no chunks, but adds a
+    metadata index row and rewrites its canonical's occurrence metadata."""
+    return stats["emails"] + stats["duplicates"] + stats["refreshed"]
+
+
+def delete_emails(vectorstore, msg_ids, state):
+    """Remove every chunk of the given emails from the vector store.
+
+    Returns (deleted, orphans): orphans are near-duplicates of a deleted canonical
+    email. They are dropped from the sync store so the caller can re-sync them
+    and one of them becomes the new canonical.
+    """
+    msg_ids = [m for m in msg_ids if state.is_processed(m)]
+    if not msg_ids:
+        return 0, []
+    deleted    = set(msg_ids)
+    canonicals = {c for m, c in state.canonical_of(msg_ids).items() if c != m and c not in deleted}
+    orphans    = [m for m in state.duplicates_of(msg_ids) if m not in deleted]
+
+    vectorstore.delete(where={"id": {"$in": msg_ids}})
+    lexical_index.for_collection(vectorstore.name).delete(msg_ids)
+    metadata_index().delete(msg_ids + orphans)
+    state.remove(msg_ids + orphans)
+    refresh_occurrences(vectorstore, state, canonicals)
+    return len(msg_ids), orphans
+
+
+def update_labels(vectorstore, labels):
+    """Rewrite the labels metadata on stored chunks. labels: {msg_id: [labelIds]}."""
+    if not labels:
+        return 0
+    metadata_index().update_labels(labels)
+    found = vectorstore.get(
+        where={"id": {"$in": list(labels)}}, include=["metadatas"]
+    )
+    if not found["ids"]:
+        return 0
+    metadatas = [
+        {**m, "labels": ",".join(labels[m["id"]])} for m in found["metadatas"]
+    ]
+    vectorstore.update(ids=found["ids"], metadatas=metadatas)
+    return len({m["id"] for m in metadatas})
 
 
 # ── Main ───────────────────────────────────────────────────────────────────────
 
-def main():
+def rebuild_from_cache(vectorstore, cache, state, embed_cache):
+    """Embed every cached email not yet stored — no Gmail access. Returns sync_emails() stats."""
+    return sync_emails(vectorstore, cache.iter_batches(), state, embed_cache)
+
+
+def main(from_cache=False):
     print("=" * 52)
     print("MailMate AI — Email Sync")
     print("=" * 52)
 
-    if not COHERE_API_KEY:
+    if EMBEDDINGS_PROVIDER != "fake" and not COHERE_API_KEY:
         print("ERROR: COHERE_API_KEY not set in .env")
         return
 
-    processed_ids = load_progress()
-    last_sync     = load_sync_state()
+    sync_once(from_cache)
+
+
+def sync_once(from_cache=False):
+    """run_sync under sync_lock(); returns True when the index changed. Also
+    called in-process by api.py's background sync (sync_worker.py)."""
+    # One writer at a time: reindex.py takes the same lock for its final catch-up and switch
+    with sync_lock():
+        changed = run_sync(from_cache)
+        if changed:
+            mark_data_changed()  # invalidates api.py's answer cache
+    return changed
+
+
+def run_sync(from_cache=False):
+    """Returns True when the index changed (mail added, removed or relabelled).
+    The stores and the Gmail fetcher are closed when it returns, so repeated
+    runs in api.py's sync worker don't leak connections or threads."""
+    active = ensure_active()
+    print(f"Index  : {active['collection']} ({active['embed_model']})")
+    embeddings  = get_embeddings()
+    vectorstore = get_vectorstore(embeddings)
+    cache       = MessageCache()
+    embed_cache = EmbeddingCache(model=embeddings.model)
+    state       = SyncStore()
+    try:
+        backfilled = complete_metadata_index(vectorstore, state)
+        if from_cache:
+            return sync_from_cache(vectorstore, cache, state, embed_cache) or backfilled > 0
+        fetcher = GmailFetcher(cache=cache)
+        try:
+            return sync_from_gmail(vectorstore, fetcher, cache, state, embed_cache) or backfilled > 0
+        finally:
+            fetcher.close()
+    finally:
+        state.close()
+        embed_cache.close()
+        cache.close()
+
+
+def complete_metadata_index(vectorstore, state):
+    """Rebuild the metadata index unless it already covers every stored email
+    (mail stored before the index existed, or an interrupted rebuild). An empty
+    store just marks it complete; store_stage keeps it current from there.
+    Returns the emails indexed."""
+    index = metadata_index()
+    if index.is_complete():
+        return 0
+    count = rebuild_metadata_index(vectorstore, index, state)
+    if count:
+        print(f"Metadata index rebuilt : {count} emails")
+    return count
+
+
+def sync_from_cache(vectorstore, cache, state, embed_cache):
+    """run_sync --from-cache: re-embed cached mail not yet stored, no Gmail calls."""
+    print(f"Mode   : Rebuild from cache ({len(cache)} cached emails)")
+    print(f"Cached : {len(state.processed_ids)} emails already stored")
+    print()
+    recovered     = drain_retry_queue(vectorstore, state, embed_cache)
+    stats         = rebuild_from_cache(vectorstore, cache, state, embed_cache)
+    total_stored  = recovered + stats["emails"]
+    state.set_state(last_run_at=datetime.now().isoformat(timespec="seconds"))
+    print()
+    print("=" * 52)
+    print(f"Done!")
+    print(f"  Emails stored this run : {total_stored}")
+    print(f"  Total in DB            : {len(state.processed_ids)}")
+    print(f"  Total vectors          : {vectorstore.count()}")
+    print(f"  Near-duplicates        : {state.duplicate_count()}")
+    print(f"  Embedding cache hits   : {embed_cache.hit_rate():.0%}")
+    print(f"  Stage time             : {metrics.stage_summary(SYNC_STAGE_SECONDS) or '-'}")
+    print("=" * 52)
+    return recovered + index_changes(stats) > 0
+
+
+def sync_from_gmail(vectorstore, fetcher, cache, state, embed_cache):
+    """run_sync against Gmail: the initial load, or the changes since the last run."""
+    last_sync     = state.get_state("last_sync_date")
+    history_id    = state.get_state("history_id")
     today_str     = datetime.now().strftime("%Y/%m/%d")
-    embeddings    = get_embeddings()
-    vectorstore   = get_vectorstore(embeddings)
-    fetcher       = GmailFetcher()
-    total_stored  = 0
+    total_stored  = drain_retry_queue(vectorstore, state, embed_cache)
+    modified      = total_stored
+
+    def sync(batches):
+        nonlocal total_stored, modified
+        stats         = sync_emails(vectorstore, batches, state, embed_cache)
+        total_stored += stats["emails"]
+        modified     += index_changes(stats)
+        return stats
+
+    refetch = [m for m in state.fetch_failure_ids(FETCH_MAX_ATTEMPTS) if not state.is_processed(m)]
+    if refetch:
+        print(f"Fetching {len(refetch)} emails that failed to download in an earlier run...")
+        sync(fetcher.fetch_messages(refetch))
+
+    def advance(**cursor):
+        # Keep what couldn't be fetched before the cursor moves past it
+        state.record_fetch_failures(fetcher.failures)
+        state.set_state(**cursor)
 
     if not last_sync:
         # ── Initial load ───────────────────────────────────────────────────────
         print(f"Mode   : Initial load (latest {INITIAL_LIMIT} emails)")
         print()
-        emails       = fetcher.fetch_latest(max_emails=INITIAL_LIMIT)
-        total_stored = embed_and_store(vectorstore, emails, processed_ids)
+        # Take the cursor first so mail arriving during the load is picked up next run
+        new_history_id = fetcher.get_history_id()
+        stats          = sync(fetcher.iter_latest(max_emails=INITIAL_LIMIT))
 
         # Set sync anchor to oldest email date
-        if emails:
-            timestamps = [parse_timestamp(e["date"]) for e in emails if parse_timestamp(e["date"]) > 0]
-            if timestamps:
-                oldest_str = datetime.fromtimestamp(min(timestamps)).strftime("%Y/%m/%d")
-                save_sync_state(oldest_str)
-                print(f"\n  Sync anchor set to: {oldest_str}")
-            else:
-                save_sync_state(today_str)
+        if stats["oldest_timestamp"]:
+            oldest_str = datetime.fromtimestamp(stats["oldest_timestamp"]).strftime("%Y/%m/%d")
+            advance(last_sync_date=oldest_str, history_id=new_history_id)
+            print(f"\n  Sync anchor set to: {oldest_str}")
         else:
-            save_sync_state(today_str)
+            advance(last_sync_date=today_str, history_id=new_history_id)
 
     else:
         # ── Incremental sync ───────────────────────────────────────────────────
         print(f"Mode   : Incremental sync")
-        print(f"Fetching emails after: {last_sync}")
-        print(f"Cached : {len(processed_ids)} emails already stored")
+        print(f"Cached : {len(state.processed_ids)} emails already stored")
         print()
 
-        for batch in fetcher.fetch_after(after_date_str=last_sync):
-            stored       = embed_and_store(vectorstore, batch, processed_ids)
-            total_stored += stored
-            save_sync_state(today_str)
+        changes = None
+        if history_id:
+            print(f"Fetching changes since historyId: {history_id}")
+            try:
+                changes = fetcher.fetch_history(history_id)
+            except HistoryExpired:
+                print("  History expired — falling back to a full resync.")
+
+        if changes is not None:
+            deleted, orphans = delete_emails(vectorstore, changes["deleted"], state)
+            updated = update_labels(vectorstore, changes["labels"])
+            cache.delete(changes["deleted"])
+            for msg_id, labels in changes["labels"].items():
+                email = cache.get(msg_id)
+                if email:
+                    cache.put({**email, "labels": labels})
+            # Taken out of spam / trash: never indexed, so it only shows up as a label change
+            restored = [m for m in changes["restored"] if not state.is_processed(m)]
+            added    = [m for m in changes["added"] if not state.is_processed(m)] + restored + orphans
+            print(f"  {len(added)} added ({len(restored)} restored from spam/trash), "
+                  f"{deleted} deleted, {updated} relabelled")
+            modified += deleted + updated
+            sync(fetcher.fetch_messages(added))
+            advance(last_sync_date=today_str, history_id=changes["history_id"])
+        else:
+            new_history_id = fetcher.get_history_id()
+            # The date listing below can't see deletions made while history was
+            # unavailable: drop stored mail that Gmail no longer lists
+            present          = set(fetcher.list_ids())
+            gone             = [m for m in state.processed_ids if m not in present]
+            deleted, orphans = delete_emails(vectorstore, gone, state)
+            cache.delete(gone)
+            modified        += deleted
+            print(f"  {deleted} stored emails no longer in Gmail — removed")
+
+            print(f"Fetching emails after: {last_sync}")
+            sync(fetcher.fetch_after(after_date_str=last_sync, exclude_ids=state.processed_ids))
+            orphans = [m for m in orphans if not state.is_processed(m)]
+            if orphans:
+                sync(fetcher.fetch_messages(orphans))
+            advance(last_sync_date=today_str, history_id=new_history_id)
+
+    state.set_state(last_run_at=datetime.now().isoformat(timespec="seconds"))
 
     print()
     print("=" * 52)
     print(f"Done!")
     print(f"  Emails stored this run : {total_stored}")
-    print(f"  Total in DB            : {len(processed_ids)}")
-    print(f"  Total vectors          : {vectorstore._collection.count()}")
+    print(f"  Total in DB            : {len(state.processed_ids)}")
+    print(f"  Total vectors          : {vectorstore.count()}")
+    print(f"  Near-duplicates        : {state.duplicate_count()}")
+    print(f"  Embedding cache hits   : {embed_cache.hit_rate():.0%}")
+    print(f"  Stage time             : {metrics.stage_summary(SYNC_STAGE_SECONDS) or '-'}")
     print(f"  Next sync after        : {today_str}")
     print("=" * 52)
+    return modified > 0
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync Gmail into the vector store.")
+    parser.add_argument(
+        "--from-cache", action="store_true",
+        help="rebuild the index from the local message cache without contacting Gmail",
+    )
+    parser.add_argument(
+        "--max-chunks-per-sec", type=float, default=None,
+        help=f"cap embedding throughput (default EMBED_MAX_RATE, {EMBED_MAX_RATE:g})",
+    )
+    parser.add_argument(
+        "--metrics-file", default=None,
+        help="write the run's metrics here in Prometheus text format",
+    )
+    args = parser.parse_args()
+    if args.max_chunks_per_sec:
+        set_max_chunks_per_sec(args.max_chunks_per_sec)
+    main(from_cache=args.from_cache)
+    if args.metrics_file:
+        with open(args.metrics_file, "w") as f:
+            f.write(metrics.render())
\ No newline at end of file
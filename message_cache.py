@@ -0,0 +1,182 @@
+"""
+message_cache.py
+
+Persistent on-disk cache of parsed emails ({id, subject, from, date, body, labels}),
+keyed by Gmail message id, so the vector store can be rebuilt without
+re-downloading mail.
+
+Layout of the cache directory:
+  seg-000001.dat  — append-only segment files of length-prefixed, zlib-compressed
+                    JSON records
+  index.jsonl     — append-only index: one line per put ({"id", "seg", "off", "len"})
+                    or delete ({"id", "del": true}); the last line for an id wins
+
+When the segments exceed max_bytes the oldest segments are evicted whole
+and the index is compacted.
+"""
+
+import json
+import os
+import struct
+import threading
+import zlib
+
+MESSAGE_CACHE_DIR = "./message_cache"
+DEFAULT_MAX_BYTES = int(os.getenv("MESSAGE_CACHE_MAX_MB", "1024")) * 1024 * 1024
+SEGMENT_BYTES     = 16 * 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+
+
+class MessageCache:
+    def __init__(self, path=MESSAGE_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, segment_bytes=SEGMENT_BYTES):
+        self.path          = path
+        self.max_bytes     = max_bytes
+        self.segment_bytes = segment_bytes
+        self._index        = {}  # msg_id -> (seg, offset, length)
+        self._lock         = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._load_index()
+        self._segments = sorted(self._existing_segments())
+        self._active   = self._segments[-1] if self._segments else 1
+        self._index_f  = open(self._index_path, "a")
+
+    # ── Paths ──────────────────────────────────────────────────────────────────
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.path, "index.jsonl")
+
+    def _segment_path(self, seg):
+        return os.path.join(self.path, f"seg-{seg:06d}.dat")
+
+    def _existing_segments(self):
+        for name in os.listdir(self.path):
+            if name.startswith("seg-") and name.endswith(".dat"):
+                yield int(name[4:-4])
+
+    # ── Index ──────────────────────────────────────────────────────────────────
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return
+        segments = set(self._existing_segments())
+        with open(self._index_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn write at the tail after a crash
+                if entry.get("del"):
+                    self._index.pop(entry["id"], None)
+                elif entry["seg"] in segments:
+                    self._index[entry["id"]] = (entry["seg"], entry["off"], entry["len"])
+
+    def _compact_index(self):
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            for msg_id, (seg, off, length) in self._index.items():
+                f.write(json.dumps({"id": msg_id, "seg": seg, "off": off, "len": length}) + "\n")
+        self._index_f.close()
+        os.replace(tmp, self._index_path)
+        self._index_f = open(self._index_path, "a")
+
+    # ── Public API ─────────────────────────────────────────────────────────────
+
+    def __contains__(self, msg_id):
+        return msg_id in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, msg_id):
+        entry = self._index.get(msg_id)
+        if not entry:
+            return None
+        seg, off, length = entry
+        try:
+            with open(self._segment_path(seg), "rb") as f:
+                f.seek(off + _LENGTH.size)
+                return json.loads(zlib.decompress(f.read(length)))
+        except (OSError, zlib.error, ValueError):
+            return None
+
+    def put_many(self, emails):
+        """Append emails to the active segment and index them."""
+        if not emails:
+            return
+        with self._lock:
+            seg_path = self._segment_path(self._active)
+            offset   = os.path.getsize(seg_path) if os.path.exists(seg_path) else 0
+            records, entries = [], []
+            for email in emails:
+                data = zlib.compress(json.dumps(email).encode("utf-8"))
+                records.append(_LENGTH.pack(len(data)) + data)
+                entries.append((email["id"], (self._active, offset, len(data))))
+                offset += _LENGTH.size + len(data)
+
+            # Data first, index second: a crash in between only leaves unreferenced bytes.
+            with open(seg_path, "ab") as f:
+                f.write(b"".join(records))
+            for msg_id, (seg, off, length) in entries:
+                self._index[msg_id] = (seg, off, length)
+                self._index_f.write(json.dumps({"id": msg_id, "seg": seg, "off": off, "len": length}) + "\n")
+            self._index_f.flush()
+
+            if self._active not in self._segments:
+                self._segments.append(self._active)
+            if offset >= self.segment_bytes:
+                self._active += 1
+            self._evict()
+
+    def put(self, email):
+        self.put_many([email])
+
+    def delete(self, msg_ids):
+        with self._lock:
+            for msg_id in msg_ids:
+                if self._index.pop(msg_id, None):
+                    self._index_f.write(json.dumps({"id": msg_id, "del": True}) + "\n")
+            self._index_f.flush()
+
+    def iter_batches(self, batch_size=100):
+        """Yield cached emails in batches, reading segments sequentially."""
+        by_segment = {}
+        for seg, off, length in self._index.values():
+            by_segment.setdefault(seg, []).append((off, length))
+
+        batch = []
+        for seg in sorted(by_segment):
+            with open(self._segment_path(seg), "rb") as f:
+                for off, length in sorted(by_segment[seg]):
+                    f.seek(off + _LENGTH.size)
+                    try:
+                        batch.append(json.loads(zlib.decompress(f.read(length))))
+                    except (zlib.error, ValueError):
+                        continue
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    def size_bytes(self):
+        return sum(
+            os.path.getsize(self._segment_path(seg))
+            for seg in self._segments if os.path.exists(self._segment_path(seg))
+        )
+
+    # ── Eviction ───────────────────────────────────────────────────────────────
+
+    def _evict(self):
+        evicted = False
+        while self.size_bytes() > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments.pop(0)
+            os.remove(self._segment_path(oldest))
+            self._index = {k: v for k, v in self._index.items() if v[0] != oldest}
+            evicted = True
+        if evicted:
+            self._compact_index()
+
+    def close(self):
+        self._index_f.close()
@@ -0,0 +1,256 @@
+"""
+metadata_index.py
+
+One row per email (near-duplicates included) with its subject, sender, date
+and labels, in SQLite indexed on timestamp, sender and subject. api.py uses
+it to answer count / list / top-sender questions ("how many emails this
+week?", "list today's emails", "top senders this month") with a query
+instead of a vector search and an LLM call, so the answer is exact however
+many emails match.
+
+load_and_store.py keeps it current: store_stage adds stored emails and
+their near-duplicates, delete_emails and update_labels mirror Gmail
+changes. Emails are the same whichever collection is active, so there is
+one index for all of them.
+
+Counts are only exact once the index covers every stored email, so it is
+marked complete by rebuild() — run_sync() rebuilds an index that isn't
+(an empty store included) before syncing — and api.py falls back to RAG
+until then.
+
+Run: python metadata_index.py   # (re)build from the active collection and sync store
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from email.utils import parsedate_to_datetime
+
+from dedup import sender_key
+from vector_store import CHROMA_DIR
+
+METADATA_DB_PATH = os.path.join(CHROMA_DIR, "metadata.db")
+LIST_LIMIT       = 20   # emails listed in a structured answer
+TOP_SENDERS      = 10
+
+_WORDS  = re.compile(r"[\w'@.+-]+")
+_COUNT  = re.compile(r"\b(?:how many|count|number of|total)\b")
+_TOP    = re.compile(
+    r"\btop senders?\b|\bmost (?:frequent|active) senders?\b|\bbusiest senders?\b"
+    r"|\bwho (?:sends|sent|emails|emailed|mails|mailed) me (?:the )?most\b"
+)
+_LIST   = re.compile(r"\b(?:list|show|what|which|any|anything|latest|last|newest|recent|most recent)\b")
+_LIMIT  = re.compile(r"\b(?:latest|last|newest|recent|top)\s+(\d{1,3})\b")
+_SENDER = re.compile(r"\bfrom\s+(?!today\b|yesterday\b|this\b|last\b|past\b|the\b)([\w.@+-]+)")
+# Words a question can contain and still be answerable from metadata alone
+_FILLER = frozenset("""
+    a all am an and any anything are at be been come came did do does email emails for get got
+    have has how i in inbox is it many me mail mails message messages most my new newest number
+    of on or please received receive show list what which who count total today tonight yesterday
+    this morning week month past last latest recent days day 7 30 so far the there to top
+    sender senders send sends sent frequent active busiest were was s i've i'd much
+""".split())
+
+_index      = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide MetadataIndex, opened on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MetadataIndex()
+        return _index
+
+
+def parse_timestamp(date_str):
+    try:
+        return int(parsedate_to_datetime(date_str).timestamp())
+    except Exception:
+        return 0
+
+
+def parse_question(question):
+    """{"kind": "count"|"list"|"top_senders", "sender", "limit"} when the question can be
+    answered from metadata alone, else None (it asks about content)."""
+    q      = question.lower()
+    sender = _SENDER.search(q)
+    limit  = _LIMIT.search(q)
+    rest   = _SENDER.sub(" ", q) if sender else q
+    words  = [re.sub(r"'s$", "", w).strip(".'") for w in _WORDS.findall(rest)]
+    if any(w and w not in _FILLER and not w.isdigit() for w in words):
+        return None
+
+    if _TOP.search(q):
+        kind = "top_senders"
+    elif _COUNT.search(q):
+        kind = "count"
+    elif _LIST.search(q):
+        kind = "list"
+    else:
+        return None
+    return {
+        "kind":   kind,
+        "sender": sender.group(1).strip(".") if sender else None,
+        "limit":  min(int(limit.group(1)), 100) if limit else None,
+    }
+
+
+def email_row(email, canonical_id=None):
+    """Row from an email dict or chunk metadata (labels as a list or "A,B")."""
+    labels = email.get("labels") or ""
+    if not isinstance(labels, str):
+        labels = ",".join(labels)
+    timestamp = email.get("timestamp") or parse_timestamp(email.get("date", ""))
+    return (
+        email["id"], canonical_id or email["id"], email.get("subject", ""), email.get("from", ""),
+        sender_key(email.get("from", "")), email.get("date", ""), timestamp, labels,
+    )
+
+
+class MetadataIndex:
+    def __init__(self, path=METADATA_DB_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS emails (
+                id TEXT PRIMARY KEY, canonical_id TEXT, subject TEXT, sender TEXT,
+                sender_key TEXT, date TEXT, timestamp INTEGER, labels TEXT
+            );
+            CREATE INDEX IF NOT EXISTS emails_timestamp ON emails(timestamp);
+            CREATE INDEX IF NOT EXISTS emails_sender    ON emails(sender_key, timestamp);
+            CREATE INDEX IF NOT EXISTS emails_subject   ON emails(subject);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+
+    # ── Writes ─────────────────────────────────────────────────────────────────
+
+    def upsert(self, rows):
+        """rows: tuples from email_row()."""
+        rows = list(rows)
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO emails VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def delete(self, msg_ids):
+        msg_ids = list(msg_ids)
+        with self._lock:
+            for i in range(0, len(msg_ids), 500):
+                part = msg_ids[i : i + 500]
+                self._conn.execute(f"DELETE FROM emails WHERE id IN ({','.join('?' * len(part))})", part)
+            self._conn.commit()
+
+    def update_labels(self, labels):
+        """labels: {msg_id: [labelIds]}."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE emails SET labels = ? WHERE id = ?",
+                [(",".join(v), k) for k, v in labels.items()],
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM emails")
+            self._conn.execute("DELETE FROM meta WHERE key = 'complete'")
+            self._conn.commit()
+
+    def mark_complete(self):
+        """Every stored email is indexed: only rebuild() may say so."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+            self._conn.commit()
+
+    # ── Queries ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _where(since, until, sender):
+        clauses, params = ["1 = 1"], []
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if sender:
+            clauses.append("sender LIKE ?")
+            params.append(f"%{sender}%")
+        return " AND ".join(clauses), params
+
+    def is_complete(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM meta WHERE key = 'complete'").fetchone() is not None
+
+    def count(self, since=None, until=None, sender=None):
+        where, params = self._where(since, until, sender)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM emails WHERE {where}", params).fetchone()[0]
+
+    def latest(self, since=None, until=None, sender=None, limit=LIST_LIMIT):
+        """Newest emails first, as {"id", "subject", "from", "date", "timestamp"}."""
+        where, params = self._where(since, until, sender)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, subject, sender, date, timestamp FROM emails WHERE {where} "
+                "ORDER BY timestamp DESC LIMIT ?", params + [limit],
+            ).fetchall()
+        return [dict(zip(("id", "subject", "from", "date", "timestamp"), r)) for r in rows]
+
+    def top_senders(self, since=None, until=None, limit=TOP_SENDERS):
+        """[(From header, count)] of the senders with the most emails."""
+        where, params = self._where(since, until, None)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT MAX(sender), COUNT(*) AS n FROM emails WHERE {where} "
+                "GROUP BY sender_key ORDER BY n DESC LIMIT ?", params + [limit],
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ── Rebuild ────────────────────────────────────────────────────────────────────
+
+def rebuild(collection, index, state=None, page=5000):
+    """Re-create the index from a Chroma collection's chunk metadata, plus the
+    near-duplicates recorded in the sync store. Returns the number of emails."""
+    index.clear()
+    senders, offset = {}, 0  # canonical email id -> From header
+    while True:
+        found = collection.get(include=["metadatas"], limit=page, offset=offset)
+        rows  = [email_row(m) for m in found["metadatas"] if m.get("id") and m["id"] not in senders]
+        senders.update((m["id"], m.get("from", "")) for m in found["metadatas"] if m.get("id"))
+        index.upsert(rows)
+        offset += len(found["ids"])
+        if len(found["ids"]) < page:
+            break
+
+    count = len(senders)
+    if state is not None:
+        duplicates = [
+            email_row({**o, "from": senders[canonical]}, canonical)
+            for canonical, occurrences in state.occurrences(senders).items()
+            for o in occurrences if o["id"] != canonical
+        ]
+        index.upsert(duplicates)
+        count += len(duplicates)
+    index.mark_complete()
+    return count
+
+
+if __name__ == "__main__":
+    from sync_store import SYNC_DB_PATH, SyncStore
+    from vector_store import open_collection, read_active
+
+    name  = read_active()["collection"]
+    state = SyncStore() if os.path.exists(SYNC_DB_PATH) else None
+    count = rebuild(open_collection(None, name), MetadataIndex(), state)
+    print(f"Indexed {count} emails of {name} into {METADATA_DB_PATH}")
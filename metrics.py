@@ -0,0 +1,220 @@
+"""
+metrics.py
+
+Stage timings, counters and token usage for api.py and load_and_store.py,
+rendered in the Prometheus text format (GET /metrics in api.py,
+--metrics-file in load_and_store.py). Standard library only.
+
+  with timed(QUERY_STAGE_SECONDS, "search"):
+      docs = ...
+
+observes the stage's duration in the histogram and, inside a request that
+called start_request(), adds it to that request's breakdown, which /query
+returns when the request sets "debug": true.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_request  = contextvars.ContextVar("metrics_request", default=None)
+_token_usage_handler = None
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock   = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(l, "") for l in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(l, "") for l in self.labels), 0)
+
+    def lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_text(dict(zip(self.labels, k)))} {_number(v)}" for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock   = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(l, "") for l in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def totals(self):
+        """{label values: (sum, count)}."""
+        with self._lock:
+            return {k: (s[-2], s[-1]) for k, s in self._series.items()}
+
+    def lines(self):
+        with self._lock:
+            items = sorted((k, list(s)) for k, s in self._series.items())
+        out = []
+        for key, series in items:
+            labels = dict(zip(self.labels, key))
+            for bound, count in zip(self.buckets, series):
+                out.append(f"{self.name}_bucket{_label_text({**labels, 'le': _number(bound)})} {count}")
+            out.append(f"{self.name}_bucket{_label_text({**labels, 'le': '+Inf'})} {series[-1]}")
+            out.append(f"{self.name}_sum{_label_text(labels)} {series[-2]:.6f}")
+            out.append(f"{self.name}_count{_label_text(labels)} {series[-1]}")
+        return out
+
+
+class Callback:
+    """Values read at render time from fn() -> [(labels dict, value)], for numbers
+    something else already keeps (cache hit counts, index sizes)."""
+
+    def __init__(self, name, help, fn, kind="gauge"):
+        self.name, self.help, self.fn, self.kind = name, help, fn, kind
+        _registry.append(self)
+
+    def lines(self):
+        return [f"{self.name}{_label_text(labels)} {_number(value)}" for labels, value in self.fn()]
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    out = []
+    for metric in _registry:
+        lines = metric.lines()
+        if lines:
+            out += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}", *lines]
+    return "\n".join(out) + "\n"
+
+
+# ── Metrics ────────────────────────────────────────────────────────────────────
+
+QUERY_STAGE_SECONDS = Histogram(
+    "mailmate_query_stage_seconds",
+    "Time per /query stage: intent, metadata, cache, lexical, embed, search, fallback_search, prompt, llm, total.",
+    ("stage",),
+)
+QUERIES_TOTAL = Counter(
+    "mailmate_queries_total", "Answered questions by endpoint and how they were answered.", ("endpoint", "path"),
+)
+LLM_TOKENS_TOTAL = Counter("mailmate_llm_tokens_total", "LLM tokens used.", ("kind",))
+SYNC_STAGE_SECONDS = Histogram(
+    "mailmate_sync_stage_seconds", "Time per sync pipeline stage: fetch, parse, split, embed, store.", ("stage",),
+)
+SYNC_ITEMS_TOTAL = Counter("mailmate_sync_items_total", "Emails and chunks processed by sync.", ("kind",))
+
+
+# ── Timing ─────────────────────────────────────────────────────────────────────
+
+def start_request():
+    """Collect this request's stage timings, token usage and notes; returns the dict."""
+    breakdown = {"timings": {}, "tokens": {}}
+    _request.set(breakdown)
+    return breakdown
+
+
+def note(key, value):
+    """Attach a value to the current request's breakdown, if one is being collected."""
+    breakdown = _request.get()
+    if breakdown is not None:
+        breakdown[key] = value
+
+
+@contextmanager
+def timed(histogram, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, stage=stage)
+        breakdown = _request.get()
+        if breakdown is not None:
+            timings = breakdown["timings"]
+            timings[stage] = round(timings.get(stage, 0) + elapsed * 1000, 2)  # ms
+
+
+def timed_iter(iterable, histogram, stage):
+    """Yield from iterable, timing each step (e.g. a fetcher's batches)."""
+    iterator = iter(iterable)
+    while True:
+        with timed(histogram, stage):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def stage_summary(histogram):
+    """"stage 1.23s (n), ..." from a histogram's totals, in the order stages first ran."""
+    return ", ".join(
+        f"{key[0]} {total:.2f}s ({count})" for key, (total, count) in histogram.totals().items()
+    )
+
+
+def count_tokens(response):
+    """Count an LLMResult's prompt / completion tokens from the chat model's usage metadata."""
+    usage = {}
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            usage["prompt"]     = usage.get("prompt", 0) + metadata.get("input_tokens", 0)
+            usage["completion"] = usage.get("completion", 0) + metadata.get("output_tokens", 0)
+    if not any(usage.values()):
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        usage = {"prompt": token_usage.get("prompt_tokens", 0), "completion": token_usage.get("completion_tokens", 0)}
+
+    breakdown = _request.get()
+    for kind, count in usage.items():
+        if count:
+            LLM_TOKENS_TOTAL.inc(count, kind=kind)
+            if breakdown is not None:
+                breakdown["tokens"][kind] = breakdown["tokens"].get(kind, 0) + count
+
+
+def token_usage_handler():
+    """LangChain callback handler running count_tokens on every LLM result. The
+    class is defined on first use, so importing metrics doesn't import LangChain."""
+    global _token_usage_handler
+    if _token_usage_handler is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class TokenUsageHandler(BaseCallbackHandler):
+            def on_llm_end(self, response, **kwargs):
+                count_tokens(response)
+
+        _token_usage_handler = TokenUsageHandler
+    return _token_usage_handler()
@@ -0,0 +1,117 @@
+"""
+pipeline.py
+
+Minimal streaming pipeline used by load_and_store.py.
+
+Each stage runs on its own thread(s) and stages are joined by bounded
+queues, so fetch, parse, split and embed overlap, a slow stage applies
+backpressure to the ones before it, and memory stays proportional to the
+queue sizes rather than to the size of the mailbox.
+
+Usage:
+  pipeline = Pipeline(source).stage(parse).stage(embed, workers=4)
+  for item in pipeline:      # the last step runs in the calling thread
+      store(item)
+"""
+
+import queue
+import threading
+
+PIPELINE_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+class Pipeline:
+    def __init__(self, source, queue_size=PIPELINE_QUEUE_SIZE):
+        """source: any iterable; it is consumed on a background thread."""
+        self.queue_size = queue_size
+        self._source    = source
+        self._stages    = []  # (fn, workers)
+        self._error     = None
+        self._stopped   = threading.Event()
+
+    def stage(self, fn, workers=1):
+        """Add a stage. fn(item) returns the item for the next stage, or None to drop it."""
+        self._stages.append((fn, workers))
+        return self
+
+    # ── Queue helpers that give up once the pipeline is stopped ────────────────
+
+    def _put(self, q, item):
+        while not self._stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stopped.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._stopped.set()
+
+    # ── Threads ────────────────────────────────────────────────────────────────
+
+    def _run_source(self, out_q):
+        try:
+            for item in self._source:
+                if not self._put(out_q, item):
+                    return
+            self._put(out_q, _DONE)
+        except BaseException as e:
+            self._fail(e)
+
+    def _run_stage(self, fn, in_q, out_q, remaining):
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _DONE:
+                    # Let sibling workers see it too; the last one out signals downstream.
+                    self._put(in_q, _DONE)
+                    with remaining["lock"]:
+                        remaining["workers"] -= 1
+                        last = remaining["workers"] == 0
+                    if last:
+                        self._put(out_q, _DONE)
+                    return
+                result = fn(item)
+                if result is not None and not self._put(out_q, result):
+                    return
+        except BaseException as e:
+            self._fail(e)
+
+    def __iter__(self):
+        queues  = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self._stages) + 1)]
+        threads = [threading.Thread(target=self._run_source, args=(queues[0],), daemon=True)]
+        for i, (fn, workers) in enumerate(self._stages):
+            remaining = {"workers": workers, "lock": threading.Lock()}
+            for _ in range(workers):
+                threads.append(threading.Thread(
+                    target=self._run_stage, args=(fn, queues[i], queues[i + 1], remaining), daemon=True,
+                ))
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            self._stopped.set()
+            for t in threads:
+                t.join()
+
+        if self._error is not None:
+            raise self._error
@@ -1,28 +1,17 @@
 import os
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_chroma import Chroma
+from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
+from context_packer import pack_context
+from vector_store import get_embeddings, open_collection
 
 load_dotenv()
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 
 def load_vectorstore():
-    """Load existing vector store"""
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        openai_api_base="https://models.inference.ai.azure.com",
-        openai_api_key=GITHUB_TOKEN
-    )
-    
-    vectorstore = Chroma(
-        persist_directory="./chroma_db",
-        embedding_function=embeddings
-    )
-    
-    return vectorstore
+    """Load the active collection with the embedding model it was built with"""
+    return open_collection(get_embeddings(max_retries=3))
 
 def detect_counting_question(question):
     """Detect if question asks for counting/aggregation"""
@@ -33,7 +22,7 @@ def detect_counting_question(question):
     question_lower = question.lower()
     return any(keyword in question_lower for keyword in counting_keywords)
 
-def create_rag_chain(vectorstore, k=3):
+def create_rag_chain():
     """Create RAG chain for querying"""
     llm = ChatOpenAI(
         model="gpt-4o-mini",
@@ -43,8 +32,6 @@ def create_rag_chain(vectorstore, k=3):
         max_tokens=1000
     )
     
-    retriever = vectorstore.as_retriever(search_kwargs={"k": k})
-    
     template = """Answer the question based on the following context from emails:
 
 Context: {context}
@@ -61,38 +48,28 @@ Answer:"""
     
     prompt = ChatPromptTemplate.from_template(template)
     
-    rag_chain = (
-        {"context": retriever, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-    
-    return rag_chain
+    return prompt | llm | StrOutputParser()
 
-def query_emails(vectorstore, question):
+def query_emails(vectorstore, question, rag_chain):
     """Query the email database with smart k selection"""
     k = 20 if detect_counting_question(question) else 5
     
     try:
-        rag_chain = create_rag_chain(vectorstore, k=k)
-        result = rag_chain.invoke(question)
+        # The packed context stays within CONTEXT_TOKEN_BUDGET, so no retry on tokens_limit_reached
+        docs = vectorstore.similarity_search(question, k=k)
+        context, _ = pack_context(docs)
+        result = rag_chain.invoke({"context": context, "question": question})
         print(f"\n{result}\n")
         
     except Exception as e:
-        if "tokens_limit_reached" in str(e) or "413" in str(e):
-            # Retry with smaller k
-            rag_chain = create_rag_chain(vectorstore, k=10)
-            result = rag_chain.invoke(question)
-            print(f"\n{result}\n")
-        else:
-            print(f"\nError: {e}\n")
+        print(f"\nError: {e}\n")
 
 def main():
     print("Email RAG Query System")
     print("-" * 40)
     
     vectorstore = load_vectorstore()
+    rag_chain = create_rag_chain()
     print("Ready! Type 'quit' to exit.\n")
     
     while True:
@@ -103,7 +80,7 @@ def main():
             break
         
         if question:
-            query_emails(vectorstore, question)
+            query_emails(vectorstore, question, rag_chain)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+query_cache.py
+
+In-memory caches for api.py, so repeated questions ("latest emails",
+"anything today?") skip the embedding call, the Chroma search and the LLM.
+
+  QueryEmbeddingCache — LRU of question text -> query embedding.
+  AnswerCache         — LRU of (normalized question, intent, k, date bucket)
+                        -> response. With a similarity threshold it also
+                        serves near-identical phrasings whose question
+                        embeddings are within that cosine similarity.
+
+Both are bound to a version and empty themselves when it changes. Question
+embeddings depend only on the text and the model, so QueryEmbeddingCache is
+bound to (provider, embed model); AnswerCache to the index version —
+(collection generation, data version), see vector_store.py — since a sync
+adds or removes mail.
+
+Used from the event loop only, so no locking.
+"""
+
+import re
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+_SPACES   = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s?!.]+$")
+
+
+def normalize_question(question):
+    """Lower-cased, whitespace-collapsed, without trailing punctuation."""
+    return _TRAILING.sub("", _SPACES.sub(" ", question.lower()).strip())
+
+
+def date_bucket():
+    # Answers mention "today" / "yesterday", so they only hold for the day they were made
+    return date.today().isoformat()
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits        = 0
+        self.misses      = 0
+        self.version     = None
+        self._entries    = OrderedDict()
+
+    def bind(self, version):
+        """Drop every entry when the index version changes."""
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def _get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries":  len(self._entries),
+            "hits":     self.hits,
+            "misses":   self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class QueryEmbeddingCache(_LRU):
+    def __init__(self, max_entries=1024):
+        super().__init__(max_entries)
+
+    def get(self, question):
+        vector = self._get(question.strip())
+        self._count(vector is not None)
+        return vector
+
+    def put(self, question, vector):
+        self._put(question.strip(), vector)
+
+
+class AnswerCache(_LRU):
+    def __init__(self, max_entries=256, similarity=None):
+        super().__init__(max_entries)
+        self.similarity = similarity  # None: exact matches only
+
+    @staticmethod
+    def key(question, intent, k):
+        return (normalize_question(question), intent, k, date_bucket())
+
+    def get(self, key):
+        entry = self._get(key)
+        self._count(entry is not None)
+        return entry[0] if entry else None
+
+    def get_similar(self, key, vector):
+        """Closest cached answer with the same intent / k / date bucket whose question
+        embedding is at least `similarity` cosine-similar to vector, or None.
+        Counts as a hit only when found; call after a get() miss."""
+        if not self.similarity or vector is None:
+            return None
+        candidates = [(k, e) for k, e in self._entries.items() if k[1:] == key[1:] and e[1] is not None]
+        if not candidates:
+            return None
+        matrix = np.array([e[1] for _, e in candidates], dtype=np.float32)
+        query  = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-9)
+        best   = int(scores.argmax())
+        if scores[best] < self.similarity:
+            return None
+        self.hits   += 1
+        self.misses -= 1
+        self._entries.move_to_end(candidates[best][0])
+        return candidates[best][1][0]
+
+    def put(self, key, response, vector=None):
+        self._put(key, (response, vector))
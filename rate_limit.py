@@ -0,0 +1,113 @@
+"""
+rate_limit.py
+
+Thread-safe rate limiting shared by the fetch and embed paths.
+
+  TokenBucket         — fixed-rate limiter measured in abstract cost units
+                        (e.g. Gmail quota units).
+  AdaptiveRateLimiter — AIMD token bucket: creeps its rate up while calls
+                        succeed, halves it on a 429 and honours Retry-After.
+"""
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` units/sec, holding at most `capacity` units.
+
+    acquire() reserves units up front and sleeps off any deficit, so requests
+    costing more than the capacity still go through — they just wait longer.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate     = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens  = self.capacity
+        self._updated = time.monotonic()
+        self._lock    = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens  = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, cost=1):
+        """Block until `cost` units are available. Returns the time spent waiting."""
+        with self._lock:
+            self._refill()
+            self._tokens -= cost
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """Hold back every caller for at least `seconds`, e.g. after a 429."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """Additive-increase / multiplicative-decrease rate limiter.
+
+    Every succeeded() call raises the rate by `increase` units/sec up to
+    max_rate; throttled() multiplies it by `decrease` (at most once per
+    `cooldown` seconds, so a burst of concurrent 429s counts once) and pauses
+    all callers for the server's Retry-After when one was given.
+    """
+
+    def __init__(self, rate, min_rate, max_rate, increase, decrease=0.5, cooldown=1.0):
+        super().__init__(rate)
+        self.min_rate        = float(min_rate)
+        self.max_rate        = float(max_rate)
+        self.increase        = float(increase)
+        self.decrease        = float(decrease)
+        self.cooldown        = cooldown
+        self._last_throttled = 0.0
+
+    def _set_rate(self, rate):
+        self._refill()
+        self.rate     = rate
+        self.capacity = rate  # one second of burst
+
+    def succeeded(self):
+        with self._lock:
+            self._set_rate(min(self.max_rate, self.rate + self.increase))
+
+    def throttled(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_throttled >= self.cooldown:
+                self._last_throttled = now
+                self._set_rate(max(self.min_rate, self.rate * self.decrease))
+        self.pause(retry_after if retry_after is not None else self.cooldown)
+
+
+def is_rate_limited(error):
+    """True for HTTP 429 errors from the Cohere/OpenAI SDKs or httpx, by status or message."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    err = str(error).lower()
+    return "429" in err or "rate limit" in err or "too many requests" in err
+
+
+def retry_after_seconds(error):
+    """The Retry-After header attached to an SDK error, in seconds, or None."""
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = next((v for k, v in dict(headers).items() if k.lower() == "retry-after"), None)
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
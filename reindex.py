@@ -0,0 +1,238 @@
+"""
+reindex.py
+
+Blue/green rebuild of the vector store, e.g. after switching embedding model
+or chunker, while api.py keeps serving the current collection.
+
+  1. Creates a new collection (emails_<model>_<time>, partitioned by month —
+     see vector_store.py) next to the active one and records it as
+     "building" in chroma_db/active_collection.json.
+  2. Copies every email from the active collection into it, re-embedding the
+     chunk text already stored in Chroma — Gmail is not needed. With --rechunk
+     each email's text is reassembled from its chunks and split again with
+     the current chunker.
+  3. Under the sync lock, catches up with anything load_and_store.py added,
+     deleted or relabelled meanwhile, then switches the active collection
+     atomically. api.py picks the new one up within a second.
+  4. After a grace period, drops the old collection.
+
+Interrupted runs resume: emails already present in the collection being
+built are skipped.
+
+Run: python reindex.py [--model embed-english-v3.0] [--provider cohere|fake] [--rechunk]
+     python reindex.py --gc      # only drop collections left behind by a crash
+"""
+
+import argparse
+import re
+import time
+
+import chromadb
+from langchain_core.documents import Document
+
+from context_packer import merge_chunks
+from embed_cache import EmbeddingCache
+import lexical_index
+from load_and_store import embed_stage, split_stage, upsert_chunks
+from pipeline import Pipeline
+from vector_store import (
+    CHROMA_DIR, EMBEDDINGS_PROVIDER, gc_collections, get_embeddings, open_collection,
+    read_active, set_building, switch_active, sync_lock,
+)
+
+REINDEX_EMAILS_PER_BATCH = 100
+GC_GRACE_SECONDS         = 10    # lets api.py requests on the old collection finish
+
+# Email-level metadata that can change after an email is stored (labels, near-duplicates)
+MUTABLE_FIELDS = ("labels", "occurrence_count", "occurrences", "latest_timestamp")
+
+
+def new_collection_name(model):
+    # Room for the "-mYYYYMM" partition suffix within Chroma's 63-character names
+    slug = re.sub(r"[^a-zA-Z0-9]+", "-", model).strip("-")[:32]
+    return f"emails_{slug}_{int(time.time())}"
+
+
+# ── Reading the source collection ──────────────────────────────────────────────
+
+def email_metadata(collection, page=5000):
+    """{email id: metadata of one of its chunks} for every email in a collection."""
+    emails, offset = {}, 0
+    while True:
+        found = collection.get(include=["metadatas"], limit=page, offset=offset)
+        for metadata in found["metadatas"]:
+            if metadata.get("id"):
+                emails.setdefault(metadata["id"], metadata)
+        if len(found["ids"]) < page:
+            return emails
+        offset += page
+
+
+def load_chunks(collection, msg_ids):
+    """{email id: [(chunk index, text, metadata)] in chunk order}."""
+    found  = collection.get(where={"id": {"$in": list(msg_ids)}}, include=["documents", "metadatas"])
+    emails = {}
+    for text, metadata in zip(found["documents"], found["metadatas"]):
+        emails.setdefault(metadata["id"], []).append((metadata.get("chunk", 0), text, metadata))
+    for chunks in emails.values():
+        chunks.sort(key=lambda c: c[0])
+    return emails
+
+
+def rebuild_email_text(chunks):
+    """An email's "header\\n\\nbody" reassembled from its stored chunks."""
+    header, body = merge_chunks(text for _, text, _ in chunks)
+    return f"{header}\n\n{body}" if header else body
+
+
+def to_item(emails, rechunk):
+    """A work item for embed_stage from {email id: chunks}."""
+    if not rechunk:
+        # Chunks stored before chunk numbering existed get their position as "chunk"
+        chunks = [
+            Document(page_content=text, metadata={**metadata, "chunk": i})
+            for email_chunks in emails.values() for i, (_, text, metadata) in enumerate(email_chunks)
+        ]
+        return {"emails": [], "chunks": chunks}
+
+    docs = []
+    for email_chunks in emails.values():
+        metadata = {k: v for k, v in email_chunks[0][2].items() if k != "chunk"}
+        docs.append(Document(page_content=rebuild_email_text(email_chunks), metadata=metadata))
+    return split_stage({"emails": [], "docs": docs})
+
+
+# ── Copying ────────────────────────────────────────────────────────────────────
+
+def copy_emails(source, target, msg_ids, embeddings, embed_cache, rechunk):
+    """Re-embed msg_ids from source into target. Returns (emails copied, emails failed)."""
+    msg_ids = list(msg_ids)
+    batches = (msg_ids[i : i + REINDEX_EMAILS_PER_BATCH] for i in range(0, len(msg_ids), REINDEX_EMAILS_PER_BATCH))
+    pipeline = (
+        Pipeline(batches)
+        .stage(lambda ids: to_item(load_chunks(source, ids), rechunk))
+        .stage(lambda item: embed_stage(item, embeddings, embed_cache), workers=2)
+    )
+
+    copied, failed = 0, set()
+    for item in pipeline:
+        bad  = {c.metadata["id"] for c, v in zip(item["chunks"], item["vectors"]) if v is None}
+        good = [(c, v) for c, v in zip(item["chunks"], item["vectors"]) if c.metadata["id"] not in bad]
+        if good:
+            upsert_chunks(target, [c for c, _ in good], [v for _, v in good])
+        copied += len({c.metadata["id"] for c, _ in good})
+        failed |= bad
+        print(f"  Copied {copied}/{len(msg_ids)} emails"
+              + (f" ({len(failed)} failed)" if failed else ""))
+    return copied, failed
+
+
+def sync_mutable_metadata(source_emails, target):
+    """Copy labels / occurrence metadata changed in the source since an email was copied."""
+    target_emails = email_metadata(target)
+    stale = [
+        msg_id for msg_id, metadata in source_emails.items()
+        if msg_id in target_emails
+        and any(metadata.get(f) != target_emails[msg_id].get(f) for f in MUTABLE_FIELDS)
+    ]
+    for i in range(0, len(stale), REINDEX_EMAILS_PER_BATCH):
+        part  = stale[i : i + REINDEX_EMAILS_PER_BATCH]
+        found = target.get(where={"id": {"$in": part}}, include=["metadatas"])
+        metadatas = [
+            {**m, **{f: source_emails[m["id"]][f] for f in MUTABLE_FIELDS if f in source_emails[m["id"]]}}
+            for m in found["metadatas"]
+        ]
+        target.update(ids=found["ids"], metadatas=metadatas)
+    return len(stale)
+
+
+def catch_up(source, target, embeddings, embed_cache, rechunk):
+    """Make target hold exactly the emails in source. Returns emails that failed to embed."""
+    source_emails = email_metadata(source)
+    target_ids    = set(email_metadata(target))
+    missing       = [m for m in source_emails if m not in target_ids]
+    removed       = [m for m in target_ids if m not in source_emails]
+
+    failed = set()
+    if missing:
+        print(f"Copying {len(missing)} emails...")
+        _, failed = copy_emails(source, target, missing, embeddings, embed_cache, rechunk)
+    if removed:
+        target.delete(where={"id": {"$in": removed}})
+        lexical_index.for_collection(target.name).delete(removed)
+        print(f"Removed {len(removed)} emails deleted from the source meanwhile.")
+    relabelled = sync_mutable_metadata(source_emails, target)
+    if relabelled:
+        print(f"Updated metadata of {relabelled} emails changed meanwhile.")
+    return failed
+
+
+# ── Main ───────────────────────────────────────────────────────────────────────
+
+def gc(client):
+    """Drop retired collections and their BM25 indexes. Returns the dropped names."""
+    dropped = gc_collections(client)
+    for name in dropped:
+        lexical_index.drop(name)
+    return dropped
+
+
+def reindex(model, provider, rechunk, grace=GC_GRACE_SECONDS):
+    active   = read_active()
+    building = active.get("building")
+    wanted   = {"embed_model": model, "provider": provider, "rechunk": rechunk}
+
+    if building and {k: building.get(k) for k in wanted} == wanted:
+        name        = building["collection"]
+        partitioned = building.get("partitioned", False)  # builds started before partitioning weren't
+        print(f"Resuming    : {name}")
+    else:
+        name, partitioned = new_collection_name(model), True
+        set_building({"collection": name, **wanted, "partitioned": True, "started_at": int(time.time())})
+        print(f"Building    : {name}")
+    print(f"Source      : {active['collection']} ({active['embed_model']})")
+    print(f"Model       : {model} ({provider}){' — rechunking' if rechunk else ''}")
+    print()
+
+    embeddings  = get_embeddings(model, provider)
+    embed_cache = EmbeddingCache(model=embeddings.model)
+    source      = open_collection(get_embeddings(active["embed_model"], active.get("provider")), active["collection"])
+    target      = open_collection(embeddings, name, partitioned)
+
+    # Bulk of the work runs while load_and_store.py and api.py carry on
+    failed = catch_up(source, target, embeddings, embed_cache, rechunk)
+    if failed:
+        print(f"\n{len(failed)} emails failed to embed — not switching. Re-run to resume.")
+        return False
+
+    print("\nWaiting for any running sync to finish...")
+    with sync_lock():
+        failed = catch_up(source, target, embeddings, embed_cache, rechunk)
+        if failed:
+            print(f"\n{len(failed)} emails failed to embed — not switching. Re-run to resume.")
+            return False
+        pointer = switch_active(name, model, provider, partitioned)
+    print(f"\nSwitched to {name} (generation {pointer['generation']}, "
+          f"{target.count()} vectors in {len(target.partitions())} partitions).")
+
+    print(f"Dropping the old collection in {grace}s...")
+    time.sleep(grace)
+    dropped = gc(target._client)
+    print(f"Dropped: {', '.join(dropped) or 'nothing'}")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the vector store into a new collection and switch to it.")
+    parser.add_argument("--model", default=read_active()["embed_model"], help="embedding model for the new collection")
+    parser.add_argument("--provider", default=EMBEDDINGS_PROVIDER, choices=["cohere", "fake"])
+    parser.add_argument("--rechunk", action="store_true", help="re-split emails with the current chunker")
+    parser.add_argument("--grace", type=float, default=GC_GRACE_SECONDS, help="seconds before dropping the old collection")
+    parser.add_argument("--gc", action="store_true", help="only drop collections that are neither active nor being built")
+    args = parser.parse_args()
+
+    if args.gc:
+        dropped = gc(chromadb.PersistentClient(path=CHROMA_DIR))
+        print(f"Dropped: {', '.join(dropped) or 'nothing'}")
+    else:
+        reindex(args.model, args.provider, args.rechunk, args.grace)
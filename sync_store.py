@@ -0,0 +1,332 @@
+"""
+sync_store.py
+
+Transactional sync state for load_and_store.py, in SQLite (WAL mode).
+
+Tables:
+  messages    — one row per Gmail message id with its pipeline status
+                (fetched → embedded → stored, or failed) and timestamps
+  state       — key/value sync cursor: last_sync_date, history_id, last_run_at
+  retry_queue — chunks of emails whose embedding failed, re-attempted next run
+  fetch_failures — ids Gmail failed to return (5xx, retries exhausted), fetched
+                   again next run; the history cursor moves past them regardless
+  fingerprints — SimHash of every synced email and the canonical email it was
+                 collapsed into (itself for canonicals), see dedup.py
+
+Replaces processed_ids.json, sync_state.json and retry_queue.jsonl, which
+are imported once on first use. Writes are small incremental transactions
+instead of rewriting the whole id set after every batch.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SYNC_DB_PATH         = "./sync_state.db"
+LEGACY_PROGRESS_FILE = "./processed_ids.json"
+LEGACY_STATE_FILE    = "./sync_state.json"
+LEGACY_RETRY_FILE    = "./retry_queue.jsonl"
+
+FETCHED  = "fetched"
+EMBEDDED = "embedded"
+STORED   = "stored"
+FAILED   = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id         TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    stored_at  REAL
+);
+CREATE INDEX IF NOT EXISTS messages_status ON messages(status);
+CREATE TABLE IF NOT EXISTS state (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS retry_queue (
+    id        TEXT PRIMARY KEY,
+    chunks    TEXT NOT NULL,
+    attempts  INTEGER NOT NULL DEFAULT 0,
+    queued_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fetch_failures (
+    id        TEXT PRIMARY KEY,
+    error     TEXT,
+    attempts  INTEGER NOT NULL DEFAULT 1,
+    failed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id           TEXT PRIMARY KEY,
+    canonical_id TEXT NOT NULL,
+    sender       TEXT NOT NULL,
+    simhash      INTEGER,
+    subject      TEXT,
+    date         TEXT,
+    timestamp    INTEGER
+);
+CREATE INDEX IF NOT EXISTS fingerprints_canonical ON fingerprints(canonical_id);
+"""
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value is not None and value < 0 else value
+
+
+class SyncStore:
+    def __init__(self, path=SYNC_DB_PATH):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate_legacy()
+        # In-memory mirror of stored ids: membership checks happen per message on hot paths.
+        # The parse and embed threads write too, so it changes under _lock with the rows.
+        self.processed_ids = {
+            row[0] for row in self._conn.execute("SELECT id FROM messages WHERE status = ?", (STORED,))
+        }
+
+    def _migrate_legacy(self):
+        (rows,) = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()
+        (keys,) = self._conn.execute("SELECT COUNT(*) FROM state").fetchone()
+        if rows or keys:
+            return
+
+        ids, state, retry = [], {}, []
+        if os.path.exists(LEGACY_PROGRESS_FILE):
+            try:
+                with open(LEGACY_PROGRESS_FILE) as f:
+                    ids = json.load(f)
+            except ValueError:
+                ids = []
+        if os.path.exists(LEGACY_STATE_FILE):
+            try:
+                with open(LEGACY_STATE_FILE) as f:
+                    state = json.load(f)
+            except ValueError:
+                state = {}
+        if os.path.exists(LEGACY_RETRY_FILE):
+            with open(LEGACY_RETRY_FILE) as f:
+                for line in f:
+                    try:
+                        retry.append(json.loads(line))
+                    except ValueError:
+                        continue
+        if not ids and not state and not retry:
+            return
+
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO messages (id, status, updated_at, stored_at) VALUES (?, ?, ?, ?)",
+                [(msg_id, STORED, now, now) for msg_id in ids],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                [(k, str(v)) for k, v in state.items() if v],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO retry_queue (id, chunks, attempts, queued_at) VALUES (?, ?, 1, ?)",
+                [(r["id"], json.dumps(r["chunks"]), now) for r in retry],
+            )
+        print(f"Imported {len(ids)} processed ids and sync state from legacy JSON files.")
+
+    # ── Message status ─────────────────────────────────────────────────────────
+
+    def is_processed(self, msg_id):
+        return msg_id in self.processed_ids
+
+    def mark(self, msg_ids, status):
+        """Record status for msg_ids in one transaction."""
+        msg_ids = list(msg_ids)
+        if not msg_ids:
+            return
+        now       = time.time()
+        stored_at = now if status == STORED else None
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO messages (id, status, updated_at, stored_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at, "
+                    "stored_at = COALESCE(excluded.stored_at, messages.stored_at)",
+                    [(msg_id, status, now, stored_at) for msg_id in msg_ids],
+                )
+            if status == STORED:
+                self.processed_ids.update(msg_ids)
+            else:
+                self.processed_ids.difference_update(msg_ids)
+
+    def commit_batch(self, stored_ids, failed_records, fingerprints=()):
+        """After a vector write: mark stored_ids stored and queue failed_records for retry,
+        atomically. failed_records: [{"id", "chunks": [{"text", "metadata"}]}].
+        fingerprints: [{"id", "canonical_id", "sender", "simhash", "subject", "date", "timestamp"}]."""
+        stored_ids = list(stored_ids)
+        now        = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO fingerprints "
+                    "(id, canonical_id, sender, simhash, subject, date, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (f["id"], f["canonical_id"], f["sender"], _to_signed(f["simhash"]),
+                         f["subject"], f["date"], f["timestamp"])
+                        for f in fingerprints
+                    ],
+                )
+                self._conn.executemany(
+                    "INSERT INTO messages (id, status, updated_at, stored_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at, "
+                    "stored_at = excluded.stored_at",
+                    [(msg_id, STORED, now, now) for msg_id in stored_ids],
+                )
+                self._conn.executemany("DELETE FROM retry_queue WHERE id = ?", [(msg_id,) for msg_id in stored_ids])
+                fetched = stored_ids + [r["id"] for r in failed_records]  # stored or queued for embedding
+                self._conn.executemany("DELETE FROM fetch_failures WHERE id = ?", [(m,) for m in fetched])
+                self._conn.executemany(
+                    "INSERT INTO messages (id, status, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                    [(r["id"], FAILED, now) for r in failed_records],
+                )
+                self._conn.executemany(
+                    "INSERT INTO retry_queue (id, chunks, attempts, queued_at) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET chunks = excluded.chunks, attempts = retry_queue.attempts + 1",
+                    [(r["id"], json.dumps(r["chunks"]), now) for r in failed_records],
+                )
+            self.processed_ids.update(stored_ids)
+            self.processed_ids.difference_update(r["id"] for r in failed_records)
+
+    def remove(self, msg_ids):
+        msg_ids = list(msg_ids)
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("DELETE FROM messages WHERE id = ?", [(m,) for m in msg_ids])
+                self._conn.executemany("DELETE FROM retry_queue WHERE id = ?", [(m,) for m in msg_ids])
+                self._conn.executemany("DELETE FROM fetch_failures WHERE id = ?", [(m,) for m in msg_ids])
+                self._conn.executemany("DELETE FROM fingerprints WHERE id = ?", [(m,) for m in msg_ids])
+            self.processed_ids.difference_update(msg_ids)
+
+    def status_counts(self):
+        return dict(self._conn.execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall())
+
+    # ── Near-duplicates ────────────────────────────────────────────────────────
+
+    def fingerprint_rows(self):
+        """(id, canonical_id, sender, simhash) for every synced email, for dedup.DuplicateIndex."""
+        return [
+            (msg_id, canonical_id, sender, _to_unsigned(fingerprint))
+            for msg_id, canonical_id, sender, fingerprint in self._conn.execute(
+                "SELECT id, canonical_id, sender, simhash FROM fingerprints"
+            )
+        ]
+
+    def duplicates_of(self, canonical_ids):
+        """{msg_id: canonical_id} for emails collapsed into any of canonical_ids,
+        excluding the canonicals themselves."""
+        canonical_ids = list(canonical_ids)
+        found = {}
+        for i in range(0, len(canonical_ids), 500):
+            part = canonical_ids[i : i + 500]
+            found.update(self._conn.execute(
+                f"SELECT id, canonical_id FROM fingerprints WHERE canonical_id IN ({','.join('?' * len(part))}) "
+                "AND id != canonical_id", part,
+            ).fetchall())
+        return found
+
+    def duplicate_count(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM fingerprints WHERE id != canonical_id").fetchone()
+        return count
+
+    def canonical_of(self, msg_ids):
+        """{msg_id: canonical_id} for the given ids that have a fingerprint."""
+        msg_ids = list(msg_ids)
+        found = {}
+        for i in range(0, len(msg_ids), 500):
+            part = msg_ids[i : i + 500]
+            found.update(self._conn.execute(
+                f"SELECT id, canonical_id FROM fingerprints WHERE id IN ({','.join('?' * len(part))})", part,
+            ).fetchall())
+        return found
+
+    def occurrences(self, canonical_ids):
+        """{canonical_id: [{"id", "subject", "date", "timestamp"}, ...]} newest first,
+        including the canonical email itself."""
+        canonical_ids = list(canonical_ids)
+        found = {}
+        for i in range(0, len(canonical_ids), 500):
+            part = canonical_ids[i : i + 500]
+            for canonical_id, msg_id, subject, date, timestamp in self._conn.execute(
+                "SELECT canonical_id, id, subject, date, timestamp FROM fingerprints "
+                f"WHERE canonical_id IN ({','.join('?' * len(part))}) ORDER BY timestamp DESC", part,
+            ):
+                found.setdefault(canonical_id, []).append(
+                    {"id": msg_id, "subject": subject, "date": date, "timestamp": timestamp}
+                )
+        return found
+
+    # ── Retry queue ────────────────────────────────────────────────────────────
+
+    def retry_records(self):
+        return [
+            {"id": msg_id, "chunks": json.loads(chunks), "attempts": attempts}
+            for msg_id, chunks, attempts in self._conn.execute(
+                "SELECT id, chunks, attempts FROM retry_queue ORDER BY queued_at"
+            )
+        ]
+
+    def retry_count(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM retry_queue").fetchone()
+        return count
+
+    # ── Fetch failures ─────────────────────────────────────────────────────────
+
+    def record_fetch_failures(self, failures):
+        """failures: {msg_id: error} from GmailFetcher.failures; counts an attempt for each."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO fetch_failures (id, error, attempts, failed_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(id) DO UPDATE SET error = excluded.error, failed_at = excluded.failed_at, "
+                "attempts = fetch_failures.attempts + 1",
+                [(msg_id, str(error), now) for msg_id, error in failures.items()],
+            )
+
+    def fetch_failure_ids(self, max_attempts):
+        """Ids to fetch again: failed fewer than max_attempts times, oldest failure first."""
+        return [
+            msg_id for (msg_id,) in self._conn.execute(
+                "SELECT id FROM fetch_failures WHERE attempts < ? ORDER BY failed_at", (max_attempts,)
+            )
+        ]
+
+    def fetch_failure_count(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM fetch_failures").fetchone()
+        return count
+
+    # ── Sync cursor ────────────────────────────────────────────────────────────
+
+    def get_state(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, **values):
+        """Update several cursor keys in one transaction; None deletes a key."""
+        with self._lock, self._conn:
+            for key, value in values.items():
+                if value is None:
+                    self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, str(value))
+                    )
+
+    def close(self):
+        self._conn.close()
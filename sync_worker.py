@@ -0,0 +1,96 @@
+"""
+sync_worker.py
+
+Incremental Gmail sync inside api.py: load_and_store.sync_once() runs on a
+single background thread, every SYNC_INTERVAL seconds (SYNC_INTERVAL=0, the
+default, only on POST /sync). It has its own executor, so the event loop and
+the search pool never wait for it; sync_once() takes sync_lock(), so it also
+never overlaps a cron run of load_and_store.py or a reindex switch.
+
+When a run changes the index, on_change() is called on the sync thread so
+api.py re-reads the data version right away — new months are opened before
+the next request, which empties the query caches — instead of up to
+ACTIVE_CHECK_INTERVAL later.
+
+status() is what /stats reports: whether a run is in progress with its
+emails and chunks so far, and the outcome of the last run.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from metrics import SYNC_ITEMS_TOTAL
+
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", "0"))  # seconds between background syncs; 0 = on demand only
+PROGRESS      = ("emails", "duplicates", "chunks")
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class SyncWorker:
+    def __init__(self, interval=SYNC_INTERVAL, on_change=None):
+        self.interval  = interval
+        self.on_change = on_change
+        self._pool     = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sync")
+        self._lock     = threading.Lock()
+        self._baseline = None
+        self._status   = {"running": False, "current": None, "last_run": None,
+                          "runs": 0, "failures": 0, "next_run_at": None}
+
+    def _progress(self):
+        # SYNC_ITEMS_TOTAL counts every run in this process; a run's progress is the difference
+        return {kind: int(SYNC_ITEMS_TOTAL.value(kind=kind) - self._baseline[kind]) for kind in PROGRESS}
+
+    def trigger(self):
+        """Start a sync unless one is running; returns True if this call started it."""
+        with self._lock:
+            if self._status["running"]:
+                return False
+            self._baseline = {kind: SYNC_ITEMS_TOTAL.value(kind=kind) for kind in PROGRESS}
+            self._status.update(running=True, current={"started_at": _now()})
+            self._pool.submit(self._run)
+            return True
+
+    def _run(self):
+        import load_and_store  # Gmail and Cohere clients — only once a sync actually runs
+
+        started = time.monotonic()
+        run     = {**self._status["current"], "changed": False, "error": None}
+        try:
+            run["changed"] = load_and_store.sync_once()
+        except Exception as e:
+            run["error"] = f"{type(e).__name__}: {e}"
+            print(f"Background sync failed — {run['error']}")
+        run.update(finished_at=_now(), seconds=round(time.monotonic() - started, 1), **self._progress())
+
+        with self._lock:
+            self._status.update(running=False, current=None, last_run=run)
+            self._status["runs"]     += 1
+            self._status["failures"] += run["error"] is not None
+        if run["changed"] and self.on_change:
+            self.on_change()
+
+    async def run_forever(self):
+        """Trigger a sync every `interval` seconds; started as a task by api.py's lifespan."""
+        while True:
+            self._status["next_run_at"] = (datetime.now() + timedelta(seconds=self.interval)).isoformat(
+                timespec="seconds")
+            await asyncio.sleep(self.interval)
+            self.trigger()
+
+    def status(self):
+        with self._lock:
+            status = {"interval_seconds": self.interval or None, **self._status}
+            if status["current"]:
+                status["current"] = {**status["current"], **self._progress()}
+        return status
+
+    def shutdown(self):
+        # A run in progress finishes in the background; its writes are committed per batch
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,30 @@
+"""Shared fixtures. Tests run offline: fake embeddings and chat model, no telemetry."""
+
+import os
+
+os.environ.setdefault("EMBEDDINGS_PROVIDER", "fake")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import pytest
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """An empty working directory: chroma_db, the sync store and the caches are all
+    opened relative to it, and the process-wide handles to them are reset."""
+    from chromadb.api.client import SharedSystemClient
+
+    import lexical_index
+    import metadata_index
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metadata_index, "_index", None)
+    monkeypatch.setattr(lexical_index, "_indexes", {})
+    SharedSystemClient.clear_system_cache()
+    yield tmp_path
+    if metadata_index._index is not None:
+        metadata_index._index.close()
+    for index in lexical_index._indexes.values():
+        index.close()
+    SharedSystemClient.clear_system_cache()
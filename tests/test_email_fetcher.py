@@ -0,0 +1,77 @@
+"""GmailFetcher batch fetching against fakes.SyntheticGmailService: partial failures,
+retries of rate-limited and transient errors, and whole-batch failures."""
+
+from email_fetcher import GmailFetcher
+from fakes import FakeHttpError, SyntheticGmailService
+
+IDS = [f"syn{i}" for i in range(6)]
+
+
+def make_fetcher(service):
+    fetcher = GmailFetcher(service=service, concurrency=1, quota_per_sec=1e9)
+    fetcher.MAX_BACKOFF = 0  # back off for random() < 1s instead of 2**attempt
+    return fetcher
+
+
+class FailingBatchService(SyntheticGmailService):
+    """Every batch request fails as a whole with `status` for the first `times` calls."""
+
+    def __init__(self, count, status, times):
+        super().__init__(count)
+        self.status, self.times = status, times
+
+    def new_batch_http_request(self, callback=None):
+        batch   = super().new_batch_http_request(callback)
+        execute = batch.execute
+
+        def failing_execute():
+            if self.times:
+                self.times -= 1
+                self.batch_calls += 1
+                raise FakeHttpError(self.status, "backendError" if self.status >= 500 else "badRequest")
+            execute()
+
+        batch.execute = failing_execute
+        return batch
+
+
+def test_partial_batch_failure_keeps_successes():
+    service = SyntheticGmailService(len(IDS), fail_ids={"syn2"}, rate_limit_ids={"syn4"})
+    fetcher = make_fetcher(service)
+
+    emails = fetcher._get_email_contents(IDS)
+
+    assert [e["id"] for e in emails] == ["syn0", "syn1", "syn3", "syn4", "syn5"]
+    assert set(fetcher.failures) == {"syn2"}
+    assert "404" in fetcher.failures["syn2"]
+    assert service.get_calls == len(IDS) + 1  # only the rate-limited message is fetched twice
+
+
+def test_whole_batch_client_error_is_not_retried():
+    service = FailingBatchService(len(IDS), status=400, times=1)
+    fetcher = make_fetcher(service)
+
+    assert fetcher._get_email_contents(IDS) == []
+    assert set(fetcher.failures) == set(IDS)
+    assert service.batch_calls == 1
+
+
+def test_whole_batch_failure_replaces_earlier_error():
+    service = FailingBatchService(len(IDS), status=400, times=1)
+    fetcher = make_fetcher(service)
+    fetcher.failures["syn1"] = "an error from an earlier run"
+
+    fetcher._get_email_contents(IDS)
+
+    assert "400" in fetcher.failures["syn1"]
+
+
+def test_whole_batch_server_error_is_retried():
+    service = FailingBatchService(len(IDS), status=503, times=1)
+    fetcher = make_fetcher(service)
+
+    emails = fetcher._get_email_contents(IDS)
+
+    assert [e["id"] for e in emails] == IDS
+    assert fetcher.failures == {}
+    assert service.batch_calls == 2
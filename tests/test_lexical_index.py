@@ -0,0 +1,45 @@
+"""LexicalIndex: BM25 search, exact identifier search, and deletes through chunk_rows."""
+
+import pytest
+from langchain_core.documents import Document
+
+from lexical_index import LexicalIndex, exact_query
+
+
+def chunk(msg_id, subject, body, sender="billing@acme.example.com"):
+    return Document(page_content=f"Subject: {subject}\n\n{body}",
+                    metadata={"id": msg_id, "subject": subject, "from": sender})
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical" / "test.db"))
+    index.upsert(["a-0", "b-0", "c-0"], [
+        chunk("a", "Invoice INV-20931 from Acme", "Invoice INV-20931 for $120 is attached."),
+        chunk("b", "Invoice INV-55555 from Acme", "Invoice INV-55555 for $80 is attached."),
+        chunk("c", "Lunch on Friday", "Shall we try the new place?", sender="Ana <ana@example.com>"),
+    ])
+    yield index
+    index.close()
+
+
+def test_exact_query_phrases():
+    assert exact_query("where is invoice INV-20931?") == '"inv 20931"'
+    assert exact_query('mail from ana@example.com about "new place"') == '"ana example com" OR "new place"'
+    assert exact_query("anything about lunch") is None
+
+
+def test_exact_search_needs_the_identifier_itself(index):
+    assert index.search_exact("invoice INV-20931", 10) == ["a-0"]
+    assert index.search_exact("invoice INV-99999", 10) == []
+    assert set(index.search("invoice INV-99999", 10)) == {"a-0", "b-0"}  # the words still match
+
+
+def test_delete_and_reindex(index):
+    index.delete(["a"])
+    assert index.search("invoice", 10) == ["b-0"]
+    assert index.count() == 2
+
+    index.upsert(["b-0"], [chunk("b", "Invoice INV-55555 paid", "Thanks, paid.")])
+    assert index.count() == 2
+    assert index.search_exact("INV-55555", 10) == ["b-0"]
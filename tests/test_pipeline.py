@@ -0,0 +1,85 @@
+"""Pipeline: errors reach the caller, threads exit when the consumer stops early,
+and multi-worker stages hand the end of the stream on exactly once."""
+
+import itertools
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline
+
+TIMEOUT = 10
+
+
+def collect(pipeline):
+    """list(pipeline) on a helper thread, failing instead of hanging on a deadlock."""
+    result = {}
+
+    def run():
+        try:
+            result["items"] = list(pipeline)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), "pipeline did not finish"
+    if "error" in result:
+        raise result["error"]
+    return result["items"]
+
+
+def wait_for_threads(before):
+    deadline = time.monotonic() + TIMEOUT
+    while set(threading.enumerate()) - before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return set(threading.enumerate()) - before
+
+
+def test_stage_error_reaches_the_caller():
+    def parse(n):
+        if n == 3:
+            raise ValueError("bad message 3")
+        return n
+
+    with pytest.raises(ValueError, match="bad message 3"):
+        collect(Pipeline(range(10)).stage(parse).stage(lambda n: n, workers=2))
+
+
+def test_source_error_reaches_the_caller():
+    def source():
+        yield 1
+        raise ConnectionError("Gmail went away")
+
+    with pytest.raises(ConnectionError):
+        collect(Pipeline(source()).stage(lambda n: n))
+
+
+def test_threads_exit_when_the_consumer_stops_early():
+    before = set(threading.enumerate())
+    items  = iter(Pipeline(itertools.count(), queue_size=2).stage(lambda n: n * 2, workers=3))
+
+    first  = [next(items) for _ in range(5)]  # order across workers may vary
+    assert all(n % 2 == 0 for n in first)
+    items.close()
+
+    assert wait_for_threads(before) == set()
+
+
+@pytest.mark.parametrize("workers", [(1, 1), (4, 3), (8, 1), (1, 8)])
+def test_multi_worker_stages_deliver_every_item_once(workers):
+    first, second = workers
+    pipeline = (
+        Pipeline(range(200), queue_size=3)
+        .stage(lambda n: n if n % 5 else None, workers=first)  # drops every fifth item
+        .stage(lambda n: n * 10, workers=second)
+    )
+
+    assert sorted(collect(pipeline)) == [n * 10 for n in range(200) if n % 5]
+
+
+def test_more_workers_than_items():
+    assert sorted(collect(Pipeline([1, 2]).stage(lambda n: n, workers=8))) == [1, 2]
+    assert collect(Pipeline([]).stage(lambda n: n, workers=4)) == []
@@ -0,0 +1,156 @@
+"""load_and_store.sync_once() against fakes.FakeGmailService: what an initial load
+and incremental syncs leave in the vector store, the sync store and the
+metadata index."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import api
+import load_and_store
+import metadata_index
+import vector_store
+from email_fetcher import GmailFetcher
+from fakes import FakeGmailService, make_message
+from sync_store import SyncStore
+
+NOW  = datetime.now().astimezone().replace(microsecond=0)
+SHOP = "ShopCo <orders@shop.example.com>"
+RECEIPT = (
+    "Good news! Your order #{order} is on its way and should arrive in 3 days. "
+    "Track your package at https://shop.example.com/track/{order} any time. "
+    "ShopCo Inc. You are receiving this email because you placed an order with us."
+)
+
+
+def receipt(msg_id, order, days_ago):
+    """Templated receipts from one sender: near-duplicates of each other."""
+    return make_message(msg_id, f"Your order #{order} has shipped", SHOP,
+                        NOW - timedelta(days=days_ago), text=RECEIPT.format(order=order))
+
+
+def note(msg_id, days_ago):
+    """A one-off email from its own sender, never collapsed."""
+    return make_message(msg_id, f"Notes about {msg_id}", f"{msg_id} <{msg_id}@example.com>",
+                        NOW - timedelta(days=days_ago), text=f"Meeting notes for {msg_id}, see you soon.")
+
+
+@pytest.fixture
+def gmail(workdir, monkeypatch):
+    """A mailbox of three notes; sync_once() fetches from it."""
+    service = FakeGmailService([note("n1", 3), note("n2", 2), note("n3", 1)])
+    monkeypatch.setattr(load_and_store, "GmailFetcher",
+                        lambda cache=None: GmailFetcher(service=service, cache=cache))
+    return service
+
+
+def stored_ids():
+    metadatas = vector_store.open_collection(None).get(include=["metadatas"])["metadatas"]
+    return {m["id"] for m in metadatas}
+
+
+def processed_ids():
+    state = SyncStore()
+    try:
+        return set(state.processed_ids)
+    finally:
+        state.close()
+
+
+def indexed_ids():
+    return {row["id"] for row in metadata_index.get_index().latest(limit=100)}
+
+
+def canonical_metadata(msg_id):
+    found = vector_store.open_collection(None).get(where={"id": msg_id}, include=["metadatas"])
+    return found["metadatas"][0]
+
+
+def test_near_duplicate_only_sync_marks_data_changed(gmail):
+    gmail.add_message(receipt("r1", 10001, 4))
+    assert load_and_store.sync_once()
+    version = vector_store.data_version()
+
+    gmail.add_message(receipt("r2", 10002, 0))
+    assert load_and_store.sync_once()
+
+    assert vector_store.data_version() == version + 1
+    assert "r2" in indexed_ids() and "r2" in processed_ids()
+    assert "r2" not in stored_ids()  # stored as an occurrence of r1, no chunks of its own
+    assert canonical_metadata("r1")["occurrence_count"] == 2
+
+
+def test_initial_load(gmail):
+    assert load_and_store.sync_once()
+
+    assert stored_ids() == processed_ids() == indexed_ids() == {"n1", "n2", "n3"}
+    assert metadata_index.get_index().is_complete()
+
+
+def test_partial_metadata_index_is_rebuilt_before_it_answers(gmail):
+    load_and_store.sync_once()
+    index = metadata_index.get_index()
+    index.clear()  # e.g. metadata.db created after the mail was stored
+    index.upsert([metadata_index.email_row(canonical_metadata("n1"))])
+
+    assert api.structured_answer("how many emails did I get", "general", 5) is None
+    version = vector_store.data_version()
+
+    assert load_and_store.sync_once()  # nothing new in Gmail, but the index changed
+    assert vector_store.data_version() == version + 1
+    assert indexed_ids() == {"n1", "n2", "n3"}
+    assert api.structured_answer("how many emails did I get", "general", 5)["answer"] == \
+        "You received 3 emails in total."
+
+
+def test_incremental_add_delete_and_trash(gmail):
+    load_and_store.sync_once()
+
+    gmail.add_message(note("n4", 0))
+    gmail.delete_message("n1")
+    gmail.modify_labels("n2", add=["TRASH"])
+    assert load_and_store.sync_once()
+
+    assert stored_ids() == processed_ids() == indexed_ids() == {"n3", "n4"}
+
+
+def test_untrashed_message_is_added_back(gmail):
+    load_and_store.sync_once()
+    gmail.modify_labels("n2", add=["TRASH"])
+    load_and_store.sync_once()
+    assert "n2" not in stored_ids()
+
+    gmail.modify_labels("n2", remove=["TRASH"])
+    assert load_and_store.sync_once()
+
+    assert stored_ids() == processed_ids() == indexed_ids() == {"n1", "n2", "n3"}
+
+
+def test_expired_history_drops_mail_deleted_in_the_gap(gmail):
+    load_and_store.sync_once()
+
+    gmail.delete_message("n1")
+    gmail.add_message(note("n4", 0))
+    gmail.expire_history()
+    assert load_and_store.sync_once()
+
+    assert stored_ids() == processed_ids() == indexed_ids() == {"n2", "n3", "n4"}
+
+
+def test_deleted_canonical_is_replaced_by_a_near_duplicate(gmail):
+    for msg_id, order, days_ago in (("r1", 10001, 3), ("r2", 10002, 2), ("r3", 10003, 1)):
+        gmail.add_message(receipt(msg_id, order, days_ago))
+    load_and_store.sync_once()
+    canonicals = stored_ids() - {"n1", "n2", "n3"}
+    assert len(canonicals) == 1
+    (canonical,) = canonicals
+    assert canonical_metadata(canonical)["occurrence_count"] == 3
+
+    gmail.delete_message(canonical)
+    assert load_and_store.sync_once()
+
+    survivors = {"r1", "r2", "r3"} - {canonical}
+    assert processed_ids() == indexed_ids() == {"n1", "n2", "n3"} | survivors
+    (new_canonical,) = stored_ids() - {"n1", "n2", "n3"}
+    assert new_canonical in survivors
+    assert canonical_metadata(new_canonical)["occurrence_count"] == 2
@@ -0,0 +1,92 @@
+"""SyncStore: import of the legacy JSON files, the failed → retry queue →
+recovered cycle, commit_batch atomicity and the processed_ids mirror."""
+
+import json
+import threading
+
+import pytest
+
+from sync_store import FAILED, FETCHED, STORED, SyncStore
+
+CHUNKS = [{"text": "Subject: Hi\n\nHello", "metadata": {"id": "b", "chunk": 0}}]
+
+
+@pytest.fixture
+def store(workdir):
+    state = SyncStore()
+    yield state
+    state.close()
+
+
+def reopen(state):
+    state.close()
+    return SyncStore()
+
+
+def test_legacy_files_are_imported_once(workdir):
+    (workdir / "processed_ids.json").write_text(json.dumps(["a", "b"]))
+    (workdir / "sync_state.json").write_text(json.dumps({"last_sync_date": "2026/10/01", "history_id": 1234}))
+    (workdir / "retry_queue.jsonl").write_text(json.dumps({"id": "c", "chunks": CHUNKS}) + "\nnot json\n")
+
+    state = SyncStore()
+    assert state.processed_ids == {"a", "b"}
+    assert state.get_state("last_sync_date") == "2026/10/01"
+    assert state.get_state("history_id") == "1234"
+    assert [(r["id"], r["chunks"]) for r in state.retry_records()] == [("c", CHUNKS)]
+
+    state.remove(["a"])
+    state = reopen(state)  # the JSON files are still there, but the store is not empty
+    assert state.processed_ids == {"b"}
+    state.close()
+
+
+def test_failed_email_is_queued_then_recovered(store):
+    store.mark(["a", "b"], FETCHED)
+    store.commit_batch(["a"], [{"id": "b", "chunks": CHUNKS}])
+
+    assert store.processed_ids == {"a"}
+    assert store.status_counts() == {STORED: 1, FAILED: 1}
+    assert [(r["id"], r["attempts"]) for r in store.retry_records()] == [("b", 1)]
+
+    store.commit_batch([], [{"id": "b", "chunks": CHUNKS}])  # fails again on the next run
+    assert [(r["id"], r["attempts"]) for r in store.retry_records()] == [("b", 2)]
+
+    store.commit_batch(["b"], [])
+    assert store.processed_ids == {"a", "b"}
+    assert store.retry_count() == 0
+    assert store.status_counts() == {STORED: 2}
+
+    store = reopen(store)
+    assert store.processed_ids == {"a", "b"}
+    store.close()
+
+
+def test_commit_batch_is_all_or_nothing(store):
+    fingerprint = {"id": "a", "canonical_id": "a", "sender": "x@example.com", "simhash": 1,
+                   "subject": "Hi", "date": "", "timestamp": 0}
+    unserializable = [{"id": "b", "chunks": [{"text": "Hello", "metadata": object()}]}]
+
+    with pytest.raises(TypeError):
+        store.commit_batch(["a"], unserializable, fingerprints=[fingerprint])
+
+    assert store.processed_ids == set()
+    assert store.status_counts() == {}
+    assert store.fingerprint_rows() == []
+    assert store.retry_count() == 0
+
+
+def test_processed_ids_mirror_matches_rows_after_concurrent_writes(store):
+    def worker(n):
+        for i in range(50):
+            ids = [f"{n}-{i}-{j}" for j in range(4)]
+            store.mark(ids, FETCHED)
+            store.commit_batch(ids[:3], [{"id": ids[3], "chunks": CHUNKS}])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store.processed_ids) == 4 * 50 * 3
+    assert reopen(store).processed_ids == store.processed_ids
@@ -0,0 +1,398 @@
+"""
+vector_store.py
+
+Which Chroma collection is live, and how to open it.
+
+./chroma_db can hold several collections: the active one that api.py serves
+and load_and_store.py syncs into, plus one being built by reindex.py. The
+active collection and the embedding model its vectors came from are recorded
+in ACTIVE_FILE:
+
+  {"collection": "...", "embed_model": "...", "provider": "cohere",
+   "generation": 3, "switched_at": "...", "partitioned": true,
+   "building": {...} or null}
+
+A partitioned collection is stored as one Chroma collection per month
+("<collection>-m202610") behind PartitionedStore, so searches for recent
+mail only scan recent months. Collections from before partitioning stay a
+single Chroma collection until the next reindex.py run rebuilds them
+partitioned.
+
+The file is replaced atomically (write + os.replace), so a reader always
+sees either the old or the new collection. generation increases on every
+switch. Without the file, the collection langchain-chroma creates by default
+("langchain") with embed-english-v3.0 is active.
+
+Writers (load_and_store.py, the reindex catch-up and switch) hold
+sync_lock() so a sync can't write into a collection that is being retired.
+A sync that changed the index bumps the counter in DATA_VERSION_FILE, so
+api.py's caches know their answers are stale.
+"""
+
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from dotenv import load_dotenv
+
+# chromadb, langchain_chroma and the embeddings clients are imported where they
+# are used: together they take seconds to import, and api.py answers /health
+# before it needs them (see api.warm_up).
+
+load_dotenv()
+
+CHROMA_DIR          = "./chroma_db"
+ACTIVE_FILE         = os.path.join(CHROMA_DIR, "active_collection.json")
+SYNC_LOCK_FILE      = os.path.join(CHROMA_DIR, "sync.lock")
+DATA_VERSION_FILE   = os.path.join(CHROMA_DIR, "data_version")
+DEFAULT_COLLECTION  = "langchain"
+DEFAULT_EMBED_MODEL = "embed-english-v3.0"
+EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "cohere")  # "cohere" or "fake"
+COHERE_API_KEY      = os.getenv("COHERE_API_KEY")
+UNDATED_PARTITION   = "000000"  # partition key of mail without a usable date
+PARTITION_SEARCH_WORKERS = 8    # monthly partitions searched at once
+
+_PARTITION   = re.compile(r"^(.+)-m(\d{6})$")
+_search_pool = ThreadPoolExecutor(max_workers=PARTITION_SEARCH_WORKERS, thread_name_prefix="partition")
+
+
+# ── Active collection pointer ──────────────────────────────────────────────────
+
+def read_active():
+    try:
+        with open(ACTIVE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {
+            "collection":  DEFAULT_COLLECTION,
+            "embed_model": DEFAULT_EMBED_MODEL,
+            "provider":    EMBEDDINGS_PROVIDER,
+            "generation":  0,
+            "switched_at": None,
+            "partitioned": False,  # see ensure_active()
+            "building":    None,
+        }
+
+
+def _write_active(pointer):
+    os.makedirs(CHROMA_DIR, exist_ok=True)
+    tmp = f"{ACTIVE_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(pointer, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ACTIVE_FILE)
+
+
+def set_building(building):
+    """Record (or clear, with None) the collection reindex.py is building, so a
+    crashed reindex can resume it and gc_collections() leaves it alone."""
+    pointer = read_active()
+    pointer["building"] = building
+    _write_active(pointer)
+
+
+def switch_active(collection, embed_model, provider, partitioned=True):
+    """Atomically make `collection` the live one. Returns the new pointer."""
+    pointer = read_active()
+    pointer.update(
+        collection=collection,
+        embed_model=embed_model,
+        provider=provider,
+        generation=pointer.get("generation", 0) + 1,
+        switched_at=datetime.now().isoformat(timespec="seconds"),
+        partitioned=partitioned,
+        building=None,
+    )
+    _write_active(pointer)
+    return pointer
+
+
+def ensure_active():
+    """Write ACTIVE_FILE if there is none yet (first sync). A new store is
+    partitioned; a non-empty "langchain" collection from before the file existed
+    is kept as the single collection it is."""
+    if os.path.exists(ACTIVE_FILE):
+        return read_active()
+    import chromadb
+
+    client   = chromadb.PersistentClient(path=CHROMA_DIR)
+    existing = {c.name: c for c in client.list_collections()}
+    pointer  = read_active()
+    pointer["partitioned"] = not (DEFAULT_COLLECTION in existing and existing[DEFAULT_COLLECTION].count())
+    _write_active(pointer)
+    return pointer
+
+
+def active_mtime():
+    """Cheap change check for long-running readers (api.py)."""
+    try:
+        return os.stat(ACTIVE_FILE).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def data_version():
+    """Counter bumped by every sync that added, removed or relabelled mail."""
+    try:
+        with open(DATA_VERSION_FILE) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def mark_data_changed():
+    """Bump data_version(). Call while holding sync_lock()."""
+    os.makedirs(CHROMA_DIR, exist_ok=True)
+    tmp = f"{DATA_VERSION_FILE}.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(data_version() + 1))
+    os.replace(tmp, DATA_VERSION_FILE)
+
+
+# ── Opening ────────────────────────────────────────────────────────────────────
+
+def get_embeddings(model=None, provider=None, max_retries=1):
+    """Embeddings client for `model` (default: the active collection's model).
+    max_retries=1 leaves retries to the caller's rate limiter."""
+    active   = read_active()
+    provider = provider or active.get("provider") or EMBEDDINGS_PROVIDER
+    if provider == "fake" or EMBEDDINGS_PROVIDER == "fake":
+        from fakes import FakeEmbeddings
+        return FakeEmbeddings(latency=float(os.getenv("FAKE_EMBED_LATENCY", "0")))
+    from langchain_cohere import CohereEmbeddings
+    return CohereEmbeddings(
+        model=model or active["embed_model"],
+        cohere_api_key=COHERE_API_KEY,
+        max_retries=max_retries,
+    )
+
+
+def open_collection(embeddings, collection=None, partitioned=None):
+    """PartitionedStore for `collection` (default: the active one). Whether it is
+    partitioned comes from ACTIVE_FILE unless given."""
+    pointer = read_active()
+    name    = collection or pointer["collection"]
+    if partitioned is None:
+        building    = pointer.get("building") or {}
+        partitioned = (pointer.get("partitioned", False) if name == pointer["collection"]
+                       else building.get("partitioned", False) if name == building.get("collection")
+                       else True)
+    return PartitionedStore(embeddings, name, partitioned)
+
+
+def gc_collections(client, keep=()):
+    """Drop collections that are neither active, being built, nor in keep, with
+    all their partitions. Only collections this app creates (the default and
+    reindex's emails_*) are touched. Returns the collection names dropped."""
+    pointer = read_active()
+    keep    = set(keep) | {pointer["collection"]}
+    if pointer.get("building"):
+        keep.add(pointer["building"]["collection"])
+    dropped = set()
+    for collection in client.list_collections():
+        match = _PARTITION.match(collection.name)
+        name  = match.group(1) if match else collection.name
+        if name in keep or not (name == DEFAULT_COLLECTION or name.startswith("emails_")):
+            continue
+        client.delete_collection(collection.name)
+        dropped.add(name)
+    return sorted(dropped)
+
+
+# ── Partitioned store ──────────────────────────────────────────────────────────
+
+def partition_key(timestamp):
+    """"YYYYMM" (UTC) of the month a timestamp falls in."""
+    if not timestamp or timestamp <= 0:
+        return UNDATED_PARTITION
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m")
+
+
+def partition_timestamp(metadata):
+    # A collapsed near-duplicate is filed under its most recent occurrence, so every
+    # chunk a since_filter() matches lives in the month of `since` or later
+    return max(metadata.get("timestamp") or 0, metadata.get("latest_timestamp") or 0)
+
+
+def since_filter(since):
+    """Chroma where clause: mail received (or last received again) at or after since."""
+    return {"$or": [
+        {"timestamp": {"$gte": since}},
+        {"latest_timestamp": {"$gte": since}},
+    ]}
+
+
+class PartitionedStore:
+    """One logical collection of email chunks, with the Chroma collection calls the
+    app uses (get / upsert / update / delete / count) plus vector search.
+
+    Partitioned, it is one Chroma collection per month of partition_timestamp().
+    Writes go to their month's collection, created on first use; update() moves
+    chunks whose month changed. A search with `since` scans only the months from
+    since's on — only the first of them needs the date filter — and a search
+    without fans out over every month in parallel; hits are merged by distance.
+    Unpartitioned, every call goes to the single Chroma collection `name`.
+    """
+
+    def __init__(self, embeddings, name, partitioned=True, client=None):
+        import chromadb
+
+        self.name        = name
+        self.embeddings  = embeddings
+        self.partitioned = partitioned
+        self._client     = client or chromadb.PersistentClient(path=CHROMA_DIR)
+        self._parts      = {}  # partition key ("" when unpartitioned) -> langchain Chroma
+        self._lock       = threading.Lock()
+        self.refresh()
+
+    @property
+    def max_batch_size(self):
+        return self._client.max_batch_size
+
+    def _open(self, key):
+        from langchain_chroma import Chroma
+
+        collection_name = f"{self.name}-m{key}" if self.partitioned else self.name
+        return Chroma(collection_name=collection_name, client=self._client, embedding_function=self.embeddings)
+
+    def refresh(self):
+        """Pick up months another process (a sync) has added."""
+        if not self.partitioned:
+            keys = [""]
+        else:
+            keys = [
+                m.group(2) for m in map(_PARTITION.match, (c.name for c in self._client.list_collections()))
+                if m and m.group(1) == self.name
+            ]
+        with self._lock:
+            self._parts = {key: self._parts.get(key) or self._open(key) for key in keys}
+
+    def partitions(self, since=None):
+        """[(key, Chroma)], newest month first; with since, only months from since's on."""
+        with self._lock:
+            parts = sorted(self._parts.items(), key=lambda p: p[0], reverse=True)
+        if since and self.partitioned:
+            first = partition_key(since)
+            parts = [(key, part) for key, part in parts if key >= first]
+        return parts
+
+    def _key(self, metadata):
+        return partition_key(partition_timestamp(metadata)) if self.partitioned else ""
+
+    def _partition(self, key):
+        with self._lock:
+            if key not in self._parts:
+                self._parts[key] = self._open(key)
+            return self._parts[key]
+
+    # ── Collection calls ───────────────────────────────────────────────────────
+
+    def count(self):
+        return sum(part._collection.count() for _, part in self.partitions())
+
+    def get(self, ids=None, where=None, include=("metadatas", "documents"), limit=None, offset=None):
+        """Like Collection.get over every partition, newest month first. limit / offset
+        page through the whole store (don't combine them with ids / where)."""
+        include = list(include)
+        found   = {"ids": [], **{field: [] for field in include}}
+        skip, left = offset or 0, limit
+        for _, part in self.partitions():
+            if left is not None and left <= 0:
+                break
+            if skip:
+                size = part._collection.count()
+                if skip >= size:
+                    skip -= size
+                    continue
+            page = part._collection.get(ids=ids, where=where, include=include, limit=left, offset=skip or None)
+            skip = 0
+            for field in found:
+                found[field] += page[field]
+            if left is not None:
+                left -= len(page["ids"])
+        return found
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        groups = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(self._key(metadata), []).append(i)
+        for key, rows in groups.items():
+            self._partition(key)._collection.upsert(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+                documents=[documents[i] for i in rows],
+            )
+
+    def update(self, ids, metadatas):
+        """Replace the metadata of existing chunks, moving any whose month changed."""
+        wanted = dict(zip(ids, metadatas))
+        for key, part in self.partitions():
+            present = part._collection.get(ids=list(wanted), include=[])["ids"]
+            stay    = [i for i in present if self._key(wanted[i]) == key]
+            move    = [i for i in present if self._key(wanted[i]) != key]
+            if stay:
+                part._collection.update(ids=stay, metadatas=[wanted[i] for i in stay])
+            if move:
+                moved = part._collection.get(ids=move, include=["embeddings", "documents"])
+                self.upsert(moved["ids"], moved["embeddings"], [wanted[i] for i in moved["ids"]], moved["documents"])
+                part._collection.delete(ids=moved["ids"])
+
+    def delete(self, ids=None, where=None):
+        for _, part in self.partitions():
+            part._collection.delete(ids=ids, where=where)
+
+    # ── Search ─────────────────────────────────────────────────────────────────
+
+    def similarity_search_by_vector(self, embedding, k=4, since=None):
+        """Top k chunks nearest to embedding; with since, only mail matching since_filter(since)."""
+        parts = self.partitions(since)
+        if not parts:
+            return []
+        first = parts[-1][0]
+
+        def search(item):
+            key, part = item
+            # Months after since's hold nothing older than since
+            where = since_filter(since) if since and (key == first or not self.partitioned) else None
+            return part.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=where)
+
+        hits = [search(parts[0])] if len(parts) == 1 else list(_search_pool.map(search, parts))
+        hits = sorted((hit for part_hits in hits for hit in part_hits), key=lambda hit: hit[1])
+        return [doc for doc, _ in hits[:k]]
+
+    def similarity_search(self, query, k=4, since=None):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k, since=since)
+
+
+# ── Writer lock ────────────────────────────────────────────────────────────────
+
+@contextmanager
+def sync_lock():
+    """Inter-process lock held while writing to the active collection."""
+    os.makedirs(CHROMA_DIR, exist_ok=True)
+    with open(SYNC_LOCK_FILE, "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)